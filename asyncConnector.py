@@ -0,0 +1,568 @@
+import asyncio
+import time
+import aiohttp
+import pandas as pd
+from datetime import datetime, timedelta
+from slack_sdk.web.async_client import AsyncWebClient
+from slack_sdk.errors import SlackApiError
+import connector
+import historyWindows
+import rateLimiter
+
+
+class AsyncSlackManager(connector.SlackManager):
+    def __init__(self, user_cache, max_retries=5, timeout=60, retry_interval=20, rate_limiter=None, max_in_flight=16,
+                 response_store=None, base_url=None, metrics_registry=None, watchdog=None, history_shards=1, connection_pool_size=0,
+                 stats_store=None):
+        """
+        AsyncSlackManagerクラスの初期化メソッド。
+        SlackManagerの非同期版で、AsyncWebClientを使い1つのイベントループ上で複数のリクエストを同時に処理する。
+        メッセージの整形やリアクションの展開はSlackManagerの処理をそのまま使う。
+        メールアドレスはresolve_user_emailsで事前にキャッシュへ登録し、get_user_emailはキャッシュのみを参照する。
+
+        :param user_cache: UserCacheインスタンス
+        :param max_retries: 最大リトライ回数
+        :param timeout: タイムアウト時間（秒）
+        :param retry_interval: リトライ間隔（秒）
+        :param rate_limiter: 1つ目のトークンのRateLimiterインスタンス（省略時は既定のティア設定で作成）
+        :param max_in_flight: 同時に送信するリクエストの最大数
+        :param response_store: ResponseStoreインスタンス（オプション）。指定した場合、APIのレスポンスを記録または再生する
+        :param base_url: Slack Web APIのベースURL（オプション）
+        :param metrics_registry: Metricsインスタンス（省略時は新規に作成）
+        :param watchdog: RequestWatchdogインスタンス（省略時は新規に作成）
+        :param history_shards: チャネルの履歴を時間範囲に分割して同時に取得する数（1の場合はカーソルで順に取得する）
+        :param connection_pool_size: keep-alive接続を再利用するaiohttpのセッションの最大接続数（0の場合はリクエストごとにセッションを作成する）
+        :param stats_store: StatsStoreインスタンス（オプション）。指定した場合、取得したメッセージとリアクションを集計する
+        """
+        super().__init__(user_cache, max_retries=max_retries, timeout=timeout, retry_interval=retry_interval,
+                         rate_limiter=rate_limiter, response_store=response_store, base_url=base_url,
+                         metrics_registry=metrics_registry, watchdog=watchdog, history_shards=history_shards,
+                         stats_store=stats_store)
+        self.max_in_flight = max_in_flight
+        self.connection_pool_size = connection_pool_size
+        self._in_flight = None  # イベントループ上で作成するためretry_requestの初回呼び出し時に初期化
+        self._session = None  # 全てのクライアントで共有するaiohttpのセッション（retry_requestの初回呼び出し時に作成）
+        self._email_lookups = {}  # メンバーID -> 問い合わせ中のTask
+
+    def create_client(self, token):
+        """
+        トークンを設定した非同期のAPIクライアントを作成する。
+
+        :param token: Slackのトークン
+        :return: AsyncWebClientインスタンス
+        """
+        client_options = {'base_url': self.base_url} if self.base_url else {}
+        return AsyncWebClient(token=token, timeout=self.timeout, **client_options)
+
+    def open_session(self):
+        """
+        keep-alive接続を再利用するaiohttpのセッションを作成し、全てのトークンのクライアントに設定する。
+        応答の期限はretry_requestのwait_forで試行ごとに打ち切るため、セッションには最後の試行の期限を設定する。
+        aiohttpはgzipで圧縮された応答を受け取り、展開する。イベントループ上で呼び出す。
+        """
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.connection_pool_size),
+            timeout=aiohttp.ClientTimeout(total=self.timeout * self.max_retries)
+        )
+        for slot in self.token_pool.slots:
+            slot.client.session = self._session
+        for client in self._attempt_clients.values():
+            client.session = self._session
+
+    async def close(self):
+        """
+        aiohttpのセッションを閉じ、リクエストの監視スレッドを停止する。
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self.watchdog.stop()
+
+    async def retry_request(self, func, tier, *args, **kwargs):
+        """
+        SlackManager.retry_requestの非同期版。
+        ティアの呼び出し枠を待ってからリクエストを送信し、レート制限に達した場合はRetry-Afterの秒数だけティア全体を停止する。
+
+        :param func: 実行するAsyncWebClientのメソッド
+        :param tier: レート制御のティア名（RateLimiter.DEFAULT_TIERSのキー）
+        :param args: 関数に渡す引数
+        :param kwargs: 関数に渡すキーワード引数
+        :return: 関数の実行結果
+        """
+        # 再生モードの場合は記録済みのレスポンスを返し、APIへのリクエストは行わない
+        if self.response_store is not None and self.response_store.replay:
+            return self.replay_response(func, kwargs)
+
+        if self._in_flight is None:
+            self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        if self.connection_pool_size and self._session is None:
+            self.open_session()
+        error_messages = []  # エラーメッセージをストックするリスト
+
+        method = func.__name__
+        # 試行回数はエラーによる再試行のみで数え、レート制限による待機と失効したトークンからの切り替えは別に数える
+        # （切り替えは使えるトークンが無くなるまで、待機はMAX_RATE_LIMIT_WAITS回まで行う）
+        attempt = 1
+        rate_limit_waits = 0
+        while attempt <= self.max_retries:
+            slot = self.token_pool.select(tier)
+            if slot is None:
+                error_messages.append(f"No usable token for {func.__name__}.")
+                break
+            self.metrics.record_wait(method, await slot.rate_limiter.acquire_async(tier), 'ratelimit')
+            started_at = time.perf_counter()
+            try:
+                async with self._in_flight:
+                    # 同時リクエスト数の枠を待つ時間は応答時間に含めない
+                    started_at = time.perf_counter()
+                    # 期限はwait_forで打ち切るため、監視スレッドには応答待ちの表示のみを任せる
+                    with self.watchdog.watch(method):
+                        result = await asyncio.wait_for(self.bind_client(func, slot, attempt)(*args, **kwargs),
+                                                        timeout=self.timeout * attempt)
+                self.metrics.record_request(method, time.perf_counter() - started_at, response=result)
+                if self.response_store is not None:
+                    self.response_store.put(func.__name__, kwargs, result)
+                return result
+
+            except SlackApiError as e:
+                self.metrics.record_request(method, time.perf_counter() - started_at, error=e.response['error'])
+                error_messages.append(f"Error in {func.__name__}: {e.response['error']}")
+
+                # レート制限に達した場合はRetry-Afterの秒数だけトークンのティアを停止し、すぐに再試行する（他のトークンが選ばれる）
+                if 'ratelimited' in e.response['error']:
+                    retry_after = rateLimiter.RateLimiter.parse_retry_after(e.response.headers)
+                    slot.rate_limiter.penalize(tier, retry_after)
+                    self.logger.view_up_waiting_timer()  # レート制限により待機する場合のログ表示
+                    rate_limit_waits += 1
+                    if rate_limit_waits > connector.MAX_RATE_LIMIT_WAITS:
+                        break
+                    continue
+
+                # トークンが失効した場合は以降そのトークンを使わず、すぐに他のトークンで再試行する
+                if self.token_pool.is_revoked_error(e.response['error']):
+                    self.revoke_token(slot, e.response['error'])
+                    continue
+
+            except Exception as e:
+                self.metrics.record_request(method, time.perf_counter() - started_at, error=e)
+                error_messages.append(f"Unexpected error in {func.__name__}: {e!r}")
+
+            # リトライの進行状況を表示
+            self.logger.view_api_retry()
+            if attempt == self.max_retries:
+                break
+            await asyncio.sleep(self.retry_interval)
+            self.metrics.record_wait(method, self.retry_interval, 'retry')
+            attempt += 1
+            self.metrics.record_retry(method)
+
+        # リトライが全て失敗した場合、エラーメッセージをまとめて表示
+        self.metrics.record_failure(method)
+        self.logger.view_log(f"Failed to execute {func.__name__} after {attempt} attempts.")
+        for error_message in error_messages:
+            self.logger.view_log(error_message)
+
+        return None
+
+    def get_user_email(self, member_id):
+        """
+        キャッシュからメールアドレスを返す。非同期版ではAPIへの問い合わせはresolve_user_emailsで事前に行う。
+
+        :param member_id: SlackのメンバーID
+        :return: メールアドレス、または "this account seems to be a bot"
+        """
+        return self.user_cache.get(member_id) or "this account seems to be a bot"
+
+    async def fetch_user_email(self, member_id):
+        """
+        指定されたメンバーIDのメールアドレスをキャッシュまたはAPIから取得する。
+        同じユーザーへの問い合わせが同時に発生した場合は1回のリクエストにまとめる。
+
+        :param member_id: SlackのメンバーID
+        :return: メールアドレス、または "this account seems to be a bot"
+        """
+        cached_email = self.user_cache.get(member_id)
+        if cached_email:
+            return cached_email
+
+        if member_id not in self._email_lookups:
+            self._email_lookups[member_id] = asyncio.ensure_future(self._lookup_user_email(member_id))
+        try:
+            return await self._email_lookups[member_id]
+        finally:
+            self._email_lookups.pop(member_id, None)
+
+    async def _lookup_user_email(self, member_id):
+        self.logger.view_email_api_access()  # メールアドレス問い合わせのためのAPIアクセスを表示
+        response = await self.retry_request(func=self.client.users_info, tier='users_info', user=member_id)
+        # 取得に失敗した場合も "this account seems to be a bot" として保存
+        email = self.extract_email(response['user']) if response else "this account seems to be a bot"
+        self.user_cache.add_user(member_id, email)
+        return email
+
+    async def resolve_user_emails(self, member_ids):
+        """
+        複数のメンバーIDのメールアドレスを並行して取得し、キャッシュに登録する。
+
+        :param member_ids: メンバーIDのイテラブル
+        :return: メンバーID -> メールアドレス の辞書
+        """
+        member_ids = [member_id for member_id in dict.fromkeys(member_ids) if member_id]
+        with self.metrics.stage('email_resolution'):
+            emails = await asyncio.gather(*(self.fetch_user_email(member_id) for member_id in member_ids))
+        return dict(zip(member_ids, emails))
+
+    async def prefetch_user_directory(self):
+        """
+        SlackManager.prefetch_user_directoryの非同期版。
+
+        :return: キャッシュに登録したユーザー数
+        """
+        self.logger.view_log("Prefetching user directory via users.list...")
+        total = 0
+        cursor = None
+
+        while True:
+            self.logger.view_email_api_access()
+            response = await self.retry_request(func=self.client.users_list, tier='users_list', cursor=cursor, limit=1000)
+            if response is None:
+                break
+
+            users = [(user['id'], self.extract_email(user)) for user in response['members']]
+            total += self.user_cache.add_users(users)
+
+            # 次のページがあるかを確認
+            cursor = response.get('response_metadata', {}).get('next_cursor', None)
+            if not cursor:
+                break
+
+        self.logger.view_log(f"Prefetched {total} users from user directory.")
+        return total
+
+    async def get_all_members(self, channel_id):
+        """
+        SlackManager.get_all_membersの非同期版。
+
+        :param channel_id: チャンネルID
+        :return: メンバーIDのリスト
+        """
+        members = []
+        cursor = None  # ページング用のカーソル
+
+        while True:
+            response = await self.retry_request(func=self.client.conversations_members, tier='members', channel=channel_id, cursor=cursor, limit=1000)
+            if response is None:
+                self.logger.view_log(f"Error fetching members for channel {channel_id}")
+                break
+            members.extend(response['members'])  # メンバーIDをリストに追加
+
+            # 次のページがあるかを確認
+            cursor = response.get('response_metadata', {}).get('next_cursor', None)
+            if not cursor:  # 次のページがなければ終了
+                break
+
+        return members
+
+    async def get_all_user_info(self, channel_id: str):
+        """
+        SlackManager.get_all_user_infoの非同期版。メンバーのメールアドレスは並行して取得する。
+
+        :param channel_id: チャンネルID
+        :return: DataFrame（列: channel_id, export_date, member_id, email）
+        """
+        self.logger.view_log(f"Fetching user list for channel: {channel_id}")
+        members = await self.get_all_members(channel_id)
+        self.logger.view_log(f"Total members to process: {len(members)}")
+
+        export_date = datetime.now().strftime('%Y-%m-%d')
+        emails = await self.resolve_user_emails(members)
+        data = [
+            {'channel_id': channel_id, 'export_date': export_date, 'member_id': member_id, 'email': emails.get(member_id)}
+            for member_id in members
+        ]
+        return pd.DataFrame(data, columns=['channel_id', 'export_date', 'member_id', 'email'])
+
+    async def fetch_conversations_history(self, channel_id, cursor=None, oldest=None, latest=None, inclusive=None):
+        """
+        SlackManager.fetch_conversations_historyの非同期版。
+
+        :param channel_id: チャンネルID
+        :param cursor: ページング用のカーソル
+        :param oldest: このタイムスタンプより新しいメッセージのみ取得する（オプション）
+        :param latest: このタイムスタンプより古いメッセージのみ取得する（オプション）
+        :param inclusive: Trueの場合、oldestとlatestのタイムスタンプのメッセージも含める（オプション）
+        :return: APIレスポンスデータ
+        """
+        return await self.retry_request(func=self.client.conversations_history, tier='history', channel=channel_id, cursor=cursor, oldest=oldest,
+                                        latest=latest, inclusive=inclusive, limit=1000)
+
+    async def fetch_history_window(self, channel_id, window):
+        """
+        SlackManager.fetch_history_windowの非同期版。
+
+        :param channel_id: チャンネルID
+        :param window: HistoryWindowインスタンス
+        :return: APIレスポンスデータ
+        """
+        self.logger.view_message_access()
+        return await self.fetch_conversations_history(channel_id, **window.params())
+
+    def iter_history_page_sources(self, channel_id: str, oldest=None, cursor=None, latest=None):
+        """
+        SlackManager.iter_history_page_sourcesの非同期版。
+
+        :param channel_id: チャンネルID
+        :param oldest: このタイムスタンプより新しいメッセージのみ取得する（オプション）
+        :param cursor: 取得を開始するカーソル（オプション、チェックポイントからの再開用）
+        :param latest: このタイムスタンプより古いメッセージのみ取得する（オプション、チェックポイントからの再開用）
+        :return: iter_history_page_cursorsまたはiter_history_page_windowsの非同期ジェネレーター
+        """
+        if self.history_shards > 1 and (latest is not None or cursor is None):
+            return self.iter_history_page_windows(channel_id, oldest, latest)
+        return self.iter_history_page_cursors(channel_id, oldest, cursor, None if cursor else latest)
+
+    async def iter_history_page_cursors(self, channel_id: str, oldest=None, cursor=None, latest=None):
+        """
+        SlackManager.iter_history_page_cursorsの非同期版（非同期ジェネレーター）。
+
+        :param channel_id: チャンネルID
+        :param oldest: このタイムスタンプより新しいメッセージのみ取得する（オプション）
+        :param cursor: 取得を開始するカーソル（オプション、省略時は最初のページから）
+        :param latest: このタイムスタンプより古いメッセージのみ取得する（オプション）
+        :return: (メッセージのリスト, 次のページのカーソル) を返す非同期ジェネレーター
+        """
+        self.incomplete_channels.discard(channel_id)
+
+        while True:
+            self.logger.view_message_access()
+            response = await self.fetch_conversations_history(channel_id, cursor, oldest, latest)
+            if response is None:
+                # 取得に失敗したページ以降は欠落するため、差分取得の状態を進めないよう記録する
+                self.incomplete_channels.add(channel_id)
+                break
+            # 次のページがあるかを確認
+            cursor = response.get('response_metadata', {}).get('next_cursor', None)
+            yield response['messages'], cursor or None
+            if not cursor:
+                break
+
+    async def iter_history_page_windows(self, channel_id: str, oldest=None, latest=None):
+        """
+        SlackManager.iter_history_page_windowsの非同期版（非同期ジェネレーター）。
+        最大history_shards個の範囲をタスクとして同時に取得する。
+
+        :param channel_id: チャンネルID
+        :param oldest: このタイムスタンプより新しいメッセージのみ取得する（オプション）
+        :param latest: このタイムスタンプより古いメッセージのみ取得する（オプション、チェックポイントからの再開用）
+        :return: (メッセージのリスト, 次のページの有無) を返す非同期ジェネレーター
+        """
+        self.incomplete_channels.discard(channel_id)
+        plan = historyWindows.HistoryWindowPlan(self.history_shards, oldest, latest)
+        tasks = {}
+        previous = None  # 次のページの有無が分かるまで返さずに保持するページ
+
+        try:
+            while not plan.finished:
+                for window in plan.windows_to_start():
+                    tasks[window] = asyncio.ensure_future(self.fetch_history_window(channel_id, window))
+                window = plan.next_window()
+                response = await tasks.pop(window)
+                if response is None:
+                    # 取得に失敗した範囲以降は欠落するため、差分取得の状態を進めないよう記録する
+                    self.incomplete_channels.add(channel_id)
+                    break
+                try:
+                    messages = plan.merge(window, response)
+                except ValueError as e:
+                    self.logger.view_log(f"Error in conversations_history for {channel_id}: {e}")
+                    self.incomplete_channels.add(channel_id)
+                    break
+                if messages:
+                    if previous is not None:
+                        yield previous, True
+                    previous = messages
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+        if previous is not None:
+            yield previous, None if plan.finished else True
+        elif plan.finished:
+            yield [], None
+
+    async def fetch_thread_messages(self, channel_id: str, thread_ts: str):
+        """
+        SlackManager.fetch_thread_messagesの非同期版。
+
+        :param channel_id: チャンネルID
+        :param thread_ts: スレッドタイムスタンプ
+        :return: スレッドメッセージのリスト
+        """
+        thread_messages = []
+        thread_cursor = None
+        self.incomplete_threads.discard((channel_id, thread_ts))
+
+        while True:
+            self.logger.view_thread_access()
+            response = await self.retry_request(func=self.client.conversations_replies, tier='replies', channel=channel_id, ts=thread_ts, cursor=thread_cursor, limit=1000)
+            if response is None:
+                self.incomplete_threads.add((channel_id, thread_ts))
+                break
+            thread_messages.extend(response['messages'])
+
+            # 次のページがあるかを確認
+            thread_cursor = response.get('response_metadata', {}).get('next_cursor', None)
+            if not thread_cursor:
+                break
+
+        return thread_messages
+
+    async def fetch_thread_parent(self, channel_id: str, thread_ts: str):
+        """
+        SlackManager.fetch_thread_parentの非同期版。
+
+        :param channel_id: チャンネルID
+        :param thread_ts: スレッドタイムスタンプ
+        :return: 親メッセージ（取得できなかった場合はNone）
+        """
+        response = await self.retry_request(func=self.client.conversations_replies, tier='replies', channel=channel_id, ts=thread_ts, limit=1)
+        if response is None or not response['messages']:
+            return None
+        return response['messages'][0]
+
+    async def refresh_threads(self, channel_id: str, get_thread_date_length, thread_state, until):
+        """
+        SlackManager.refresh_threadsの非同期版。親メッセージの確認と、変化したスレッドの返信の取得をそれぞれ並行して行う。
+
+        :param channel_id: チャンネルID
+        :param get_thread_date_length: スレッドデータ取得の期間（日数）
+        :param thread_state: thread_ts -> {'reply_count', 'latest_reply'} の辞書（取得したスレッドの状態で更新する）
+        :param until: 今回の履歴の取得範囲の下端のタイムスタンプ（これより古いスレッドを確認する）
+        :return: DataFrame（カラムはSlackManager.get_all_messagesと同じ）
+        """
+        thread_cutoff_ts = (datetime.now() - timedelta(days=get_thread_date_length)).timestamp()
+        candidates = self.refresh_candidates(thread_state, thread_cutoff_ts, until)
+        if not candidates:
+            return pd.DataFrame(columns=connector.MESSAGE_COLUMNS)
+        self.logger.view_log(f"Checking {len(candidates)} threads for new replies in channel '{channel_id}'")
+
+        probed = await asyncio.gather(*(self.fetch_thread_parent(channel_id, thread_ts) for thread_ts in candidates))
+        messages = [message for message in probed if message is not None and self.is_thread_changed(message, thread_state)]
+        parents = list(enumerate(messages))
+        replies = await asyncio.gather(*(self.fetch_thread_rows(channel_id, parent['ts']) for _, parent in parents))
+        thread_columns = {parent['ts']: rows for (_, parent), rows in zip(parents, replies)}
+        await self.resolve_user_emails(message.get('user') for message in messages)
+        page_columns = self.normalize_columns(messages, channel_id)
+        batch = self._assemble_page(page_columns, parents, thread_columns, channel_id, thread_state, set())
+        self.logger.view_log(f"Refreshed {len(messages)} threads in channel '{channel_id}'")
+        await asyncio.to_thread(self.record_stats, channel_id, batch)
+        return batch
+
+    async def fetch_thread_rows(self, channel_id: str, thread_ts: str, checkpoint=None):
+        """
+        SlackManager.fetch_thread_rowsの非同期版。返信のメールアドレスを解決してから整形する。
+
+        :param channel_id: チャンネルID
+        :param thread_ts: スレッドタイムスタンプ
+        :param checkpoint: ExportCheckpointインスタンス（オプション）。指定した場合、全ての返信を取得できたスレッドを保存する
+        :return: 列名 -> 値のリスト の辞書
+        """
+        if checkpoint is not None and checkpoint.has_thread(thread_ts):
+            return checkpoint.load_thread(thread_ts)
+
+        thread_messages = await self.fetch_thread_messages(channel_id, thread_ts)
+        # 親メッセージは履歴のページに含まれるため、整形する前に除く
+        replies = [message for message in thread_messages if message.get('ts') != thread_ts]
+        await self.resolve_user_emails(reply.get('user') for reply in replies)
+        rows = self.normalize_columns(replies, channel_id, thread_ts)
+        if checkpoint is not None and (channel_id, thread_ts) not in self.incomplete_threads:
+            await asyncio.to_thread(checkpoint.save_thread, thread_ts, rows)
+        return rows
+
+    async def iter_message_batches(self, channel_id: str, get_thread_date_length=300, oldest=None, thread_state=None, checkpoint=None):
+        """
+        SlackManager.iter_message_batchesの非同期版（非同期ジェネレーター）。
+        ページ内の全てのスレッドの返信を並行して取得し、メールアドレスをまとめて解決してから整形する。
+
+        :param channel_id: チャンネルID
+        :param get_thread_date_length: スレッドデータ取得の期間（日数）
+        :param oldest: このタイムスタンプより新しいメッセージのみ取得する（オプション、差分取得用）
+        :param thread_state: thread_ts -> {'reply_count', 'latest_reply'} の辞書（オプション、差分取得用）
+        :param checkpoint: ExportCheckpointインスタンス（オプション、中断からの再開用）
+        :return: ページごとのDataFrameを返す非同期ジェネレーター
+        """
+        channel_name = channel_id
+        self.logger.view_log(f"Start fetching messages for channel '{channel_name}'")
+
+        total_messages = 0  # メッセージの総数をカウント
+        thread_cutoff_ts = (datetime.now() - timedelta(days=get_thread_date_length)).timestamp()
+
+        # 履歴に含まれたスレッドの返信の(ts, thread_ts)。後のページでスレッドから同じ返信を取得した場合に除く
+        seen = set()
+
+        # 前回の実行で処理済みのページは出力ファイルに書き込み済みのため、続きのカーソルから取得を再開する
+        cursor = latest = None
+        if checkpoint is not None:
+            if checkpoint.pages:
+                self.logger.view_log(f"Resuming channel '{channel_name}' from checkpoint ({checkpoint.pages} pages)")
+            seen.update(checkpoint.reply_keys)
+            await asyncio.to_thread(self.start_channel_stats, channel_id, checkpoint.run_id)
+            if checkpoint.finished:
+                return
+            cursor, latest = checkpoint.cursor, checkpoint.latest
+        else:
+            await asyncio.to_thread(self.start_channel_stats, channel_id)
+
+        async for messages, next_cursor in self.iter_history_page_sources(channel_id, oldest, cursor, latest):
+            total_messages += len(messages)
+
+            # スレッド取得期間内で、返信が変化したスレッドの親メッセージ
+            parents = self.select_thread_parents(messages, thread_cutoff_ts, thread_state)
+            replies = await asyncio.gather(*(self.fetch_thread_rows(channel_id, parent['ts'], checkpoint) for index, parent in parents))
+            thread_columns = {parent['ts']: rows for (index, parent), rows in zip(parents, replies)}
+
+            # ページ内の全てのユーザーのメールアドレスを事前に解決してから、ページをまとめて整形
+            await self.resolve_user_emails(message.get('user') for message in messages)
+            page_columns = self.normalize_columns(messages, channel_id)
+
+            # 親メッセージの直後にスレッドの返信が並ぶよう結合
+            batch = self._assemble_page(page_columns, parents, thread_columns, channel_id, thread_state, seen)
+            # 集計表とチェックポイントへの書き込みはイベントループを止めないよう別スレッドで行う
+            await asyncio.to_thread(self.record_stats, channel_id, batch)
+            yield batch
+            if checkpoint is not None:
+                await asyncio.to_thread(checkpoint.save_page, next_cursor, self.oldest_ts(messages), seen, self.stats_run_id)
+
+        self.logger.view_log(f"Total {total_messages} messages fetched for channel '{channel_name}'")
+        self.logger.view_log(f"Finished fetching messages for channel '{channel_name}'")
+
+    async def get_all_messages(self, channel_id: str, get_thread_date_length=300, oldest=None, thread_state=None):
+        """
+        SlackManager.get_all_messagesの非同期版。
+
+        :param channel_id: チャンネルID
+        :param get_thread_date_length: スレッドデータ取得の期間（日数）
+        :param oldest: このタイムスタンプより新しいメッセージのみ取得する（オプション、差分取得用）
+        :param thread_state: thread_ts -> {'reply_count', 'latest_reply'} の辞書（オプション、差分取得用）
+        :return: DataFrame（カラムはSlackManager.get_all_messagesと同じ）
+        """
+        batches = [batch async for batch in self.iter_message_batches(channel_id, get_thread_date_length, oldest, thread_state)]
+        if not batches:
+            return pd.DataFrame(columns=connector.MESSAGE_COLUMNS)
+        return pd.concat(batches, ignore_index=True)
+
+    async def convert_reactions(self, messages_df):
+        """
+        リアクションしたユーザーのメールアドレスを並行して解決してから、convert_messages_to_react_dataで展開する。
+
+        :param messages_df: get_all_messagesの応答として得られるDataFrame
+        :return: リアクションデータを整形したDataFrame
+        """
+        users = [
+            user
+            for reactions in messages_df['react'].dropna()
+            for reaction in self.parse_reactions(reactions)
+            for user in reaction.get('users', [])
+        ]
+        await self.resolve_user_emails(users)
+        return self.convert_messages_to_react_data(messages_df)
@@ -0,0 +1,97 @@
+"""
+リアクション抽出の性能を、旧実装（str()で保存した文字列をiterrows()+eval()で戻す方式）と
+現在のconvert_messages_to_react_data（構造化データを一括で展開する方式）で比較するベンチマーク。
+
+使い方: python benchmarks/bench_reactions.py [--messages 500000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pandas as pd  # noqa: E402
+import cacheLib  # noqa: E402
+import connector  # noqa: E402
+
+STAMPS = ['+1', 'eyes', 'tada', 'pray', 'white_check_mark', 'joy', 'heart']
+USER_IDS = [f'U{i:08d}' for i in range(100000)]
+
+
+def build_messages(n_messages, n_users, seed=0):
+    # 約3割のメッセージに1〜3種類のリアクション、各1〜5人のユーザーを付与
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n_messages):
+        reactions = None
+        if rng.random() < 0.3:
+            reactions = [
+                {'name': stamp, 'users': rng.sample(USER_IDS[:n_users], rng.randint(1, 5)), 'count': 0}
+                for stamp in rng.sample(STAMPS, rng.randint(1, 3))
+            ]
+        rows.append({
+            'type': 'message', 'user': USER_IDS[i % n_users], 'team': 'T1', 'text': f'message {i}',
+            'ts': f'{1700000000 + i}.000100', 'thread_ts': None, 'react': reactions,
+            'datetime': None, 'email': None, 'channel_id': 'C1', 'export_date': '2024-01-01'
+        })
+    return pd.DataFrame(rows, columns=connector.MESSAGE_COLUMNS)
+
+
+def legacy_convert(manager, messages_df):
+    # 旧実装: 1行ずつeval()でリアクションを復元し、リアクションの行ごとにメールアドレスを解決
+    react_data = []
+    for index, row in messages_df.iterrows():
+        if isinstance(row['react'], str):
+            for reaction in eval(row['react']):
+                for user in reaction['users']:
+                    react_data.append({
+                        'ts': row['ts'], 'user': user, 'stamp': reaction['name'],
+                        'email': manager.get_user_email(user),
+                        'channel_id': row['channel_id'], 'export_date': row['export_date']
+                    })
+    df = pd.DataFrame(react_data, columns=connector.REACTION_COLUMNS)
+    return df.drop_duplicates()
+
+
+def make_manager(tmp_dir, n_users):
+    # APIを呼ばないよう、全ユーザーをキャッシュに登録したSlackManagerを作成
+    os.makedirs(os.path.join(tmp_dir, 'input'))
+    with open(os.path.join(tmp_dir, 'input', 'token.csv'), 'w') as file:
+        file.write('xoxb-dummy\n')
+    os.chdir(tmp_dir)
+    user_cache = cacheLib.UserCache(valid_days=100)
+    user_cache.add_users((user_id, f'{user_id}@example.com') for user_id in USER_IDS[:n_users])
+    return connector.SlackManager(user_cache)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=500000)
+    parser.add_argument('--users', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        manager = make_manager(tmp_dir, args.users)
+        messages_df = build_messages(args.messages, args.users)
+
+        start = time.perf_counter()
+        new_df = manager.convert_messages_to_react_data(messages_df)
+        new_elapsed = time.perf_counter() - start
+
+        legacy_df = messages_df.assign(react=[str(react) if react is not None else None for react in messages_df['react']])
+        start = time.perf_counter()
+        old_df = legacy_convert(manager, legacy_df)
+        legacy_elapsed = time.perf_counter() - start
+
+        assert len(new_df) == len(old_df), (len(new_df), len(old_df))
+        print(f"messages: {args.messages}, reaction rows: {len(new_df)}")
+        print(f"legacy (iterrows + eval): {legacy_elapsed:8.2f} s")
+        print(f"structured (explode):     {new_elapsed:8.2f} s")
+        print(f"speedup:                  {legacy_elapsed / new_elapsed:8.1f} x")
+
+
+if __name__ == "__main__":
+    main()
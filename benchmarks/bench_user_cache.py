@@ -0,0 +1,79 @@
+"""
+UserCacheの起動と参照の性能を測定するマイクロベンチマーク。
+キャッシュ件数を変えながら、起動時間、データベースからの初回のget()、辞書に載った後のget()のコストを計測し、
+件数に依存しないことを確認する。比較として旧形式のcache.csvを全件読み込む時間も計測する。
+
+使い方: python benchmarks/bench_user_cache.py
+"""
+import csv
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import cacheLib  # noqa: E402
+
+SIZES = [100, 1000, 10000, 100000]
+LOOKUPS = 10000
+
+
+def build_cache(size, tmp_dir):
+    cache_file = os.path.join(tmp_dir, f"cache_{size}.sqlite3")
+    legacy_file = os.path.join(tmp_dir, f"cache_{size}.csv")
+    now = cacheLib.datetime.now().replace(microsecond=0)
+    users = [(f"U{i:08d}", f"user{i}@example.com") for i in range(size)]
+
+    cache = cacheLib.UserCache(valid_days=100, cache_file=cache_file, legacy_cache_file=None)
+    cache.add_users(users, last_updated=now)
+    cache.close()
+
+    # 旧形式のCSVファイル（比較用）
+    with open(legacy_file, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['user_id', 'email', 'last_updated'])
+        for user_id, email in users:
+            writer.writerow([user_id, email, now.strftime('%Y-%m-%d %H:%M:%S')])
+    return cache_file, legacy_file
+
+
+def legacy_startup(legacy_file):
+    # 旧実装: 起動時にCSVファイルの全行をstrptimeで解析して辞書に読み込む
+    users = {}
+    with open(legacy_file, mode='r', newline='') as file:
+        for row in csv.DictReader(file):
+            users[row['user_id']] = cacheLib.datetime.strptime(row['last_updated'], '%Y-%m-%d %H:%M:%S')
+    return users
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"{'size':>8} {'startup ms':>11} {'cold get us':>12} {'warm get ns':>12} {'legacy startup ms':>18}")
+        for size in SIZES:
+            cache_file, legacy_file = build_cache(size, tmp_dir)
+            keys = [f"U{i * 7919 % size:08d}" for i in range(min(LOOKUPS, size))]
+
+            caches = []
+            elapsed = timeit.timeit(
+                lambda: caches.append(cacheLib.UserCache(valid_days=100, cache_file=cache_file, legacy_cache_file=None)),
+                number=5)
+            startup_ms = elapsed / 5 * 1e3
+            cache = caches[-1]
+
+            # 初回の参照はデータベースを検索し、2回目以降は辞書から返す
+            elapsed = timeit.timeit(lambda: [cache.get(k) for k in keys], number=1)
+            cold_us = elapsed / len(keys) * 1e6
+            elapsed = timeit.timeit(lambda: [cache.get(k) for k in keys], number=10)
+            warm_ns = elapsed / (len(keys) * 10) * 1e9
+
+            elapsed = timeit.timeit(lambda: legacy_startup(legacy_file), number=1)
+            legacy_ms = elapsed * 1e3
+
+            for opened in caches:
+                opened.close()
+            print(f"{size:>8} {startup_ms:>11.2f} {cold_us:>12.2f} {warm_ns:>12.0f} {legacy_ms:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
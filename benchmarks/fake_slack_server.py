@@ -0,0 +1,312 @@
+"""
+ベンチマーク用のSlack Web APIの疑似サーバー。
+connector.SlackManagerが使うconversations.history / conversations.replies / conversations.members /
+users.info / users.listに応答し、合成したチャネルのデータをページングして返す。
+指定したメソッドの呼び出しN回ごとに429とRetry-Afterを返し、レート制限を再現する。
+失効したものとして指定したトークンにはinvalid_authを返す。
+HTTP/1.1のkeep-alive接続に対応し、Accept-Encodingにgzipを含むリクエストには圧縮した応答を返す。
+新しい接続ごとに遅延を加え、TLSのハンドシェイクの往復を再現できる。
+
+単体で起動する場合: python benchmarks/fake_slack_server.py --port 8765
+"""
+import argparse
+import gzip
+import json
+import random
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+STAMPS = ['+1', 'eyes', 'tada', 'pray', 'white_check_mark', 'joy', 'heart']
+
+
+class SyntheticWorkspace:
+    def __init__(self, channels=1, messages=1000, thread_ratio=0.1, replies=5, reaction_ratio=0.3, users=200,
+                 days=30, seed=0):
+        """
+        合成したワークスペースのデータ。チャネルのデータは初回のアクセス時に乱数のシードから決定的に生成する。
+
+        :param channels: チャネル数（IDはC0000001から連番）
+        :param messages: チャネルあたりのトップレベルのメッセージ数
+        :param thread_ratio: スレッドの親になるメッセージの割合
+        :param replies: スレッドあたりの返信数
+        :param reaction_ratio: リアクションが付くメッセージの割合
+        :param users: ユーザー数
+        :param days: メッセージを分布させる期間（日数、現在時刻から遡る）
+        :param seed: 乱数のシード
+        """
+        self.channel_ids = [f"C{i + 1:07d}" for i in range(channels)]
+        self.messages = messages
+        self.thread_ratio = thread_ratio
+        self.replies = replies
+        self.reaction_ratio = reaction_ratio
+        self.user_ids = [f"U{i + 1:08d}" for i in range(users)]
+        self.days = days
+        self.seed = seed
+        self.now = int(time.time())
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    @property
+    def total_messages(self):
+        """全チャネルのトップレベルのメッセージと返信の合計数（親メッセージの重複は含まない）"""
+        threads = sum(1 for i in range(self.messages) if self._is_thread(i))
+        return len(self.channel_ids) * (self.messages + threads * self.replies)
+
+    def _is_thread(self, index):
+        # 親メッセージの判定はチャネルに依らず位置で決める
+        return self.thread_ratio > 0 and index % max(1, round(1 / self.thread_ratio)) == 0
+
+    def channel(self, channel_id):
+        """
+        チャネルのデータを返す。
+
+        :param channel_id: チャネルID
+        :return: {'history': 新しい順のメッセージのリスト, 'threads': thread_ts -> 返信を含むメッセージのリスト}
+        """
+        with self._lock:
+            if channel_id not in self._channels:
+                self._channels[channel_id] = self._generate(channel_id)
+            return self._channels[channel_id]
+
+    def _reactions(self, rng):
+        if rng.random() >= self.reaction_ratio:
+            return None
+        reactions = []
+        for stamp in rng.sample(STAMPS, rng.randint(1, 3)):
+            users = rng.sample(self.user_ids, min(len(self.user_ids), rng.randint(1, 5)))
+            reactions.append({'name': stamp, 'users': users, 'count': len(users)})
+        return reactions
+
+    def _generate(self, channel_id):
+        rng = random.Random(f"{self.seed}:{channel_id}")
+        span = self.days * 86400
+        step = span / max(1, self.messages)
+        history = []
+        threads = {}
+        for i in range(self.messages):
+            ts = f"{self.now - int(i * step) - 1}.{i % 1000000:06d}"
+            message = {
+                'type': 'message', 'user': rng.choice(self.user_ids), 'team': 'T0000001',
+                'text': f"message {i} in {channel_id}\nwith a second line", 'ts': ts,
+            }
+            reactions = self._reactions(rng)
+            if reactions:
+                message['reactions'] = reactions
+            if self._is_thread(i):
+                replies = [
+                    {'type': 'message', 'user': rng.choice(self.user_ids), 'team': 'T0000001',
+                     'text': f"reply {j} to {ts}", 'ts': f"{float(ts) + j + 1:.6f}", 'thread_ts': ts}
+                    for j in range(self.replies)
+                ]
+                message.update({'thread_ts': ts, 'reply_count': len(replies),
+                                'latest_reply': replies[-1]['ts'] if replies else ts})
+                threads[ts] = [dict(message)] + replies
+            history.append(message)
+        return {'history': history, 'threads': threads}
+
+
+class FakeSlackServer:
+    def __init__(self, workspace: SyntheticWorkspace, host='127.0.0.1', port=0, ratelimit_every=None, retry_after=1,
+                 latency=0.0, revoked_tokens=None, connect_latency=0.0):
+        """
+        疑似サーバーの初期化メソッド。start()でバックグラウンドのスレッドで待ち受けを開始する。
+
+        :param workspace: 応答に使うSyntheticWorkspace
+        :param host: 待ち受けるホスト
+        :param port: 待ち受けるポート（0の場合は空いているポートを使う）
+        :param ratelimit_every: メソッド名 -> N の辞書。各メソッドのN回目ごとの呼び出しに429を返す
+        :param retry_after: 429のRetry-Afterの秒数
+        :param latency: 各応答に加える遅延（秒）
+        :param revoked_tokens: invalid_authを返すトークンのリスト
+        :param connect_latency: 新しい接続ごとに加える遅延（秒、TLSのハンドシェイクの代わり）
+        """
+        self.workspace = workspace
+        self.ratelimit_every = ratelimit_every or {}
+        self.retry_after = retry_after
+        self.latency = latency
+        self.revoked_tokens = set(revoked_tokens or [])
+        self.connect_latency = connect_latency
+        self.connections = 0  # 受け付けた接続の数
+        self.calls = Counter()  # メソッド名 -> 呼び出し回数（429を含む）
+        self.ratelimited = Counter()  # メソッド名 -> 429を返した回数
+        self.calls_by_token = Counter()  # トークン -> 呼び出し回数
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        """SlackManagerのbase_urlに渡すURL"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/api/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def _count(self, method, token):
+        # 呼び出し回数を数え、レート制限を返すべき呼び出しかを判定する
+        with self._lock:
+            self.calls[method] += 1
+            self.calls_by_token[token] += 1
+            every = self.ratelimit_every.get(method)
+            if every and self.calls[method] % every == 0:
+                self.ratelimited[method] += 1
+                return True
+            return False
+
+    def handle(self, method, params, token=None):
+        """
+        APIメソッドの応答を作成する。
+
+        :param method: APIメソッド名（例: 'conversations.history'）
+        :param params: リクエストの引数
+        :param token: リクエストのトークン
+        :return: (HTTPステータス, 追加のヘッダー, レスポンスの辞書)
+        """
+        if token in self.revoked_tokens:
+            with self._lock:
+                self.calls[method] += 1
+                self.calls_by_token[token] += 1
+            return 200, {}, {'ok': False, 'error': 'invalid_auth'}
+        if self._count(method, token):
+            return 429, {'Retry-After': str(self.retry_after)}, {'ok': False, 'error': 'ratelimited'}
+
+        limit = int(params.get('limit') or 100)
+        offset = int(params.get('cursor') or 0)
+        if method == 'conversations.history':
+            messages = self.workspace.channel(params['channel'])['history']
+            oldest, latest = params.get('oldest'), params.get('latest')
+            if oldest or latest:
+                # inclusiveが指定された場合はoldestとlatestのタイムスタンプのメッセージも含める
+                inclusive = params.get('inclusive') in ('1', 'true')
+                lower = Decimal(oldest) if oldest else None
+                upper = Decimal(latest) if latest else None
+
+                def within(ts):
+                    value = Decimal(ts)
+                    return ((lower is None or value > lower or (inclusive and value == lower))
+                            and (upper is None or value < upper or (inclusive and value == upper)))
+
+                messages = [message for message in messages if within(message['ts'])]
+            return 200, {}, self._page('messages', messages, offset, limit)
+        if method == 'conversations.replies':
+            thread = self.workspace.channel(params['channel'])['threads'].get(params['ts'])
+            if thread is None:
+                return 200, {}, {'ok': False, 'error': 'thread_not_found'}
+            return 200, {}, self._page('messages', thread, offset, limit)
+        if method == 'conversations.members':
+            return 200, {}, self._page('members', self.workspace.user_ids, offset, limit)
+        if method == 'users.info':
+            return 200, {}, {'ok': True, 'user': self._user(params['user'])}
+        if method == 'users.list':
+            return 200, {}, self._page('members', [self._user(user_id) for user_id in self.workspace.user_ids], offset, limit)
+        return 404, {}, {'ok': False, 'error': 'unknown_method'}
+
+    @staticmethod
+    def _page(key, items, offset, limit):
+        page = items[offset:offset + limit]
+        next_cursor = str(offset + limit) if offset + limit < len(items) else ''
+        return {'ok': True, key: page, 'has_more': bool(next_cursor), 'response_metadata': {'next_cursor': next_cursor}}
+
+    @staticmethod
+    def _user(user_id):
+        return {'id': user_id, 'name': user_id.lower(), 'profile': {'email': f"{user_id.lower()}@example.com"}}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # ヘッダーと本文を別々に書き込むため、keep-alive接続でNagleアルゴリズムによる遅延が生じないようにする
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+                if server.connect_latency:
+                    time.sleep(server.connect_latency)
+
+            def _respond(self, params):
+                method = urlparse(self.path).path.rsplit('/', 1)[-1]
+                if server.latency:
+                    time.sleep(server.latency)
+                authorization = self.headers.get('Authorization') or ''
+                token = authorization[len('Bearer '):] if authorization.startswith('Bearer ') else params.get('token')
+                status, headers, payload = server.handle(method, params, token=token)
+                body = json.dumps(payload).encode('utf-8')
+                compressed = 'gzip' in (self.headers.get('Accept-Encoding') or '')
+                if compressed:
+                    body = gzip.compress(body)
+                with server._lock:
+                    server.bytes_sent += len(body)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                if compressed:
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                self._respond({key: values[-1] for key, values in query.items()})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length).decode('utf-8') if length else ''
+                if self.headers.get('Content-Type', '').startswith('application/json'):
+                    params = json.loads(raw or '{}')
+                else:
+                    params = {key: values[-1] for key, values in parse_qs(raw).items()}
+                params.update({key: values[-1] for key, values in parse_qs(urlparse(self.path).query).items()})
+                self._respond(params)
+
+            def log_message(self, format, *args):
+                # ベンチマークの出力を汚さないようアクセスログは出力しない
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a synthetic Slack workspace over HTTP.")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--channels', type=int, default=1)
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--replies', type=int, default=5)
+    parser.add_argument('--users', type=int, default=200)
+    args = parser.parse_args()
+
+    workspace = SyntheticWorkspace(channels=args.channels, messages=args.messages, replies=args.replies, users=args.users)
+    server = FakeSlackServer(workspace, port=args.port)
+    print(f"Serving {', '.join(workspace.channel_ids)} at {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,65 +1,192 @@
 import csv
 import os
+import sqlite3
+import threading
 from datetime import datetime, timedelta
 
 
 class UserCache:
-    def __init__(self, valid_days: int):
+    # スキーマのバージョン（PRAGMA user_versionに保存する）
+    SCHEMA_VERSION = 1
+
+    def __init__(self, valid_days: int, cache_file: str = "cache.sqlite3", legacy_cache_file: str = "cache.csv",
+                 sweep_interval: int = 3600, commit_every: int = 100):
+        """
+        UserCacheクラスの初期化メソッド。
+        ユーザー情報はSQLiteのテーブル（user_idが主キー）に保存し、参照したエントリはuser_idをキーとした辞書に保持する。
+        起動時に全件を読み込まないため、キャッシュの件数に関わらず起動と参照のコストは一定となる。
+        データベースを新規に作成した場合は、旧形式のCSVファイルの内容を一度だけ取り込む。
+
+        :param valid_days: キャッシュの有効日数
+        :param cache_file: キャッシュのデータベースファイルのパス
+        :param legacy_cache_file: 旧形式のCSVキャッシュファイルのパス（取り込み元）
+        :param sweep_interval: 期限切れエントリの一括削除を行う間隔（秒）
+        :param commit_every: add_userで書き込んだエントリをまとめてコミットする件数
+        """
         # 有効ログ期間を指定された日数に設定
         self.valid_period = timedelta(days=valid_days)
-        self.cache_file = "cache.csv"
-        self.users = []  # ローカルプロパティとしてユーザーデータを保持
-        
-        # CSVファイルの読み込みまたは新規作成
-        if os.path.exists(self.cache_file):
-            self._load_cache()
-        else:
-            self._create_cache_file()
-
-    def _create_cache_file(self):
-        # 新規のキャッシュファイルを作成
-        with open(self.cache_file, mode='w', newline='') as file:
-            writer = csv.writer(file)
-            # ヘッダー行を書き込み
-            writer.writerow(['user_id', 'email', 'last_updated'])
-
-    def _load_cache(self):
-        # CSVファイルを読み込み、ユーザー情報をローカルプロパティに格納
-        with open(self.cache_file, mode='r', newline='') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                user = {
-                    'user_id': row['user_id'],
-                    'email': row['email'],
-                    'last_updated': datetime.strptime(row['last_updated'], '%Y-%m-%d %H:%M:%S')
-                }
-                self.users.append(user)
+        self.cache_file = cache_file
+        self.legacy_cache_file = legacy_cache_file
+        self.sweep_interval = timedelta(seconds=sweep_interval)
+        self.commit_every = commit_every
+        self.users = {}  # user_id -> ユーザー情報 の辞書として参照・追加したユーザーデータを保持
+        self._pending_writes = 0  # 未コミットの書き込み件数
+        self._lock = threading.RLock()  # 複数ワーカーから共有されるため、辞書とデータベースの更新を排他制御する
+
+        self.connection = sqlite3.connect(self.cache_file, check_same_thread=False)
+        # ワークキューの別のホストのワーカーと共有する場合があるため、WALは使わない
+        self.connection.execute("PRAGMA journal_mode=DELETE")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] < self.SCHEMA_VERSION:
+            self._create_schema()
+        self.evict_expired()
+
+    def _create_schema(self):
+        # テーブルを作成し、旧形式のCSVファイルがあれば取り込む
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS users ("
+                "user_id TEXT PRIMARY KEY, email TEXT, last_updated REAL NOT NULL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS users_last_updated ON users (last_updated)")
+            if self.legacy_cache_file and os.path.exists(self.legacy_cache_file):
+                self._upsert_many(self._read_legacy_cache())
+            self.connection.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    def _read_legacy_cache(self):
+        # 旧形式のCSVファイルを読み込む（同じuser_idが複数行ある場合は更新日時が新しい行を残す）
+        with open(self.legacy_cache_file, mode='r', newline='') as file:
+            for row in csv.DictReader(file):
+                last_updated = datetime.strptime(row['last_updated'], '%Y-%m-%d %H:%M:%S')
+                yield self._make_entry(row['user_id'], row['email'], last_updated)
+
+    def _upsert_many(self, users):
+        # 既存のエントリより新しい場合のみ上書きする
+        self.connection.executemany(
+            "INSERT INTO users (user_id, email, last_updated) VALUES (?, ?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET email = excluded.email, last_updated = excluded.last_updated "
+            "WHERE excluded.last_updated >= users.last_updated",
+            ((user['user_id'], user['email'], user['last_updated'].timestamp()) for user in users)
+        )
+
+    def _make_entry(self, user_id, email, last_updated):
+        return {
+            'user_id': user_id,
+            'email': email,
+            'last_updated': last_updated,
+            'expires_at': last_updated + self.valid_period
+        }
 
     @property
     def valid_users(self):
-        # 有効期間内のユーザーのみをリストとして返す
+        # 有効期間内のユーザーのみをリストとして返す（未コミットのエントリを含む）
         now = datetime.now()
-        return [
-            user for user in self.users
-            if now - user['last_updated'] <= self.valid_period
-        ]
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT user_id, email, last_updated FROM users WHERE last_updated >= ?",
+                ((now - self.valid_period).timestamp(),)
+            ).fetchall()
+            users = {user_id: self._make_entry(user_id, email, datetime.fromtimestamp(last_updated))
+                     for user_id, email, last_updated in rows}
+            users.update(self.users)
+        return [user for user in users.values() if now <= user['expires_at']]
 
-    def add_user(self, user_id: str, email: str):
-        # ユーザーを追加し、キャッシュファイルにも書き込む
+    def get(self, user_id: str):
+        """
+        user_idに対応するメールアドレスを返す。
+        辞書に無い場合はデータベースを主キーで検索する。有効期限はアクセス時に判定し、期限切れの場合はNoneを返す。
+
+        :param user_id: SlackのメンバーID
+        :return: メールアドレス、キャッシュに無いか期限切れの場合はNone
+        """
         now = datetime.now()
-        user = {
-            'user_id': user_id,
-            'email': email,
-            'last_updated': now
-        }
-        self.users.append(user)
-        self._write_to_cache(user)
+        with self._lock:
+            if now >= self._next_sweep:
+                self.evict_expired()
+
+            user = self.users.get(user_id)
+            if user is None:
+                row = self.connection.execute(
+                    "SELECT email, last_updated FROM users WHERE user_id = ?", (user_id,)
+                ).fetchone()
+                if row is None:
+                    return None
+                user = self._make_entry(user_id, row[0], datetime.fromtimestamp(row[1]))
+                self.users[user_id] = user
+            if now > user['expires_at']:
+                del self.users[user_id]
+                return None
+            return user['email']
+
+    def evict_expired(self):
+        """
+        期限切れのエントリを辞書とデータベースから一括で削除する。
+
+        :return: 削除したエントリ数
+        """
+        now = datetime.now()
+        with self._lock:
+            expired = [user_id for user_id, user in self.users.items() if now > user['expires_at']]
+            for user_id in expired:
+                del self.users[user_id]
+            with self.connection:
+                deleted = self.connection.execute(
+                    "DELETE FROM users WHERE last_updated < ?", ((now - self.valid_period).timestamp(),)
+                ).rowcount
+            self._pending_writes = 0
+            self._next_sweep = now + self.sweep_interval
+        return max(len(expired), deleted)
+
+    def add_user(self, user_id: str, email: str):
+        # ユーザーを追加し、データベースにも書き込む（コミットはcommit_every件ごとにまとめて行う）
+        now = datetime.now().replace(microsecond=0)
+        user = self._make_entry(user_id, email, now)
+        with self._lock:
+            self.users[user_id] = user
+            self._upsert_many([user])
+            self._pending_writes += 1
+            if self._pending_writes >= self.commit_every:
+                self.flush()
+
+    def add_users(self, users, last_updated=None, persist=True):
+        """
+        複数のユーザーを一括で追加する。
+        既にキャッシュにあるエントリの方が新しい場合は上書きしない。
 
-    def _write_to_cache(self, user):
-        # ユーザー情報をCSVファイルに追加
-        with open(self.cache_file, mode='a', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow([user['user_id'], user['email'], user['last_updated'].strftime('%Y-%m-%d %H:%M:%S')])
+        :param users: (user_id, email) のタプルのイテラブル
+        :param last_updated: 取得日時（省略時は現在時刻）
+        :param persist: データベースにも書き込むかどうか
+        :return: 追加・更新したユーザー数
+        """
+        last_updated = (last_updated or datetime.now()).replace(microsecond=0)
+        added = []
+        with self._lock:
+            for user_id, email in users:
+                current = self.users.get(user_id)
+                if current is not None and current['last_updated'] > last_updated:
+                    continue
+                user = self._make_entry(user_id, email, last_updated)
+                self.users[user_id] = user
+                added.append(user)
 
+            if persist and added:
+                with self.connection:
+                    self._upsert_many(added)
+                self._pending_writes = 0
+        return len(added)
 
+    def flush(self):
+        """
+        未コミットの書き込みをデータベースに反映する。
+        """
+        with self._lock:
+            self.connection.commit()
+            self._pending_writes = 0
 
+    def close(self):
+        """
+        未コミットの書き込みを反映し、データベースの接続を閉じる。
+        """
+        with self._lock:
+            self.connection.commit()
+            self.connection.close()
@@ -0,0 +1,174 @@
+import glob
+import json
+import os
+import pickle
+import shutil
+import threading
+import mainUtils
+
+
+class ExportCheckpoint:
+    def __init__(self, checkpoint_dir: str):
+        """
+        ExportCheckpointクラスの初期化メソッド。
+        チャネル履歴のエクスポートの途中経過（次に取得するカーソル、時間範囲の再開位置、取得済みのスレッド、
+        出力ファイルの書き込み位置）をcheckpoint_dirに保存し、中断後の再実行時に続きから再開できるようにする。
+        処理済みのページの内容は保存せず、出力ファイル自体を書き込み位置から引き継いで追記する。
+        既にチェックポイントがある場合は読み込む。全てのファイルは一時ファイルからのリネームで書き込む。
+
+        :param checkpoint_dir: チェックポイントの保存先ディレクトリ
+        """
+        self.checkpoint_dir = checkpoint_dir
+        self.state_path = os.path.join(checkpoint_dir, "state.json")
+        self._lock = threading.Lock()  # スレッド取得のワーカーから同時に書き込まれるため排他制御する
+        self._outputs = {}  # 出力名 -> ページごとに書き込み位置を確定するライター
+
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        self.state = self._initial_state()
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r') as file:
+                self.state.update(json.load(file))
+        # 処理中のページのスレッドは保存したファイルの有無で判定する
+        self._completed_threads = {
+            os.path.basename(path)[len("thread_"):-len(".pkl")]
+            for path in glob.glob(os.path.join(checkpoint_dir, "thread_*.pkl"))
+        }
+
+    @staticmethod
+    def _initial_state():
+        return {'cursor': None, 'latest': None, 'pages': 0, 'finished': False, 'reply_keys': [], 'outputs': {}, 'run_id': None}
+
+    @property
+    def cursor(self):
+        """次に取得する履歴ページのカーソル（最初のページから取得する場合はNone）"""
+        return self.state['cursor']
+
+    @property
+    def latest(self):
+        """処理済みのページの最も古いメッセージのタイムスタンプ（時間範囲に分割して取得する場合の再開位置）"""
+        return self.state.get('latest')
+
+    @property
+    def finished(self):
+        """全ての履歴ページを処理済みかどうか"""
+        return self.state['finished']
+
+    @property
+    def pages(self):
+        """処理済みの履歴ページ数"""
+        return self.state['pages']
+
+    @property
+    def reply_keys(self):
+        """処理済みのページの履歴に含まれたスレッドの返信の(ts, thread_ts)のリスト"""
+        return [tuple(key) for key in self.state['reply_keys']]
+
+    @property
+    def run_id(self):
+        """処理済みのページを集計したStatsStoreの実行の識別子"""
+        return self.state['run_id']
+
+    def output_state(self, name):
+        """
+        出力ファイルの最後に確定した書き込み位置を返す。
+
+        :param name: 出力名
+        :return: StreamWriter.commitが返した状態（保存されていない場合はNone）
+        """
+        return self.state['outputs'].get(name)
+
+    def track_outputs(self, outputs):
+        """
+        ページを保存するたびに書き込み位置を確定する出力を登録する。
+
+        :param outputs: 出力名 -> commitメソッドを持つライター の辞書
+        """
+        self._outputs = dict(outputs)
+
+    def reset(self):
+        """
+        保存した途中経過を全て削除し、最初のページから取得し直す状態にする。出力ファイルを引き継げない場合に使う。
+        """
+        with self._lock:
+            shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+            os.makedirs(self.checkpoint_dir, exist_ok=True)
+            self.state = self._initial_state()
+            self._completed_threads = set()
+
+    def _save_state(self):
+        def write(tmp_path):
+            with open(tmp_path, 'w') as file:
+                json.dump(self.state, file)
+
+        mainUtils.writeFileAtomically(self.state_path, write)
+
+    def save_page(self, next_cursor, latest=None, reply_keys=(), run_id=None):
+        """
+        呼び出し側がページを出力に書き込んだ後に呼び出し、登録した出力の書き込み位置を確定して、
+        次に取得するカーソルとページの最も古いメッセージのタイムスタンプを記録する。
+        ページに含まれるスレッドの途中経過はページに取り込まれたため削除する。
+
+        :param next_cursor: 次のページのカーソル（最後のページの場合は空、時間範囲に分割して取得する場合はTrue）
+        :param latest: ページの最も古いメッセージのタイムスタンプ（オプション）
+        :param reply_keys: このページまでの履歴に含まれたスレッドの返信の(ts, thread_ts)
+        :param run_id: ページを集計したStatsStoreの実行の識別子（オプション）
+        """
+        with self._lock:
+            self.state['outputs'] = {name: writer.commit() for name, writer in self._outputs.items()}
+            self.state['pages'] += 1
+            self.state['cursor'] = next_cursor if isinstance(next_cursor, str) and next_cursor else None
+            if latest is not None:
+                self.state['latest'] = latest
+            self.state['finished'] = not next_cursor
+            self.state['reply_keys'] = sorted(list(key) for key in reply_keys)
+            self.state['run_id'] = run_id
+            completed_threads, self._completed_threads = self._completed_threads, set()
+            self._save_state()
+
+        for thread_ts in completed_threads:
+            thread_path = self._thread_path(thread_ts)
+            if os.path.exists(thread_path):
+                os.remove(thread_path)
+
+    def _thread_path(self, thread_ts):
+        return os.path.join(self.checkpoint_dir, f"thread_{thread_ts}.pkl")
+
+    def has_thread(self, thread_ts):
+        """
+        処理中のページのスレッドが取得済みかどうかを返す。
+
+        :param thread_ts: スレッドタイムスタンプ
+        :return: 取得済みの場合True
+        """
+        return thread_ts in self._completed_threads
+
+    def load_thread(self, thread_ts):
+        """
+        取得済みのスレッドの整形済みの行を読み込む。
+
+        :param thread_ts: スレッドタイムスタンプ
+        :return: 整形済みメッセージ（SlackManager.fetch_thread_rowsの戻り値）
+        """
+        with open(self._thread_path(thread_ts), 'rb') as file:
+            return pickle.load(file)
+
+    def save_thread(self, thread_ts, rows):
+        """
+        取得済みのスレッドの整形済みの行を保存する。
+
+        :param thread_ts: スレッドタイムスタンプ
+        :param rows: 整形済みメッセージ（SlackManager.fetch_thread_rowsの戻り値）
+        """
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as file:
+                pickle.dump(rows, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        mainUtils.writeFileAtomically(self._thread_path(thread_ts), write)
+        with self._lock:
+            self._completed_threads.add(thread_ts)
+
+    def clear(self):
+        """
+        エクスポートの完了後にチェックポイントを削除する。
+        """
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
@@ -1,123 +1,336 @@
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 import time
+import ast
+import contextlib
+import copy
+import functools
+import os
+import re
+import unicodedata
+import zoneinfo
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta 
+from dateutil import tz
+from datetime import datetime, timedelta, timezone
 import logger
+import rateLimiter
+import metrics
+import requestWatchdog
+import tokenPool
+import historyWindows
+import httpTransport
 import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# get_all_messages / iter_message_batchesが返すDataFrameのカラム
+MESSAGE_COLUMNS = ['type', 'user', 'team', 'text', 'ts', 'thread_ts', 'react', 'datetime', 'email', 'channel_id', 'export_date']
+# convert_messages_to_react_dataが返すDataFrameのカラム
+REACTION_COLUMNS = ['ts', 'user', 'stamp', 'email', 'channel_id', 'export_date']
+
+
+# get_user_emailで使うロックの数（同じロックに割り当てられた別のユーザーの問い合わせは順に行う）
+EMAIL_LOOKUP_LOCK_STRIPES = 64
+# retry_requestで1回の呼び出しがレート制限により待機する最大回数（max_retriesの試行回数とは別に数える）
+MAX_RATE_LIMIT_WAITS = 20
+
+
+@functools.lru_cache(maxsize=None)
+def non_printable_pattern():
+    """
+    Excelで使用できない文字の大半（改行、タブ、全角スペースなど）を一度に除去するための正規表現を返す。
+    基本多言語面のうちstr.isprintableがFalseとなる制御文字・書式文字・空白文字（未割り当て・私用・サロゲートを除く）を対象とする。
+    全ての文字を走査して作成するため、import時ではなく最初に必要になった時に1回だけ作成する。
+
+    :return: コンパイル済みの正規表現
+    """
+    ranges = []
+    for codepoint in range(0x10000):
+        char = chr(codepoint)
+        if char.isprintable() or unicodedata.category(char) in ('Cn', 'Co', 'Cs'):
+            continue
+        if ranges and ranges[-1][1] == codepoint - 1:
+            ranges[-1][1] = codepoint
+        else:
+            ranges.append([codepoint, codepoint])
+    char_class = ''.join(
+        re.escape(chr(start)) if start == end else f"{re.escape(chr(start))}-{re.escape(chr(end))}"
+        for start, end in ranges
+    )
+    return re.compile(f"[{char_class}]+")
+
+
+@functools.lru_cache(maxsize=None)
+def local_timezone():
+    """
+    time.localtimeと同じローカル時刻のタイムゾーンを、pandasで列ごとに一括変換できる形で返す。
+    環境変数TZ（未設定の場合は/etc/localtimeのリンク先）のIANAのタイムゾーン名から作成する。
+    名前が分からない場合は、夏時間の無い地域であれば固定のオフセットを使い、それ以外はdateutilのtzlocalを使う
+    （tzlocalはpandasの変換が要素ごとになるため遅いが、time.localtimeと同じ結果となる）。
+
+    :return: ZoneInfo、datetime.timezone、またはdateutil.tz.tzlocalのインスタンス
+    """
+    name = os.environ.get('TZ')
+    if name is None:
+        link = os.path.realpath('/etc/localtime')
+        name = link.split('/zoneinfo/', 1)[1] if '/zoneinfo/' in link else None
+    if name:
+        try:
+            return zoneinfo.ZoneInfo(name.lstrip(':'))
+        except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+            pass
+    if not time.daylight:
+        return timezone(timedelta(seconds=-time.timezone))
+    return tz.tzlocal()
 
 
 class SlackManager:
-    def __init__(self, user_cache, max_retries=5, timeout=60, retry_interval=20):
+    def __init__(self, user_cache, max_retries=5, timeout=60, retry_interval=20, thread_workers=1, rate_limiter=None, response_store=None,
+                 base_url=None, metrics_registry=None, watchdog=None, history_shards=1, connection_pool_size=0, stats_store=None):
         """
         SlackManagerクラスの初期化メソッド。
         UserCacheインスタンスを受け取り、内部のプロパティとして保持します。
-        Slackトークンはファイルから読み込み、WebClient を初期化します。
+        Slackトークンはファイルから読み込み、トークンごとにWebClientとRateLimiterを初期化します。
 
         :param user_cache: UserCacheインスタンス
         :param max_retries: 最大リトライ回数
         :param timeout: タイムアウト時間（秒）
         :param retry_interval: リトライ間隔（秒）
+        :param thread_workers: スレッド返信を並列取得するワーカー数
+        :param rate_limiter: 1つ目のトークンのRateLimiterインスタンス（省略時は既定のティア設定で作成）
+        :param response_store: ResponseStoreインスタンス（オプション）。指定した場合、APIのレスポンスを記録または再生する
+        :param base_url: Slack Web APIのベースURL（オプション、ベンチマーク用の疑似サーバーなどに接続する場合に指定）
+        :param metrics_registry: Metricsインスタンス（省略時は新規に作成）
+        :param watchdog: RequestWatchdogインスタンス（省略時は新規に作成）
+        :param history_shards: チャネルの履歴を時間範囲に分割して同時に取得する数（1の場合はカーソルで順に取得する）
+        :param connection_pool_size: keep-alive接続を再利用する接続プールの最大接続数（0の場合はリクエストごとに接続する）
+        :param stats_store: StatsStoreインスタンス（オプション）。指定した場合、取得したメッセージとリアクションを集計する
         """
         self.user_cache = user_cache
-        self.client = WebClient(token=self.read_credential())
+        self.base_url = base_url
         self.max_retries = max_retries
         self.timeout = timeout
         self.retry_interval = retry_interval
-        self.rate_limit_wait_time = 0  # レート制限による追加待機時間
         self.logger = logger.Logger()
-        self.consecutive_success_count = 0  # 連続でレート制限に達しなかった回数をインスタンス変数として初期化
-
-    def retry_request(self, func, default_wait_time=0, *args, **kwargs):
+        # 全てのトークンのクライアントで共有する接続プール（トークンはリクエストヘッダーで送るため接続とは無関係）
+        self.connection_pool = None
+        if connection_pool_size:
+            if httpTransport.PooledWebClient.is_supported():
+                self.connection_pool = httpTransport.ConnectionPool(connection_pool_size)
+            else:
+                self.logger.view_log(f"Warning: the installed slack_sdk has no {httpTransport.PooledWebClient.TRANSPORT_HOOK}; "
+                                     "ignoring the connection pool and opening a new connection per request.")
+        # トークンごとのクライアントとレート制御（リクエストごとに呼び出し枠がすぐに空くトークンを選ぶ）
+        self.token_pool = tokenPool.TokenPool(self.read_credentials() or [None], self.create_client, rate_limiter=rate_limiter)
+        # 呼び出すAPIメソッドの指定に使うクライアント（retry_requestで選んだトークンのクライアントに付け替える）
+        self.client = self.token_pool.slots[0].client
+        self.rate_limiter = self.token_pool.slots[0].rate_limiter
+        self.thread_workers = thread_workers
+        self.history_shards = history_shards
+        self.incomplete_channels = set()  # 直近の履歴取得が途中で失敗したチャネルID
+        self.incomplete_threads = set()  # 直近の返信取得が途中で失敗した(チャネルID, thread_ts)
+        # 同じユーザーへの問い合わせを1回にまとめるためのロック。メンバーIDのハッシュで選ぶ固定数のロックを使い回し、ユーザー数に関わらず増えない
+        self._email_lookup_locks = [threading.Lock() for _ in range(EMAIL_LOOKUP_LOCK_STRIPES)]
+        self.response_store = response_store
+        self.stats_store = stats_store
+        self.metrics = metrics_registry or metrics.Metrics()  # APIの呼び出しと処理段階の集計
+        self.export_date = datetime.now().strftime('%Y-%m-%d')  # 出力データのexport_date（1回の実行で共通）
+        self.watchdog = watchdog or requestWatchdog.RequestWatchdog(self.logger)  # 送信中のリクエストの監視
+        self._attempt_clients = {}  # (トークンの順番, タイムアウト秒数) -> そのタイムアウトを設定したクライアントのコピー
+
+    def retry_request(self, func, tier, *args, **kwargs):
         """
         リトライ処理を共通化したメソッド。指定された関数をリトライ回数に基づいて実行する。
+        呼び出し前にティアのレート制御枠を取得し、レート制限に達した場合はRetry-Afterの秒数だけ
+        同じティアの全ての呼び出しを停止する。
 
         :param func: 実行する関数
-        :param default_wait_time: デフォルトの待ち時間（秒）
+        :param tier: レート制御のティア名（RateLimiter.DEFAULT_TIERSのキー）
         :param args: 関数に渡す引数
         :param kwargs: 関数に渡すキーワード引数
         :return: 関数の実行結果
         """
-        error_messages = []  # エラーメッセージをストックするリスト
-        
+        # 再生モードの場合は記録済みのレスポンスを返し、APIへのリクエストは行わない
+        if self.response_store is not None and self.response_store.replay:
+            return self.replay_response(func, kwargs)
 
-        # タイムアウト待機のアラートを表示する関数
-        def start_waiting_timer():
-            self.logger.view_api_result_waiting()
-            # タイマーを10秒ごとに再設定
-            self.waiting_timer = threading.Timer(10, start_waiting_timer)
-            self.waiting_timer.start()
+        error_messages = []  # エラーメッセージをストックするリスト
 
-        for attempt in range(1, self.max_retries + 1):
-            # タイマーを開始
-            self.waiting_timer = threading.Timer(10, start_waiting_timer)
-            self.waiting_timer.start()
+        method = func.__name__
+        # 試行回数はエラーによる再試行のみで数え、レート制限による待機と失効したトークンからの切り替えは別に数える
+        # （切り替えは使えるトークンが無くなるまで、待機はMAX_RATE_LIMIT_WAITS回まで行う）
+        attempt = 1
+        rate_limit_waits = 0
+        while attempt <= self.max_retries:
+            slot = self.token_pool.select(tier)
+            if slot is None:
+                error_messages.append(f"No usable token for {func.__name__}.")
+                break
+            # 選んだトークンのティアの呼び出し枠を取得してから監視を開始
+            self.metrics.record_wait(method, slot.rate_limiter.acquire(tier), 'ratelimit')
 
+            started_at = time.perf_counter()
             try:
-                self.client.timeout = self.timeout * attempt
-                time.sleep(default_wait_time+self.rate_limit_wait_time)
-
-                result = func(*args, **kwargs)
-                self.waiting_timer.cancel()  # 応答があればタイマーをキャンセル
-                self.consecutive_success_count += 1
-
-                # 100回連続で成功した場合、待ち時間を減少
-                if self.consecutive_success_count >= 50:
-                    self.rate_limit_wait_time = self.rate_limit_wait_time - 0.01
-                    self.logger.view_down_waiting_timer()  # 待ち時間を減らした場合のログ表示
-                    self.consecutive_success_count = 0
+                # 監視スレッドは応答待ちの表示を行い、期限を過ぎたリクエストは接続を切断して打ち切る
+                with self.request_scope() as scope, \
+                        self.watchdog.watch(method, timeout=self.timeout * attempt, on_expire=scope.abort if scope else None):
+                    result = self.bind_client(func, slot, attempt)(*args, **kwargs)
+                self.metrics.record_request(method, time.perf_counter() - started_at, response=result)
+                if self.response_store is not None:
+                    self.response_store.put(func.__name__, kwargs, result)
                 return result
 
             except SlackApiError as e:
-                self.waiting_timer.cancel()  # エラーが発生した場合もタイマーをキャンセル
+                self.metrics.record_request(method, time.perf_counter() - started_at, error=e.response['error'])
                 error_messages.append(f"Error in {func.__name__}: {e.response['error']}")
 
-                # レート制限に達した場合の処理
+                # レート制限に達した場合はRetry-Afterの秒数だけトークンのティアを停止し、すぐに再試行する（他のトークンが選ばれる）
                 if 'ratelimited' in e.response['error']:
-                    self.rate_limit_wait_time += 0.03
-                    self.logger.view_up_waiting_timer()  # 待ち時間を増やした場合のログ表示
-                    self.consecutive_success_count = 0  # 成功カウンターをリセット
+                    retry_after = rateLimiter.RateLimiter.parse_retry_after(e.response.headers)
+                    slot.rate_limiter.penalize(tier, retry_after)
+                    self.logger.view_up_waiting_timer()  # レート制限により待機する場合のログ表示
+                    rate_limit_waits += 1
+                    if rate_limit_waits > MAX_RATE_LIMIT_WAITS:
+                        break
+                    continue
+
+                # トークンが失効した場合は以降そのトークンを使わず、すぐに他のトークンで再試行する
+                if self.token_pool.is_revoked_error(e.response['error']):
+                    self.revoke_token(slot, e.response['error'])
+                    continue
 
             except Exception as e:
-                self.waiting_timer.cancel()
+                self.metrics.record_request(method, time.perf_counter() - started_at, error=e)
                 error_messages.append(f"Unexpected error in {func.__name__}: {e}")
 
             # リトライの進行状況を表示
             self.logger.view_api_retry()
+            if attempt == self.max_retries:
+                break
             time.sleep(self.retry_interval)
+            self.metrics.record_wait(method, self.retry_interval, 'retry')
+            attempt += 1
+            self.metrics.record_retry(method)
 
         # リトライが全て失敗した場合、エラーメッセージをまとめて表示
-        self.logger.view_log(f"Failed to execute {func.__name__} after {self.max_retries} attempts.")
+        self.metrics.record_failure(method)
+        self.logger.view_log(f"Failed to execute {func.__name__} after {attempt} attempts.")
         for error_message in error_messages:
             self.logger.view_log(error_message)
 
         return None
 
+    def create_client(self, token):
+        """
+        トークンを設定したAPIクライアントを作成する。接続プールを使う場合はPooledWebClientを作成する。
 
+        :param token: Slackのトークン
+        :return: WebClientインスタンス
+        """
+        client_options = {'base_url': self.base_url} if self.base_url else {}
+        if self.connection_pool is not None:
+            return httpTransport.PooledWebClient(token=token, timeout=self.timeout, connection_pool=self.connection_pool, **client_options)
+        return WebClient(token=token, timeout=self.timeout, **client_options)
 
+    def request_scope(self):
+        """
+        1回の試行のリクエストを期限切れの際に中断するためのRequestScopeを返すコンテキストマネージャーを作成する。
+        接続プールを使わない場合は中断できないため、クライアントのタイムアウト（ソケットの操作ごとの期限）のみで打ち切る。
 
+        :return: ConnectionPool.request_scope（接続プールを使わない場合はNoneを返すコンテキストマネージャー）
+        """
+        if self.connection_pool is None:
+            return contextlib.nullcontext()
+        return self.connection_pool.request_scope()
+
+    def close(self):
+        """
+        接続プールの待機中の接続を閉じ、リクエストの監視スレッドを停止する。
+        """
+        if self.connection_pool is not None:
+            self.connection_pool.close()
+        self.watchdog.stop()
+
+    def bind_client(self, func, slot, attempt):
+        """
+        APIクライアントのメソッドを、選んだトークンのクライアントで試行回数に応じたタイムアウト（timeout * attempt）を
+        設定したもののメソッドに付け替える。
+        共有しているクライアントのtimeoutは変更せず、トークンと試行回数ごとにタイムアウトだけが異なるクライアントのコピーを使う。
+
+        :param func: APIクライアントのメソッド
+        :param slot: リクエストに使うトークンのTokenSlot
+        :param attempt: 試行回数（1始まり）
+        :return: 付け替えたメソッド（APIクライアントのメソッドでない場合はそのまま）
+        """
+        if getattr(func, '__self__', None) is not self.client:
+            return func
+        timeout = self.timeout * attempt
+        client = self._attempt_clients.get((slot.index, timeout))
+        if client is None:
+            client = copy.copy(slot.client)
+            client.timeout = timeout
+            client = self._attempt_clients.setdefault((slot.index, timeout), client)
+        return getattr(client, func.__name__)
+
+    def revoke_token(self, slot, error):
+        """
+        失効したトークンを以降のリクエストで使わないようにする。
+
+        :param slot: 失効したトークンのTokenSlot
+        :param error: Slack APIのエラーコード
+        """
+        if self.token_pool.revoke(slot):
+            remaining = len(self.token_pool.active_slots)
+            self.logger.view_log(f"{slot.label} was rejected ({error}) and will not be used any more. {remaining} token(s) left.")
 
+    def replay_response(self, func, params):
+        """
+        記録済みのレスポンスを返す。記録されていない場合は取得に失敗したものとして扱う。
 
+        :param func: 呼び出すはずだった関数
+        :param params: 関数に渡すキーワード引数
+        :return: レスポンスの辞書（記録されていない場合はNone）
+        """
+        response = self.response_store.get(func.__name__, params)
+        if response is None:
+            self.logger.view_log(f"No recorded response for {func.__name__} {params}")
+        return response
 
-    def fetch_conversations_history(self, channel_id, cursor=None):
+    def fetch_conversations_history(self, channel_id, cursor=None, oldest=None, latest=None, inclusive=None):
         """
         Slack APIのconversations_historyメソッドをリトライ機能付きで呼び出す。
 
         :param channel_id: チャンネルID
         :param cursor: ページング用のカーソル
+        :param oldest: このタイムスタンプより新しいメッセージのみ取得する（オプション）
+        :param latest: このタイムスタンプより古いメッセージのみ取得する（オプション）
+        :param inclusive: Trueの場合、oldestとlatestのタイムスタンプのメッセージも含める（オプション）
         :return: APIレスポンスデータ
         """
-        return self.retry_request(func=self.client.conversations_history,default_wait_time=60/50,channel=channel_id, cursor=cursor, limit=1000)
+        return self.retry_request(func=self.client.conversations_history, tier='history', channel=channel_id, cursor=cursor, oldest=oldest,
+                                  latest=latest, inclusive=inclusive, limit=1000)
+
+    def fetch_history_window(self, channel_id, window):
+        """
+        時間範囲の最初の1ページを取得する。ワーカースレッドから呼び出される。
 
-    def fetch_conversations_replies(self, channel_id, thread_ts):
+        :param channel_id: チャンネルID
+        :param window: HistoryWindowインスタンス
+        :return: APIレスポンスデータ
+        """
+        self.logger.view_message_access()
+        return self.fetch_conversations_history(channel_id, **window.params())
+
+    def fetch_conversations_replies(self, channel_id, thread_ts, cursor=None):
         """
         Slack APIのconversations_repliesメソッドをリトライ機能付きで呼び出す。
 
         :param channel_id: チャンネルID
         :param thread_ts: スレッドタイムスタンプ
+        :param cursor: ページング用のカーソル
         :return: APIレスポンスデータ
         """
-        return self.retry_request(func=self.client.conversations_replies,default_wait_time=60/50, channel=channel_id, ts=thread_ts, limit=1000)
+        return self.retry_request(func=self.client.conversations_replies, tier='replies', channel=channel_id, ts=thread_ts, cursor=cursor, limit=1000)
 
     def get_user_email(self, member_id):
         """
@@ -128,32 +341,75 @@ class SlackManager:
         :return: メールアドレス、または "this account seems to be a bot"
         """
         # キャッシュ内のユーザーを確認
-        cached_user = next((user for user in self.user_cache.valid_users if user['user_id'] == member_id), None)
-        if cached_user:
-            return cached_user['email']
-
-        # APIから取得
-        self.logger.view_email_api_access()  # メールアドレス問い合わせのためのAPIアクセスを表示
-        response = self.retry_request(func=self.client.users_info,default_wait_time=60/100, user=member_id)
-        if response:
-            user_info = response['user']
-            email = user_info.get('profile', {}).get('email')
-
-            # メールアドレスをキャッシュに保存
-            if email:
-                self.user_cache.add_user(member_id, email)
-            else:
-                email = "this account seems to be a bot"
+        cached_email = self.user_cache.get(member_id)
+        if cached_email:
+            return cached_email
+
+        # 複数のワーカーが同じユーザーを同時に問い合わせないよう、ユーザーに対応するロックを取得してからキャッシュを再確認
+        lookup_lock = self._email_lookup_locks[hash(member_id) % len(self._email_lookup_locks)]
+        with lookup_lock:
+            cached_email = self.user_cache.get(member_id)
+            if cached_email:
+                return cached_email
+
+            # APIから取得
+            self.logger.view_email_api_access()  # メールアドレス問い合わせのためのAPIアクセスを表示
+            with self.metrics.stage('email_resolution'):
+                response = self.retry_request(func=self.client.users_info, tier='users_info', user=member_id)
+            if response:
+                # メールアドレスをキャッシュに保存
+                email = self.extract_email(response['user'])
                 self.user_cache.add_user(member_id, email)
+                return email
+
+            # 取得に失敗した場合も "this account seems to be a bot" として保存
+            email = "this account seems to be a bot"
+            self.user_cache.add_user(member_id, email)
             return email
 
-        # 取得に失敗した場合も "this account seems to be a bot" として保存
-        email = "this account seems to be a bot"
-        self.user_cache.add_user(member_id, email)
-        return email
 
 
 
+    @staticmethod
+    def extract_email(user_info):
+        """
+        users.info / users.list のユーザー情報からメールアドレスを取り出す。
+        メールアドレスが無い場合は "this account seems to be a bot" を返す。
+
+        :param user_info: APIレスポンスのユーザー情報
+        :return: メールアドレス、または "this account seems to be a bot"
+        """
+        email = user_info.get('profile', {}).get('email')
+        return email if email else "this account seems to be a bot"
+
+    def prefetch_user_directory(self):
+        """
+        users.listをページングしてワークスペースのユーザー一覧を取得し、
+        メールアドレスをUserCacheへ一括で登録する。
+        ここで取得できなかったユーザーのみ、get_user_emailでusers.infoにより個別に取得される。
+
+        :return: キャッシュに登録したユーザー数
+        """
+        self.logger.view_log("Prefetching user directory via users.list...")
+        total = 0
+        cursor = None
+
+        while True:
+            self.logger.view_email_api_access()
+            response = self.retry_request(func=self.client.users_list, tier='users_list', cursor=cursor, limit=1000)
+            if response is None:
+                break
+
+            users = [(user['id'], self.extract_email(user)) for user in response['members']]
+            total += self.user_cache.add_users(users)
+
+            # 次のページがあるかを確認
+            cursor = response.get('response_metadata', {}).get('next_cursor', None)
+            if not cursor:
+                break
+
+        self.logger.view_log(f"Prefetched {total} users from user directory.")
+        return total
 
     def read_credential(self, file_path='./input/token.csv'):
         """
@@ -162,16 +418,27 @@ class SlackManager:
         :param file_path: クレデンシャルを読み込むファイルのパス（デフォルトは 'creds.txt'）
         :return: ファイルの1行目の内容を文字列で返す
         """
+        tokens = self.read_credentials(file_path)
+        return tokens[0] if tokens else None
+
+    def read_credentials(self, file_path='./input/token.csv'):
+        """
+        トークンファイルの全ての行を読み取り、トークンのリストとして返すメソッド。
+        空行と重複したトークンは除く。
+
+        :param file_path: クレデンシャルを読み込むファイルのパス
+        :return: トークンのリスト（ファイルが読み込めない場合は空のリスト）
+        """
         try:
             with open(file_path, 'r') as file:
-                first_line = file.readline().strip()  # 1行目を読み取り、前後の空白や改行を削除
-            return first_line
+                lines = [line.strip() for line in file]  # 各行の前後の空白や改行を削除
+            return list(dict.fromkeys(line for line in lines if line))
         except FileNotFoundError:
             self.logger.view_log(f"Error: The file {file_path} was not found.")
-            return None
+            return []
         except Exception as e:
             self.logger.view_log(f"An error occurred: {e}")
-            return None
+            return []
 
     def get_all_members(self, channel_id):
         """
@@ -184,18 +451,16 @@ class SlackManager:
         cursor = None  # ページング用のカーソル
 
         while True:
-            try:
-                # チャンネルの参加者リストを取得（ページング対応）
-                response = self.client.conversations_members(channel=channel_id, cursor=cursor, limit=1000)
-                members.extend(response['members'])  # メンバーIDをリストに追加
-
-                # 次のページがあるかを確認
-                cursor = response.get('response_metadata', {}).get('next_cursor', None)
-                if not cursor:  # 次のページがなければ終了
-                    break
+            # チャンネルの参加者リストを取得（ページング対応）
+            response = self.retry_request(func=self.client.conversations_members, tier='members', channel=channel_id, cursor=cursor, limit=1000)
+            if response is None:
+                self.logger.view_log(f"Error fetching members for channel {channel_id}")
+                break
+            members.extend(response['members'])  # メンバーIDをリストに追加
 
-            except SlackApiError as e:
-                self.logger.view_log(f"Error fetching members: {e.response['error']}")
+            # 次のページがあるかを確認
+            cursor = response.get('response_metadata', {}).get('next_cursor', None)
+            if not cursor:  # 次のページがなければ終了
                 break
 
         return members
@@ -234,125 +499,401 @@ class SlackManager:
         return df
 
         
-    def get_all_messages(self, channel_id: str, get_thread_date_length=300):
+    def get_all_messages(self, channel_id: str, get_thread_date_length=300, oldest=None, thread_state=None):
         """
         チャネルのメッセージ一覧を取得し、スレッド内のメッセージも含める。
-        メッセージはページごとにロードされ、各ページとスレッド内のデータのロード進捗をログに出力する。
+        iter_message_batchesの結果を1つのDataFrameにまとめて返す。
 
         :param channel_id: チャンネルID
         :param get_thread_date_length: スレッドデータ取得の期間（日数）
+        :param oldest: このタイムスタンプより新しいメッセージのみ取得する（オプション、差分取得用）
+        :param thread_state: thread_ts -> {'reply_count', 'latest_reply'} の辞書（オプション、差分取得用）。
+            指定した場合、前回から返信が変化していないスレッドは取得をスキップし、取得したスレッドの状態で辞書を更新する
         :return: DataFrame（カラム: type, user, team, text, ts, thread_ts, react, datetime, email, channel_id, export_date）
         """
+        batches = list(self.iter_message_batches(channel_id, get_thread_date_length, oldest, thread_state))
+        if not batches:
+            return pd.DataFrame(columns=MESSAGE_COLUMNS)
+        return pd.concat(batches, ignore_index=True)
+
+    def iter_message_batches(self, channel_id: str, get_thread_date_length=300, oldest=None, thread_state=None, checkpoint=None):
+        """
+        チャネルのメッセージを履歴1ページ分ずつ整形し、スレッド内のメッセージも含めたDataFrameとして順に返すジェネレーター。
+        ページごとに処理を完結させるため、チャネルの大きさに関わらずメモリ使用量は1ページ分に抑えられる。
+        各ページとスレッド内のデータのロード進捗をログに出力する。
+
+        :param channel_id: チャンネルID
+        :param get_thread_date_length: スレッドデータ取得の期間（日数）
+        :param oldest: このタイムスタンプより新しいメッセージのみ取得する（オプション、差分取得用）
+        :param thread_state: thread_ts -> {'reply_count', 'latest_reply'} の辞書（オプション、差分取得用）
+        :param checkpoint: ExportCheckpointインスタンス（オプション）。
+            指定した場合、前回の実行で処理済みのページの続きから取得を再開し、呼び出し側がページを書き込むたびに再開位置と取得したスレッドを保存する
+        :return: ページごとのDataFrame（カラムはget_all_messagesと同じ）を返すジェネレーター
+        """
         # チャネル名の取得
         channel_name = channel_id
         self.logger.view_log(f"Start fetching messages for channel '{channel_name}'")
 
-        # メッセージの取得
-        messages = self.fetch_channel_messages(channel_id)
-        total_messages = len(messages)  # メッセージの総数をカウント
+        total_messages = 0  # メッセージの総数をカウント
+
+        # 現在の日付からのスレッド取得期間の計算
+        thread_cutoff_ts = (datetime.now() - timedelta(days=get_thread_date_length)).timestamp()
+
+        # 履歴に含まれたスレッドの返信の(ts, thread_ts)。後のページでスレッドから同じ返信を取得した場合に除く
+        seen = set()
+
+        # 前回の実行で処理済みのページは出力ファイルに書き込み済みのため、続きのカーソルから取得を再開する
+        cursor = latest = None
+        if checkpoint is not None:
+            if checkpoint.pages:
+                self.logger.view_log(f"Resuming channel '{channel_name}' from checkpoint ({checkpoint.pages} pages)")
+            seen.update(checkpoint.reply_keys)
+            self.start_channel_stats(channel_id, checkpoint.run_id)
+            if checkpoint.finished:
+                return
+            cursor, latest = checkpoint.cursor, checkpoint.latest
+        else:
+            self.start_channel_stats(channel_id)
+
+        with ThreadPoolExecutor(max_workers=self.thread_workers) as executor:
+            for messages, next_cursor in self.iter_history_page_sources(channel_id, oldest, cursor, latest):
+                total_messages += len(messages)
+
+                # スレッドメッセージの取得を先にワーカーへ任せ、その間にページのメッセージを整形する
+                parents = self.select_thread_parents(messages, thread_cutoff_ts, thread_state)
+                thread_futures = {}
+                for index, parent in parents:
+                    if checkpoint is not None and checkpoint.has_thread(parent['thread_ts']):
+                        # 中断前に取得済みのスレッドは保存した行を使う
+                        future = Future()
+                        future.set_result(checkpoint.load_thread(parent['thread_ts']))
+                    else:
+                        future = executor.submit(self.fetch_thread_rows, channel_id, parent['thread_ts'], checkpoint)
+                    thread_futures[parent['ts']] = future
+
+                page_columns = self.normalize_columns(messages, channel_id)
+                thread_columns = {thread_ts: future.result() for thread_ts, future in thread_futures.items()}
+                batch = self._assemble_page(page_columns, parents, thread_columns, channel_id, thread_state, seen)
+                self.record_stats(channel_id, batch)
+                yield batch
+                # 呼び出し側がページを出力に書き込んだ後に、出力の書き込み位置と次に取得するカーソルを保存する
+                if checkpoint is not None:
+                    checkpoint.save_page(next_cursor, self.oldest_ts(messages), seen, self.stats_run_id)
+
         self.logger.view_log(f"Total {total_messages} messages fetched for channel '{channel_name}'")
+        self.logger.view_log(f"Finished fetching messages for channel '{channel_name}'")
 
-        data = []
+    def select_thread_parents(self, messages, thread_cutoff_ts, thread_state=None):
+        """
+        ページのメッセージのうち、返信を取得するスレッドの親メッセージを選ぶ。
+        スレッド取得期間より前のメッセージ、返信が無いスレッド、前回から返信が変化していないスレッドは対象外とする。
 
-        # 現在の日付からのスレッド取得期間の計算
-        thread_cutoff_date = datetime.now() - timedelta(days=get_thread_date_length)
+        :param messages: conversations_historyのメッセージのリスト
+        :param thread_cutoff_ts: スレッドを取得する最も古いタイムスタンプ（UNIX時間）
+        :param thread_state: thread_ts -> {'reply_count', 'latest_reply'} の辞書（オプション）
+        :return: (ページ内の位置, 親メッセージ) のリスト
+        """
+        return [
+            (index, message) for index, message in enumerate(messages)
+            if not ('ts' in message and float(message['ts']) < thread_cutoff_ts) and self.is_thread_changed(message, thread_state)
+        ]
 
-        # メインメッセージの取得
-        for i, message in enumerate(messages, 1):
-            # メッセージの日付を取得
-            message_datetime = datetime.fromtimestamp(float(message['ts'])) if 'ts' in message else None
+    def _assemble_page(self, page_columns, parents, thread_columns, channel_id, thread_state, seen):
+        """
+        整形済みのページのメッセージと各スレッドの返信を、親メッセージの直後に返信が並ぶよう結合する。
+        行は列ごとのリストのまま結合し、(ts, thread_ts)が取得済みの行は追加する時点で除く。
+        DataFrameはページごとに最後に1回だけ作成する。
+        履歴に含まれるスレッドの返信（チャンネルにも投稿された返信）は、親メッセージより新しいため前のページに現れることがある。
+        そのキーのみseenに残し、後のページで同じ返信をスレッドから取得した場合にも除く。
+
+        :param page_columns: normalize_columnsで整形したページの列の辞書
+        :param parents: select_thread_parentsが返した (ページ内の位置, 親メッセージ) のリスト
+        :param thread_columns: 親メッセージのts -> スレッドの返信の列の辞書
+        :param channel_id: チャンネルID
+        :param thread_state: thread_ts -> {'reply_count', 'latest_reply'} の辞書（オプション）
+        :param seen: 前のページまでの履歴に含まれたスレッドの返信の(ts, thread_ts)の集合（このページの分を加える）
+        :return: 重複を除いたDataFrame
+        """
+        rows = {column: [] for column in MESSAGE_COLUMNS}
+        page_seen = set()  # このページに追加した行の(ts, thread_ts)
+
+        def append(columns, start, stop, from_history=False):
+            # 取得済みでない行のみを追加する
+            ts, thread_ts = columns['ts'], columns['thread_ts']
+            keep = []
+            for position in range(start, stop):
+                key = (ts[position], thread_ts[position])
+                if key in page_seen or key in seen:
+                    continue
+                page_seen.add(key)
+                keep.append(position)
+                if from_history and key[1] is not None and key[1] != key[0]:
+                    seen.add(key)
+            if len(keep) == stop - start:
+                for column in MESSAGE_COLUMNS:
+                    rows[column].extend(columns[column][start:stop])
+            else:
+                for column in MESSAGE_COLUMNS:
+                    values = columns[column]
+                    rows[column].extend(values[position] for position in keep)
+
+        start = 0
+        for index, parent in parents:
+            thread = self.as_message_columns(thread_columns[parent['ts']])
+            append(page_columns, start, index + 1, from_history=True)
+            append(thread, 0, len(thread['ts']))
+            start = index + 1
+
+            # 全ての返信を取得できたスレッドのみ状態を更新する
+            if thread_state is not None and (channel_id, parent['ts']) not in self.incomplete_threads:
+                thread_state[parent['ts']] = {
+                    'reply_count': parent.get('reply_count'),
+                    'latest_reply': parent.get('latest_reply')
+                }
+        append(page_columns, start, len(page_columns['ts']), from_history=True)
+        return pd.DataFrame(rows, columns=MESSAGE_COLUMNS)
+
+    def record_stats(self, channel_id, batch):
+        """
+        ページのメッセージとリアクションをstats_storeの集計に反映する。列を1回走査して寄与をまとめ、ページごとに1回書き込む。
+        リアクションはconvert_messages_to_react_dataと同じく、メッセージ・スタンプ・ユーザーの組ごとに1件と数える。
 
-            # メッセージの処理
-            self.process_message(data, message, channel_id)
+        :param channel_id: チャンネルID
+        :param batch: iter_message_batchesが返すページのDataFrame
+        """
+        if self.stats_store is None or batch.empty:
+            return
+        messages = []
+        for ts, thread_ts, user, react in zip(batch['ts'], batch['thread_ts'], batch['user'], batch['react']):
+            reactions = [
+                (reaction.get('name'), reactor)
+                for reaction in (self.parse_reactions(react, ts) if isinstance(react, (list, str)) else [])
+                for reactor in reaction.get('users', [])
+            ]
+            messages.append((ts, thread_ts, user, reactions))
+        with self.metrics.stage('stats'):
+            self.stats_store.record(channel_id, messages)
+
+    @property
+    def stats_run_id(self):
+        """stats_storeの実行の識別子（stats_storeを指定していない場合はNone）"""
+        return self.stats_store.run_id if self.stats_store is not None else None
+
+    def start_channel_stats(self, channel_id, run_id=None):
+        """
+        チャネルの取得を始める際に、stats_storeのチャネルの集計をこの実行が引き受ける。
+        チェックポイントから再開する場合は、中断前の実行で集計した処理済みのページの寄与をこの実行で受け取ったものとして引き継ぐ。
+        処理済みのページは取得し直さないため、引き継がないとfinish_channel_statsで除かれてしまう。
 
-            # messageのdatetimeが動作時の日付のget_thread_date_length日より前ならスレッド内のデータは取らない
-            if message_datetime and message_datetime < thread_cutoff_date:
-                ##self.logger.view_log(f"Skipping threads for message dated {message_datetime} in channel '{channel_name}' (older than {get_thread_date_length} days).")
-                continue  # スレッドの取得をスキップ
+        :param channel_id: チャンネルID
+        :param run_id: 中断前の実行のstats_storeの実行の識別子（オプション、チェックポイントから再開する場合）
+        """
+        if self.stats_store is None:
+            return
+        with self.metrics.stage('stats'):
+            if run_id is None:
+                self.stats_store.claim_channel(channel_id)
+            else:
+                self.stats_store.adopt_channel(channel_id, run_id)
 
-            # スレッドメッセージの取得
-            if 'thread_ts' in message and message['thread_ts'] == message['ts']:
-                thread_ts = message['thread_ts']
-                thread_messages = self.fetch_thread_messages(channel_id, thread_ts)
+    def finish_channel_stats(self, channel_id):
+        """
+        チャネルの全履歴の取得が完了した後に、今回受け取らなかったメッセージの寄与をstats_storeの集計から除く。
 
-                for thread_message in thread_messages:
-                    #self.logger.view_thread_access()  # 各スレッドメッセージの取得を示す
-                    self.process_message(data, thread_message, channel_id, thread_ts)
+        :param channel_id: チャンネルID
+        """
+        if self.stats_store is None:
+            return
+        with self.metrics.stage('stats'):
+            pruned = self.stats_store.prune_channel(channel_id)
+        if pruned is None:
+            self.logger.view_log(f"Skipped pruning the stats of channel '{channel_id}': another worker has taken it over")
+        elif pruned:
+            self.logger.view_log(f"Removed {pruned} messages no longer in channel '{channel_id}' from the stats")
 
-        # DataFrameに変換
-        df = pd.DataFrame(data, columns=['type', 'user', 'team', 'text', 'ts', 'thread_ts', 'react', 'datetime', 'email', 'channel_id', 'export_date'])
-        self.logger.view_log(f"Finished fetching messages for channel '{channel_name}'")
-        return df.drop_duplicates()
+    @staticmethod
+    def as_message_columns(rows):
+        """
+        スレッドの行を列ごとのリストの辞書に揃える。
+        以前の形式のチェックポイントに保存されたDataFrameや行の辞書のリストも変換する。
 
-    def clean_string(self, value):
+        :param rows: 列の辞書、DataFrame、または行の辞書のリスト
+        :return: 列名 -> 値のリスト の辞書
+        """
+        if isinstance(rows, pd.DataFrame):
+            values = rows.astype(object)
+            values = values.where(values.notna(), None)
+            return {column: values[column].tolist() for column in MESSAGE_COLUMNS}
+        if isinstance(rows, list):
+            return {column: [row.get(column) for row in rows] for column in MESSAGE_COLUMNS}
+        return rows
+
+    @staticmethod
+    def clean_text(value):
         """
-        Excelで使用できない文字を除去する関数。
+        Excelで使用できない文字（str.isprintableがFalseとなる文字）を除去する。
+        大半のテキストはそのまま返し、それ以外は正規表現で一度に除去する。
 
         :param value: 文字列
         :return: クリーンアップされた文字列
         """
-        if isinstance(value, str):
-            # Excelで使用できない特殊文字を除去
-            return ''.join(c for c in value if c.isprintable())
-        return value
+        if not isinstance(value, str) or value.isprintable():
+            return value
+        value = non_printable_pattern().sub('', value)
+        if value.isprintable():
+            return value
+        # 正規表現の対象外の文字（未割り当ての文字など）が残る場合のみ1文字ずつ判定する
+        return ''.join(c for c in value if c.isprintable())
 
-    def process_message(self, data, message, channel_id, thread_ts=None):
+    @staticmethod
+    def format_timestamps(timestamps):
         """
-        メッセージデータを整形してリストに追加する。
+        Slackのタイムスタンプをローカル時刻の 'YYYY-mm-dd HH:MM:SS' 形式の文字列にまとめて変換する。
+        列全体をdatetime64としてlocal_timezoneに一括変換する。dt.strftimeは要素ごとの処理となり遅いため、
+        書式化はnumpyのISO形式の文字列化で行う。
 
-        :param data: メッセージデータを格納するリスト
-        :param message: メッセージデータ
-        :param channel_id: チャンネルID
-        :param thread_ts: スレッドタイムスタンプ（オプション）
+        :param timestamps: タイムスタンプ文字列のリスト（Noneを含んでもよい）
+        :return: 変換後の文字列のリスト（タイムスタンプが無い場合はNone）
         """
-        user = message.get('user')
-        email = self.get_user_email(user) if user else None
-        reacts = str(message.get('reactions')) if 'reactions' in message else None  # リアクションを文字列に変換して保存
-
-        data.append({
-            'type': message.get('type'),
-            'user': user,
-            'team': message.get('team'),
-            'text': self.clean_string(message.get('text')),  # 'text'のみクリーンアップ
-            'ts': message.get('ts'),
-            'thread_ts': thread_ts or message.get('thread_ts'),
-            'react': reacts,
-            'datetime': datetime.fromtimestamp(float(message.get('ts', 0))).strftime('%Y-%m-%d %H:%M:%S') if message.get('ts') else None,
-            'email': email,
-            'channel_id': channel_id,
-            'export_date': datetime.now().strftime('%Y-%m-%d')
-        })
-
+        values = list(timestamps)
+        if not values:
+            return []
+        # 秒未満を切り捨て、UTCからローカル時刻に変換する（空の値はNaTとなる）
+        seconds = np.floor(pd.to_numeric(pd.Series(values, dtype=object), errors='coerce'))
+        local = pd.to_datetime(seconds, unit='s', utc=True).dt.tz_convert(local_timezone()).dt.tz_localize(None)
+        formatted = np.char.replace(np.datetime_as_string(local.to_numpy().astype('datetime64[s]'), unit='s'), 'T', ' ')
+        return np.where(local.notna().to_numpy(), formatted.astype(object), None).tolist()
+
+    def normalize_columns(self, messages, channel_id, thread_ts=None):
+        """
+        メッセージのリストを整形し、MESSAGE_COLUMNSの列ごとの値のリストにまとめる。
+        メールアドレスはページ内のユーザーごとに1回だけ解決する。
 
+        :param messages: APIレスポンスのメッセージのリスト
+        :param channel_id: チャンネルID
+        :param thread_ts: スレッドタイムスタンプ（オプション、スレッドの返信の場合に指定）
+        :return: 列名 -> 値のリスト の辞書
+        """
+        users = [message.get('user') for message in messages]
+        emails = {user: self.get_user_email(user) for user in dict.fromkeys(users) if user}
+        timestamps = [message.get('ts') for message in messages]
+
+        return {
+            'type': [message.get('type') for message in messages],
+            'user': users,
+            'team': [message.get('team') for message in messages],
+            'text': [self.clean_text(message.get('text')) for message in messages],  # 'text'のみクリーンアップ
+            'ts': timestamps,
+            'thread_ts': [thread_ts or message.get('thread_ts') for message in messages],
+            'react': [message.get('reactions') for message in messages],  # リアクションはAPIレスポンスのリストのまま保持
+            'datetime': self.format_timestamps(timestamps),
+            'email': [emails.get(user) if user else None for user in users],
+            'channel_id': [channel_id] * len(messages),
+            'export_date': [self.export_date] * len(messages),
+        }
+
+    def iter_history_page_sources(self, channel_id: str, oldest=None, cursor=None, latest=None):
+        """
+        history_shardsの設定に応じて、カーソルで順に取得するか時間範囲に分割して取得するかを選び、
+        (メッセージのリスト, 次のページのカーソル) を返すジェネレーターを返す。
+        チェックポイントのカーソルは順に取得した場合のみ記録されるため、カーソルから再開する場合は分割しない。
 
+        :param channel_id: チャンネルID
+        :param oldest: このタイムスタンプより新しいメッセージのみ取得する（オプション）
+        :param cursor: 取得を開始するカーソル（オプション、チェックポイントからの再開用）
+        :param latest: このタイムスタンプより古いメッセージのみ取得する（オプション、チェックポイントからの再開用）
+        :return: iter_history_page_cursorsまたはiter_history_page_windowsのジェネレーター
+        """
+        if self.history_shards > 1 and (latest is not None or cursor is None):
+            return self.iter_history_page_windows(channel_id, oldest, latest)
+        return self.iter_history_page_cursors(channel_id, oldest, cursor, None if cursor else latest)
 
-    def fetch_channel_messages(self, channel_id: str):
+    def iter_history_page_cursors(self, channel_id: str, oldest=None, cursor=None, latest=None):
         """
-        指定されたチャネルのメインメッセージを全て取得する。
-        各ページのロード時にログを出力。
+        メインメッセージを1ページずつ、次のページのカーソルとあわせて返すジェネレーター。
+        チェックポイントからの再開に使う。
 
         :param channel_id: チャンネルID
-        :return: メッセージのリスト
+        :param oldest: このタイムスタンプより新しいメッセージのみ取得する（オプション）
+        :param cursor: 取得を開始するカーソル（オプション、省略時は最初のページから）
+        :param latest: このタイムスタンプより古いメッセージのみ取得する（オプション）
+        :return: (メッセージのリスト, 次のページのカーソル) を返すジェネレーター（最後のページのカーソルはNone）
         """
-        messages = []
-        cursor = None
         page = 1
+        self.incomplete_channels.discard(channel_id)
 
         while True:
             self.logger.view_message_access()
-            response = self.fetch_conversations_history(channel_id, cursor)
+            response = self.fetch_conversations_history(channel_id, cursor, oldest, latest)
             if response is None:
+                # 取得に失敗したページ以降は欠落するため、差分取得の状態を進めないよう記録する
+                self.incomplete_channels.add(channel_id)
                 break
-            messages.extend(response['messages'])
-
             # 次のページがあるかを確認
             cursor = response.get('response_metadata', {}).get('next_cursor', None)
+            yield response['messages'], cursor or None
             if not cursor:
                 break
 
             page += 1
 
-        return messages
+    def iter_history_page_windows(self, channel_id: str, oldest=None, latest=None):
+        """
+        iter_history_page_cursorsと同様にメインメッセージを新しい順にページ単位で返すジェネレーター。
+        履歴を時間範囲に分割し、最大history_shards個の範囲をワーカーで同時に取得する（分割の方法はHistoryWindowPlanを参照）。
+        範囲の端で重複したメッセージは除き、全体としてカーソルで順に取得した場合と同じメッセージを同じ順序で返す。
+        カーソルの代わりに、次のページがある場合はTrue、最後のページの場合はNoneを返す。
+
+        :param channel_id: チャンネルID
+        :param oldest: このタイムスタンプより新しいメッセージのみ取得する（オプション）
+        :param latest: このタイムスタンプより古いメッセージのみ取得する（オプション、チェックポイントからの再開用）
+        :return: (メッセージのリスト, 次のページの有無) を返すジェネレーター
+        """
+        self.incomplete_channels.discard(channel_id)
+        plan = historyWindows.HistoryWindowPlan(self.history_shards, oldest, latest)
+        futures = {}
+        previous = None  # 次のページの有無が分かるまで返さずに保持するページ
+
+        with ThreadPoolExecutor(max_workers=self.history_shards) as executor:
+            try:
+                while not plan.finished:
+                    for window in plan.windows_to_start():
+                        futures[window] = executor.submit(self.fetch_history_window, channel_id, window)
+                    window = plan.next_window()
+                    response = futures.pop(window).result()
+                    if response is None:
+                        # 取得に失敗した範囲以降は欠落するため、差分取得の状態を進めないよう記録する
+                        self.incomplete_channels.add(channel_id)
+                        break
+                    try:
+                        messages = plan.merge(window, response)
+                    except ValueError as e:
+                        self.logger.view_log(f"Error in conversations_history for {channel_id}: {e}")
+                        self.incomplete_channels.add(channel_id)
+                        break
+                    if messages:
+                        if previous is not None:
+                            yield previous, True
+                        previous = messages
+            finally:
+                for future in futures.values():
+                    future.cancel()
+
+        if previous is not None:
+            yield previous, None if plan.finished else True
+        elif plan.finished:
+            yield [], None
+
+    @staticmethod
+    def oldest_ts(messages):
+        """
+        ページの最も古いメッセージのタイムスタンプを返す。チェックポイントからの再開位置として記録する。
+
+        :param messages: conversations_historyのメッセージのリスト
+        :return: タイムスタンプの文字列（メッセージが無い場合はNone）
+        """
+        timestamps = [message['ts'] for message in messages if 'ts' in message]
+        return min(timestamps, key=historyWindows.parse_ts) if timestamps else None
 
     def fetch_thread_messages(self, channel_id: str, thread_ts: str):
         """
@@ -366,11 +907,13 @@ class SlackManager:
         thread_messages = []
         thread_cursor = None
         thread_page = 1
+        self.incomplete_threads.discard((channel_id, thread_ts))
 
         while True:
             self.logger.view_thread_access()
-            response = self.fetch_conversations_replies(channel_id, thread_ts)
+            response = self.fetch_conversations_replies(channel_id, thread_ts, thread_cursor)
             if response is None:
+                self.incomplete_threads.add((channel_id, thread_ts))
                 break
             thread_messages.extend(response['messages'])
 
@@ -383,49 +926,152 @@ class SlackManager:
 
         return thread_messages
 
+    def fetch_thread_parent(self, channel_id: str, thread_ts: str):
+        """
+        スレッドの親メッセージのみを取得する。返信数と最終返信時刻から、返信が変化したかを確認するために使う。
+
+        :param channel_id: チャンネルID
+        :param thread_ts: スレッドタイムスタンプ
+        :return: 親メッセージ（取得できなかった場合はNone）
+        """
+        response = self.retry_request(func=self.client.conversations_replies, tier='replies', channel=channel_id, ts=thread_ts, limit=1)
+        if response is None or not response['messages']:
+            return None
+        return response['messages'][0]
+
+    @staticmethod
+    def refresh_candidates(thread_state, thread_cutoff_ts, until):
+        """
+        差分取得で返信の変化を確認するスレッドを選ぶ。
+        スレッド取得期間内で、今回の履歴の取得範囲（untilより新しいメッセージ）に含まれないスレッドの親が対象となる。
+
+        :param thread_state: thread_ts -> {'reply_count', 'latest_reply'} の辞書
+        :param thread_cutoff_ts: スレッドを取得する最も古いタイムスタンプ（UNIX時間）
+        :param until: 今回の履歴の取得範囲の下端のタイムスタンプ
+        :return: thread_tsのリスト（新しい順）
+        """
+        return sorted((thread_ts for thread_ts in thread_state if thread_cutoff_ts <= float(thread_ts) <= float(until)),
+                      key=float, reverse=True)
+
+    def refresh_threads(self, channel_id: str, get_thread_date_length, thread_state, until):
+        """
+        差分取得で履歴を再取得しない期間のスレッドについて、親メッセージのみを取得して返信の変化を確認し、
+        変化したスレッドの親メッセージと返信を取得する。
+        確認の呼び出し回数はスレッド取得期間内のスレッド数で決まり、期間内のメッセージ数には依存しない。
+        返信の無かったメッセージに新しく付いた返信は検出できないため、必要な場合は期間内の履歴を再取得する。
+
+        :param channel_id: チャンネルID
+        :param get_thread_date_length: スレッドデータ取得の期間（日数）
+        :param thread_state: thread_ts -> {'reply_count', 'latest_reply'} の辞書（取得したスレッドの状態で更新する）
+        :param until: 今回の履歴の取得範囲の下端のタイムスタンプ（これより古いスレッドを確認する）
+        :return: DataFrame（カラムはget_all_messagesと同じ）
+        """
+        thread_cutoff_ts = (datetime.now() - timedelta(days=get_thread_date_length)).timestamp()
+        candidates = self.refresh_candidates(thread_state, thread_cutoff_ts, until)
+        if not candidates:
+            return pd.DataFrame(columns=MESSAGE_COLUMNS)
+        self.logger.view_log(f"Checking {len(candidates)} threads for new replies in channel '{channel_id}'")
+
+        with ThreadPoolExecutor(max_workers=self.thread_workers) as executor:
+            probed = executor.map(lambda thread_ts: self.fetch_thread_parent(channel_id, thread_ts), candidates)
+            messages = [message for message in probed if message is not None and self.is_thread_changed(message, thread_state)]
+            parents = list(enumerate(messages))
+            thread_futures = {parent['ts']: executor.submit(self.fetch_thread_rows, channel_id, parent['ts']) for _, parent in parents}
+            page_columns = self.normalize_columns(messages, channel_id)
+            thread_columns = {thread_ts: future.result() for thread_ts, future in thread_futures.items()}
+        batch = self._assemble_page(page_columns, parents, thread_columns, channel_id, thread_state, set())
+        self.logger.view_log(f"Refreshed {len(messages)} threads in channel '{channel_id}'")
+        self.record_stats(channel_id, batch)
+        return batch
+
+    @staticmethod
+    def is_thread_changed(message, thread_state=None):
+        """
+        メッセージがスレッドの親であり、返信を取得する必要があるかを判定する。
+        返信数が0のスレッドや、thread_stateに記録された状態から返信が変化していないスレッドはFalseとする。
+
+        :param message: conversations_historyのメッセージ
+        :param thread_state: thread_ts -> {'reply_count', 'latest_reply'} の辞書（オプション）
+        :return: 返信を取得する必要がある場合True
+        """
+        if 'thread_ts' not in message or message['thread_ts'] != message['ts']:
+            return False
+        if message.get('reply_count', 1) == 0:
+            return False
+        if thread_state is None:
+            return True
+
+        previous = thread_state.get(message['ts'])
+        return previous is None or (
+            previous.get('reply_count') != message.get('reply_count')
+            or previous.get('latest_reply') != message.get('latest_reply')
+        )
+
+    def fetch_thread_rows(self, channel_id: str, thread_ts: str, checkpoint=None):
+        """
+        スレッドの返信メッセージを取得し、整形済みの列の辞書として返す。
+        親メッセージは履歴のページに含まれるため、整形する前に除く。
+        ワーカースレッドから呼び出される。
+
+        :param channel_id: チャンネルID
+        :param thread_ts: スレッドタイムスタンプ
+        :param checkpoint: ExportCheckpointインスタンス（オプション）。指定した場合、全ての返信を取得できたスレッドを保存する
+        :return: 列名 -> 値のリスト の辞書
+        """
+        replies = [message for message in self.fetch_thread_messages(channel_id, thread_ts) if message.get('ts') != thread_ts]
+        rows = self.normalize_columns(replies, channel_id, thread_ts)
+        if checkpoint is not None and (channel_id, thread_ts) not in self.incomplete_threads:
+            checkpoint.save_thread(thread_ts, rows)
+        return rows
+
     def convert_messages_to_react_data(self, messages_df):
         """
         get_all_messagesの応答から、リアクションデータを抽出して整形し、DataFrameとして返す。
         DataFrameはts, user, stamp, email, channel_id, export_dateをカラムに持つ。
+        リアクションはメッセージ単位のリストをまとめて展開し、メールアドレスはユーザーごとに1回だけ解決する。
 
         :param messages_df: get_all_messagesの応答として得られるDataFrame
         :return: リアクションデータを整形したDataFrame
         """
-        react_data = []
-
-        # 各メッセージのリアクションを抽出
-        for index, row in messages_df.iterrows():
-            ts = row['ts']
-            channel_id = row['channel_id']
-            export_date = row['export_date']
-
-            # リアクションがある場合、個々のリアクションデータを抽出
-            if row['react']:
-                try:
-                    # リアクションを文字列からリストに変換
-                    reactions = eval(row['react'])
-                    for reaction in reactions:
-                        for user in reaction['users']:
-                            # userのIDを使ってメールアドレスを取得
-                            email = self.get_user_email(user)
-                            react_data.append({
-                                'ts': ts,
-                                'user': user,
-                                'stamp': reaction['name'],
-                                'email': email,
-                                'channel_id': channel_id,
-                                'export_date': export_date
-                            })
-                except (SyntaxError, NameError, TypeError):
-                    # リアクションデータのパースに失敗した場合の対処
-                    self.logger.view_log(f"Failed to parse reactions for message {ts}")
+        reacted = messages_df.loc[messages_df['react'].notna(), ['ts', 'react', 'channel_id', 'export_date']]
+        if reacted.empty:
+            return pd.DataFrame(columns=REACTION_COLUMNS)
 
-        # DataFrameに変換
-        df = pd.DataFrame(react_data, columns=['ts', 'user', 'stamp', 'email', 'channel_id', 'export_date'])
+        # 以前のバージョンで文字列として保存されたリアクションはリストに戻す
+        reacted = reacted.assign(react=[self.parse_reactions(react, ts) for ts, react in zip(reacted['ts'], reacted['react'])])
+
+        # メッセージ -> リアクション -> ユーザーの順に展開
+        reactions = reacted.explode('react').dropna(subset=['react'])
+        reactions = reactions.assign(
+            stamp=[reaction.get('name') for reaction in reactions['react']],
+            user=[reaction.get('users', []) for reaction in reactions['react']]
+        ).explode('user').dropna(subset=['user'])
+
+        # userのIDを使ってメールアドレスを取得（ユーザーごとに1回のみ）
+        emails = {user: self.get_user_email(user) for user in reactions['user'].unique()}
+        reactions['email'] = reactions['user'].map(emails)
+
+        df = reactions[REACTION_COLUMNS].reset_index(drop=True)
         return df.drop_duplicates()
 
+    def parse_reactions(self, react, ts=None):
+        """
+        reactカラムの値をリアクションのリストに変換する。
+        以前のバージョンではリアクションをstr()した文字列で保存していたため、その形式も読み込めるようにする。
+
+        :param react: リアクションのリスト、またはその文字列表現
+        :param ts: メッセージのタイムスタンプ（ログ出力用）
+        :return: リアクションのリスト
+        """
+        if not isinstance(react, str):
+            return react
+        try:
+            return ast.literal_eval(react)
+        except (SyntaxError, ValueError):
+            # リアクションデータのパースに失敗した場合の対処
+            self.logger.view_log(f"Failed to parse reactions for message {ts}")
+            return []
 
-    
     @staticmethod
     def linear_interpolation(start, end, step, total_steps):
         """
@@ -0,0 +1,127 @@
+"""
+HistoryStoreに蓄積したParquetのデータセットを読み込むクエリ関数。
+チャネルと月の条件はパーティションの絞り込みに使い、該当しないパーティションのファイルは開かない。
+取得するカラムを指定した場合は、そのカラムのみをファイルから読み込む。
+
+使用例:
+    import historyQuery
+    df = historyQuery.read_messages('store', channels=['C0123'], start='2024-01-01', end='2024-04-01',
+                                    columns=['ts', 'user', 'text'])
+"""
+import os
+import time
+from datetime import date, datetime
+import pandas as pd
+import historyStore
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+    except ImportError as e:
+        raise ImportError("Querying the history store requires pyarrow. Install it with 'pip install pyarrow'.") from e
+    return pa, ds
+
+
+def _to_datetime(value):
+    # 'YYYY-MM-DD'などの文字列、date、datetimeをdatetimeに揃える（タイムゾーンはローカル時刻として扱う）
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return datetime.fromisoformat(str(value))
+
+
+def _ts_bound(value):
+    # ローカル時刻をSlackのタイムスタンプと同じ形式の文字列にする（桁数が同じため文字列のまま大小を比較できる）
+    return f"{time.mktime(value.timetuple()) + value.microsecond / 1e6:.6f}"
+
+
+def build_filter(channels=None, start=None, end=None, users=None):
+    """
+    クエリの条件をpyarrowのフィルター式に変換する。
+    channelとmonthはパーティションのフィールドのため、該当しないパーティションはファイルを開かずに除外される。
+
+    :param channels: チャネルIDのリスト（オプション）
+    :param start: この日時以降のメッセージのみ（オプション、文字列・date・datetime、ローカル時刻）
+    :param end: この日時より前のメッセージのみ（オプション、startと同じ形式）
+    :param users: ユーザーIDのリスト（オプション）
+    :return: pyarrow.dataset.Expression（条件が無い場合はNone）
+    """
+    _, ds = _import_pyarrow()
+    conditions = []
+    if channels is not None:
+        conditions.append(ds.field('channel').isin(list(channels)))
+    if start is not None:
+        start = _to_datetime(start)
+        conditions.append(ds.field('month') >= start.strftime('%Y-%m'))
+        conditions.append(ds.field('ts') >= _ts_bound(start))
+    if end is not None:
+        end = _to_datetime(end)
+        # endの瞬間を含まないため、ちょうど月初めの場合は前月までのパーティションを読む
+        last_month = datetime.fromtimestamp(float(_ts_bound(end)) - 1e-6).strftime('%Y-%m')
+        conditions.append(ds.field('month') <= last_month)
+        conditions.append(ds.field('ts') < _ts_bound(end))
+    if users is not None:
+        conditions.append(ds.field('user').isin(list(users)))
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def open_dataset(store_dir: str, table: str):
+    """
+    データセットを開く。ファイルの一覧とパーティションのみを読み込み、データは読み込まない。
+
+    :param store_dir: HistoryStoreのディレクトリ
+    :param table: データセット名（historyStore.MESSAGESまたはhistoryStore.REACTIONS）
+    :return: pyarrow.dataset.Dataset（データセットが無い場合はNone）
+    """
+    pa, ds = _import_pyarrow()
+    path = historyStore.HistoryStore(store_dir).dataset_dir(table)
+    if not os.path.isdir(path):
+        return None
+    partitioning = ds.partitioning(pa.schema([('channel', pa.string()), ('month', pa.string())]), flavor='hive')
+    return ds.dataset(path, format='parquet', partitioning=partitioning)
+
+
+def read_table(store_dir: str, table: str, channels=None, start=None, end=None, users=None, columns=None):
+    """
+    データセットから条件に合う行を読み込む。
+
+    :param store_dir: HistoryStoreのディレクトリ
+    :param table: データセット名（historyStore.MESSAGESまたはhistoryStore.REACTIONS）
+    :param channels: チャネルIDのリスト（オプション）
+    :param start: この日時以降の行のみ（オプション、文字列・date・datetime、ローカル時刻）
+    :param end: この日時より前の行のみ（オプション、startと同じ形式）
+    :param users: ユーザーIDのリスト（オプション、リアクションの場合はリアクションしたユーザー）
+    :param columns: 読み込むカラムのリスト（省略時は全てのカラム、'channel'と'month'も指定できる）
+    :return: DataFrame
+    """
+    columns = list(columns) if columns is not None else list(historyStore.TABLE_COLUMNS[table])
+    dataset = open_dataset(store_dir, table)
+    if dataset is None:
+        return pd.DataFrame(columns=columns)
+    expression = build_filter(channels, start, end, users)
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def read_messages(store_dir: str, channels=None, start=None, end=None, users=None, columns=None):
+    """
+    メッセージ履歴を読み込む。引数はread_tableと同じ。
+
+    :return: DataFrame（カラムはget_all_messagesと同じ、全て文字列）
+    """
+    return read_table(store_dir, historyStore.MESSAGES, channels, start, end, users, columns)
+
+
+def read_reactions(store_dir: str, channels=None, start=None, end=None, users=None, columns=None):
+    """
+    リアクションを読み込む。引数はread_tableと同じ。日時の条件はリアクションされたメッセージのタイムスタンプに適用する。
+
+    :return: DataFrame（カラムはconvert_messages_to_react_dataと同じ、全て文字列）
+    """
+    return read_table(store_dir, historyStore.REACTIONS, channels, start, end, users, columns)
@@ -0,0 +1,211 @@
+import glob
+import os
+import shutil
+import socket
+import uuid
+import pandas as pd
+import connector
+import writerLib
+
+MESSAGES = 'messages'  # メッセージ履歴のデータセット名
+REACTIONS = 'reactions'  # リアクションのデータセット名
+UNKNOWN_MONTH = 'unknown'  # タイムスタンプが無い行のパーティション名
+
+# データセット名 -> 保存するカラム
+TABLE_COLUMNS = {
+    MESSAGES: connector.MESSAGE_COLUMNS,
+    REACTIONS: connector.REACTION_COLUMNS,
+}
+
+
+class HistoryStore:
+    def __init__(self, root: str):
+        """
+        HistoryStoreクラスの初期化メソッド。
+        エクスポートしたメッセージ履歴とリアクションを、実行ごとの出力ファイルとは別に
+        チャネルと月（メッセージのタイムスタンプのローカル時刻の年月）でパーティション分割したParquetのデータセットとして蓄積する。
+        ディレクトリ構成は <root>/<データセット名>/channel=<チャネルID>/month=<YYYY-MM>/part-0.parquet（Hive形式）で、
+        historyQueryから必要なパーティションとカラムのみを読み込める。
+
+        :param root: データセットを保存するディレクトリ
+        """
+        self.root = root
+
+    def dataset_dir(self, table: str):
+        """
+        データセットのディレクトリのパスを返す。
+
+        :param table: データセット名（MESSAGESまたはREACTIONS）
+        :return: ディレクトリのパス
+        """
+        return os.path.join(self.root, table)
+
+    def channel_dir(self, table: str, channel_id: str):
+        """
+        チャネルのパーティションのディレクトリのパスを返す。
+
+        :param table: データセット名（MESSAGESまたはREACTIONS）
+        :param channel_id: チャネルID
+        :return: ディレクトリのパス
+        """
+        return os.path.join(self.dataset_dir(table), f"channel={channel_id}")
+
+    def open_channel(self, channel_id: str, resumable=False, resume_state=None):
+        """
+        チャネルの履歴を逐次書き込むライターを作成する。
+
+        :param channel_id: チャネルID
+        :param resumable: 中断後に書き込みを再開できるようにする場合True
+        :param resume_state: 前回の実行でChannelStoreWriter.commitが返した状態（オプション）
+        :return: ChannelStoreWriterインスタンス
+        """
+        return ChannelStoreWriter(self, channel_id, resumable, resume_state)
+
+    def save_channel(self, channel_id: str, messages_df, reactions_df):
+        """
+        チャネルの履歴とリアクションをまとめて保存する。
+
+        :param channel_id: チャネルID
+        :param messages_df: メッセージ履歴のDataFrame
+        :param reactions_df: リアクションのDataFrame
+        """
+        with self.open_channel(channel_id) as writer:
+            writer.write(messages_df, reactions_df)
+
+
+class ChannelStoreWriter:
+    def __init__(self, store: HistoryStore, channel_id: str, resumable=False, resume_state=None):
+        """
+        ChannelStoreWriterクラスの初期化メソッド。
+        1チャネル分の履歴とリアクションを月ごとのパーティションに振り分けて書き込む。
+        書き込み中は先頭が'.'のディレクトリ（データセットの読み込み対象外）に保存し、close時にチャネルの既存のパーティションと入れ替える。
+        エクスポートは毎回チャネルの全履歴を出力するため、データセットには常に最新のエクスポートの内容が残る。
+        途中で中断した場合は既存のパーティションを変更しない。
+        resume_stateを指定した場合は、前回の実行の書き込み途中のディレクトリを引き継いで最後にcommitした位置から書き込みを続ける。
+
+        :param store: HistoryStoreインスタンス
+        :param channel_id: チャネルID
+        :param resumable: 中断後に書き込みを再開できるようにする場合True
+        :param resume_state: 前回の実行でcommitが返した状態（オプション）
+        """
+        self.store = store
+        self.channel_id = channel_id
+        self.resumable = resumable or resume_state is not None
+        self.rows_written = {table: 0 for table in TABLE_COLUMNS}
+        self._writers = {}  # (データセット名, 年月) -> ParquetStreamWriter
+        # 共有ストレージで別のホストのプロセスIDが重なっても衝突しないよう、ホスト名と乱数で書き込み途中のディレクトリを区別する
+        self.staging_id = f"{socket.gethostname()}-{uuid.uuid4().hex}"
+        if resume_state is not None:
+            self._resume(resume_state)
+
+    def _staging_dir(self, table):
+        return os.path.join(self.store.dataset_dir(table), f".staging-channel={self.channel_id}-{self.staging_id}")
+
+    def _month_path(self, table, month):
+        return os.path.join(self._staging_dir(table), f"month={month}", "part-0.parquet")
+
+    def _resume(self, resume_state):
+        self.staging_id = resume_state['staging_id']
+        self.rows_written = dict(resume_state['rows'])
+        committed = {tuple(key.split('/', 1)): state for key, state in resume_state['writers'].items()}
+        for table in TABLE_COLUMNS:
+            # 最後のcommitより後に書き込みを始めた月のパーティションは削除する
+            for month_dir in glob.glob(os.path.join(self._staging_dir(table), "month=*")):
+                if (table, os.path.basename(month_dir)[len("month="):]) not in committed:
+                    shutil.rmtree(month_dir, ignore_errors=True)
+        for (table, month), state in committed.items():
+            self._writers[(table, month)] = writerLib.ParquetStreamWriter(self._month_path(table, month), TABLE_COLUMNS[table],
+                                                                         resume_state=state)
+
+    def write(self, messages_df, reactions_df=None):
+        """
+        メッセージ履歴とリアクションを追記する。
+
+        :param messages_df: メッセージ履歴のDataFrame（iter_message_batches / get_all_messagesの戻り値）
+        :param reactions_df: リアクションのDataFrame（convert_messages_to_react_dataの戻り値、オプション）
+        """
+        self._write_table(MESSAGES, messages_df)
+        if reactions_df is not None:
+            self._write_table(REACTIONS, reactions_df)
+
+    def _write_table(self, table, df):
+        if df.empty:
+            return
+        months = pd.Series(self.partition_months(df['ts']), index=df.index)
+        for month, part in df.groupby(months, sort=False):
+            writer = self._writers.get((table, month))
+            if writer is None:
+                path = self._month_path(table, month)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                writer = self._writers[(table, month)] = writerLib.ParquetStreamWriter(path, TABLE_COLUMNS[table], self.resumable)
+            writer.write(part)
+        self.rows_written[table] += len(df)
+
+    @staticmethod
+    def partition_months(timestamps):
+        """
+        タイムスタンプから行のパーティション（ローカル時刻の年月）を求める。datetimeカラムと同じ時刻で分割する。
+
+        :param timestamps: タイムスタンプのSeries
+        :return: 'YYYY-MM'のリスト（タイムスタンプが無い行はUNKNOWN_MONTH）
+        """
+        values = [None if pd.isna(ts) else ts for ts in timestamps]
+        return [formatted[:7] if formatted else UNKNOWN_MONTH for formatted in connector.SlackManager.format_timestamps(values)]
+
+    def commit(self):
+        """
+        これまでに書き込んだ行を確定し、中断後に書き込みを再開するための状態を返す。
+
+        :return: resume_stateに渡す状態の辞書
+        """
+        return {
+            'staging_id': self.staging_id,
+            'rows': dict(self.rows_written),
+            'writers': {f"{table}/{month}": writer.commit() for (table, month), writer in self._writers.items()},
+        }
+
+    def suspend(self):
+        """
+        書き込みを中断する。書き込み途中のディレクトリは残し、次の実行で最後にcommitした位置から再開できるようにする。
+        """
+        for writer in self._writers.values():
+            writer.suspend()
+
+    def close(self):
+        """
+        書き込みを完了し、チャネルの既存のパーティションを書き込んだものと入れ替える。
+        """
+        for writer in self._writers.values():
+            writer.close()
+        for table in TABLE_COLUMNS:
+            staging_dir = self._staging_dir(table)
+            channel_dir = self.store.channel_dir(table, self.channel_id)
+            retired_dir = os.path.join(self.store.dataset_dir(table), f".retired-channel={self.channel_id}-{self.staging_id}")
+            if os.path.exists(channel_dir):
+                os.replace(channel_dir, retired_dir)
+            if os.path.exists(staging_dir):
+                os.replace(staging_dir, channel_dir)
+            shutil.rmtree(retired_dir, ignore_errors=True)
+            # 中断した以前の実行が残した書き込み途中のディレクトリも削除する
+            for pattern in (f".staging-channel={self.channel_id}-*", f".retired-channel={self.channel_id}-*"):
+                for path in glob.glob(os.path.join(self.store.dataset_dir(table), pattern)):
+                    shutil.rmtree(path, ignore_errors=True)
+
+    def discard(self):
+        """
+        書き込んだ内容を破棄する。既存のパーティションは変更しない。
+        """
+        for writer in self._writers.values():
+            writer.discard()
+        for table in TABLE_COLUMNS:
+            shutil.rmtree(self._staging_dir(table), ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+        return False
@@ -0,0 +1,154 @@
+from collections import deque
+from decimal import Decimal
+
+TS_QUANTUM = Decimal('0.000001')  # Slackのタイムスタンプの精度（マイクロ秒）
+
+
+def parse_ts(ts):
+    """
+    Slackのタイムスタンプを比較・計算できる値に変換する。
+
+    :param ts: タイムスタンプの文字列（またはNone）
+    :return: Decimal（Noneの場合はNone）
+    """
+    return None if ts is None else Decimal(str(ts))
+
+
+def format_ts(value):
+    """
+    parse_tsで変換した値をAPIに渡すタイムスタンプの文字列に戻す。
+
+    :param value: Decimal（またはNone）
+    :return: 小数点以下6桁の文字列（Noneの場合はNone）
+    """
+    return None if value is None else format(value.quantize(TS_QUANTUM), 'f')
+
+
+class HistoryWindow:
+    __slots__ = ('oldest', 'latest', 'cursor')
+
+    def __init__(self, oldest=None, latest=None, cursor=None):
+        """
+        conversations.historyで取得する時間範囲。両端を含めて取得し、端のメッセージの重複はHistoryWindowPlanで除く。
+
+        :param oldest: 範囲の下端（Decimal、Noneの場合は下限なし）
+        :param latest: 範囲の上端（Decimal、Noneの場合は現在まで）
+        :param cursor: 範囲の続きのページのカーソル（オプション、メッセージの無いページが返された場合に使う）
+        """
+        self.oldest = oldest
+        self.latest = latest
+        self.cursor = cursor
+
+    def params(self):
+        """
+        conversations.historyに渡す範囲の引数を返す。
+
+        :return: oldest, latest, inclusive, cursorの辞書（指定の無い端とカーソルは含めない）
+        """
+        params = {'inclusive': True}
+        if self.oldest is not None:
+            params['oldest'] = format_ts(self.oldest)
+        if self.latest is not None:
+            params['latest'] = format_ts(self.latest)
+        if self.cursor:
+            params['cursor'] = self.cursor
+        return params
+
+
+class HistoryWindowPlan:
+    def __init__(self, shards: int, oldest=None, latest=None):
+        """
+        HistoryWindowPlanクラスの初期化メソッド。
+        チャネルの履歴を時間範囲に分割して並列に取得するための計画を管理する。APIの呼び出しは行わない。
+        最初は全期間を1つの範囲として取得し、1ページに収まらなかった範囲は、取得したページの期間の長さ（メッセージの密度）を
+        目安に残りの期間を最大shards個の範囲に分割する。分割した範囲も同様に取得・分割するため、メッセージの多い期間ほど細かく分かれる。
+        範囲は新しい順に並べて管理し、取得結果も新しい順に受け取ることで、カーソルで順に取得した場合と同じ順序で結合する。
+
+        :param shards: 1回に分割する範囲の数（同時に取得する範囲の数）
+        :param oldest: このタイムスタンプより新しいメッセージのみ取得する（オプション）
+        :param latest: このタイムスタンプより古いメッセージのみ取得する（オプション、チェックポイントからの再開用）
+        """
+        self.shards = max(1, shards)
+        self.oldest = parse_ts(oldest)
+        self.latest = parse_ts(latest)
+        self.pending = deque([HistoryWindow(self.oldest, self.latest)])  # 結果を受け取る順（新しい順）に並べた未処理の範囲
+        self.started = set()  # 取得を開始した範囲
+
+    @property
+    def finished(self):
+        """全ての範囲を処理済みかどうか"""
+        return not self.pending
+
+    def windows_to_start(self):
+        """
+        次に受け取る順に先頭からshards個の範囲のうち、まだ取得を開始していないものを返す。
+        結果を受け取る順に取得を開始するため、先読みしたページが際限なく溜まることはない。
+
+        :return: 取得を開始する範囲のリスト
+        """
+        windows = [window for window, _ in zip(self.pending, range(self.shards)) if window not in self.started]
+        self.started.update(windows)
+        return windows
+
+    def next_window(self):
+        """
+        次に結果を受け取る範囲を取り出す。
+
+        :return: HistoryWindowインスタンス
+        """
+        window = self.pending.popleft()
+        self.started.discard(window)
+        return window
+
+    def merge(self, window, response):
+        """
+        範囲の取得結果を受け取る。1ページに収まらなかった場合は残りの期間を分割して未処理の範囲の先頭に加える。
+        続きがあるのにメッセージの無いページが返された場合は分割の目安が無いため、同じ範囲の続きをカーソルで取得する。
+        範囲の端で重複したメッセージと、取得対象の期間外のメッセージは除く。
+
+        :param window: next_windowで取り出した範囲
+        :param response: conversations.historyのレスポンス
+        :return: 前回までに受け取ったメッセージより古いメッセージのリスト（新しい順）
+        :raises ValueError: 続きがあるのにメッセージもカーソルも無いページが返された場合
+        """
+        messages = response['messages']
+        next_cursor = response.get('response_metadata', {}).get('next_cursor')
+        if messages and (response.get('has_more') or next_cursor):
+            self.pending.extendleft(reversed(self.split(window, messages)))
+        elif next_cursor:
+            self.pending.appendleft(HistoryWindow(window.oldest, window.latest, next_cursor))
+        elif response.get('has_more'):
+            raise ValueError("conversations.history returned has_more without messages or a next cursor.")
+
+        # 結果は新しい順に受け取るため、最後に受け取ったメッセージ以降のものは範囲の端の重複となる
+        kept = []
+        for message in messages:
+            ts = parse_ts(message['ts'])
+            if (self.latest is None or ts < self.latest) and (self.oldest is None or ts > self.oldest):
+                kept.append(message)
+                self.latest = ts
+        return kept
+
+    def split(self, window, messages):
+        """
+        1ページに収まらなかった範囲のうち、ページの最も古いメッセージより前の期間を分割する。
+        ページの期間の長さごとに最大shards - 1個の範囲を作り、残りの期間は最後の1つの範囲にまとめる。
+
+        :param window: 取得した範囲
+        :param messages: 範囲の最初のページのメッセージ
+        :return: 分割した範囲のリスト（新しい順）
+        """
+        timestamps = [parse_ts(message['ts']) for message in messages]
+        newest, last = max(timestamps), min(timestamps)
+        span = max(newest - last, Decimal(1))
+
+        windows = []
+        upper = last
+        for _ in range(self.shards - 1):
+            lower = upper - span
+            if lower <= 0 or (window.oldest is not None and lower <= window.oldest):
+                break
+            windows.append(HistoryWindow(lower, upper))
+            upper = lower
+        windows.append(HistoryWindow(window.oldest, upper))
+        return windows
@@ -0,0 +1,263 @@
+import gzip
+import http.client
+import io
+import socket
+import ssl
+import threading
+from contextlib import contextmanager
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+
+from slack_sdk import WebClient
+
+
+class RequestScope:
+    def __init__(self):
+        """
+        RequestScopeクラスの初期化メソッド。
+        1回のリクエストの試行で借りている接続を保持し、他のスレッド（RequestWatchdogの監視スレッド）から中断できるようにする。
+        """
+        self.connection = None
+        self.aborted = False
+        self._lock = threading.Lock()
+
+    def attach(self, connection):
+        """
+        借りた接続を記録する。既に中断されている場合は接続を使わずに例外を送出する。
+
+        :param connection: ConnectionPool.acquireで借りた接続
+        """
+        with self._lock:
+            if self.aborted:
+                raise TimeoutError("The request was aborted because it passed its deadline.")
+            self.connection = connection
+
+    def detach(self):
+        """
+        返却した接続の記録を消す。
+        """
+        with self._lock:
+            self.connection = None
+
+    def abort(self):
+        """
+        リクエストを中断する。借りている接続のソケットを切断し、応答待ちのスレッドを例外で戻す。
+        接続はリクエストを送信したスレッドが返却する際に閉じる。
+        """
+        with self._lock:
+            self.aborted = True
+            sock = self.connection.sock if self.connection is not None else None
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+class ConnectionPool:
+    def __init__(self, max_connections: int = 8, ssl_context=None):
+        """
+        ConnectionPoolクラスの初期化メソッド。
+        HTTP/1.1のkeep-alive接続をホストごとに保持し、リクエストのたびに再利用する。
+        接続は1つのリクエストの間だけ1つのスレッドに貸し出すため、複数のワーカーから同時に使ってよい。
+        開いている接続の数はmax_connectionsまでとし、全て貸し出し中の場合は返却を待つ。
+
+        :param max_connections: 同時に開く接続の最大数
+        :param ssl_context: HTTPS接続に使うSSLContext（省略時は既定の設定で作成）
+        """
+        self.max_connections = max(1, max_connections)
+        self.ssl_context = ssl_context
+        self.created = 0  # 新しく開いた接続の数
+        self.reused = 0  # 待機中の接続を再利用したリクエストの数
+        self._idle = {}  # (スキーム, ホスト, ポート) -> 待機中の接続のリスト
+        self._open = 0  # 貸し出し中と待機中の接続の合計
+        self._condition = threading.Condition()
+        self._local = threading.local()  # スレッドごとの実行中のRequestScope
+
+    def _connect(self, scheme, host, port, timeout):
+        if scheme == 'https':
+            context = self.ssl_context or ssl.create_default_context()
+            return http.client.HTTPSConnection(host, port, timeout=timeout, context=context)
+        return http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def acquire(self, scheme, host, port, timeout):
+        """
+        接続を1つ借りる。同じホストの待機中の接続があれば再利用し、無ければ新しく開く。
+
+        :param scheme: 'http' または 'https'
+        :param host: ホスト名
+        :param port: ポート番号
+        :param timeout: 接続と応答待ちのタイムアウト（秒）
+        :return: (接続, 再利用した接続かどうか)
+        """
+        key = (scheme, host, port)
+        with self._condition:
+            while True:
+                idle = self._idle.get(key)
+                if idle:
+                    connection = idle.pop()
+                    self.reused += 1
+                    break
+                if self._open < self.max_connections:
+                    connection = None
+                    self._open += 1
+                    self.created += 1
+                    break
+                # 上限に達している場合は他のホストの待機中の接続を閉じて枠を空け、それも無ければ返却を待つ
+                other = next((connections for connections in self._idle.values() if connections), None)
+                if other is not None:
+                    other.pop().close()
+                    self._open -= 1
+                    continue
+                self._condition.wait()
+
+        if connection is None:
+            try:
+                connection = self._connect(scheme, host, port, timeout)
+            except BaseException:
+                self._discard()
+                raise
+            return connection, False
+
+        # 試行回数ごとにタイムアウトが異なるため、借りるたびに設定し直す
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+        return connection, True
+
+    def release(self, key, connection, reusable):
+        """
+        借りた接続を返却する。再利用できない接続（応答の途中で失敗した、サーバーが切断を指示した等）は閉じる。
+
+        :param key: (スキーム, ホスト, ポート)
+        :param connection: acquireで借りた接続
+        :param reusable: 再利用できる場合はTrue
+        """
+        if not reusable:
+            connection.close()
+            self._discard()
+            return
+        with self._condition:
+            self._idle.setdefault(key, []).append(connection)
+            self._condition.notify()
+
+    def _discard(self):
+        with self._condition:
+            self._open -= 1
+            self._condition.notify()
+
+    @contextmanager
+    def request_scope(self):
+        """
+        withブロックの間にこのスレッドから送信するリクエストを、返したRequestScopeのabortで中断できるようにする。
+
+        :return: RequestScopeインスタンス
+        """
+        scope = RequestScope()
+        self._local.scope = scope
+        try:
+            yield scope
+        finally:
+            self._local.scope = None
+
+    def request(self, method, url, body, headers, timeout):
+        """
+        プールの接続でリクエストを送信し、応答の本文を全て読み込む。
+        待機中にサーバーが閉じていた接続で送信に失敗した場合は、新しい接続で1回だけ送り直す。
+
+        :param method: HTTPメソッド
+        :param url: リクエストのURL
+        :param body: リクエストの本文（bytesまたはNone）
+        :param headers: リクエストヘッダーの辞書
+        :param timeout: タイムアウト（秒）
+        :return: (http.client.HTTPResponse, 応答の本文のbytes)
+        """
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        key = (scheme, parts.hostname, parts.port or (443 if scheme == 'https' else 80))
+        path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+
+        scope = getattr(self._local, 'scope', None)
+        while True:
+            connection, reused = self.acquire(*key, timeout)
+            try:
+                if scope is not None:
+                    scope.attach(connection)
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+            except Exception as e:
+                self.release(key, connection, False)
+                # 期限切れで切断した場合は送り直さない
+                if scope is not None and scope.aborted:
+                    raise TimeoutError("The request was aborted because it passed its deadline.") from e
+                if reused and isinstance(e, (ConnectionError, http.client.BadStatusLine)):
+                    continue
+                raise
+            except BaseException:
+                self.release(key, connection, False)
+                raise
+            finally:
+                if scope is not None:
+                    scope.detach()
+            self.release(key, connection, not response.will_close)
+            return response, data
+
+    def close(self):
+        """
+        待機中の全ての接続を閉じる。
+        """
+        with self._condition:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+                    self._open -= 1
+            self._idle.clear()
+            self._condition.notify_all()
+
+
+class PooledWebClient(WebClient):
+    # 上書きするWebClientの内部メソッドの名前
+    TRANSPORT_HOOK = '_perform_urllib_http_request_internal'
+
+    def __init__(self, *args, connection_pool=None, **kwargs):
+        """
+        ConnectionPoolのkeep-alive接続でリクエストを送信するWebClient。
+        既定のWebClientはリクエストごとに接続（HTTPSの場合はTLSのハンドシェイクを含む）を開くが、
+        このクライアントは接続を再利用し、gzipで圧縮された応答を受け取る。
+        プロキシを指定した場合は既定の通信方式を使う。
+        copy.copyで複製したクライアント（試行回数ごとのタイムアウト用）は同じプールを共有する。
+
+        :param connection_pool: 共有するConnectionPoolインスタンス（省略時は新規に作成）
+        """
+        super().__init__(*args, **kwargs)
+        self.connection_pool = connection_pool or ConnectionPool(ssl_context=self.ssl)
+
+    @classmethod
+    def is_supported(cls):
+        """
+        インストールされているslack_sdkのWebClientに、上書きする内部メソッドがあるかを返す。
+
+        :return: 接続プールで通信できる場合True
+        """
+        return callable(getattr(WebClient, cls.TRANSPORT_HOOK, None))
+
+    # WebClientには通信方式を差し替える公開の拡張点が無いため、内部メソッド（TRANSPORT_HOOK）を上書きする。
+    # 内部メソッドが無い版のslack_sdkではis_supportedがFalseとなり、SlackManagerは既定のWebClientを使う
+    def _perform_urllib_http_request_internal(self, url, req):
+        if self.proxy is not None or not url.lower().startswith('http'):
+            return super()._perform_urllib_http_request_internal(url, req)
+
+        headers = dict(req.header_items())
+        headers['Accept-Encoding'] = 'gzip'
+        response, data = self.connection_pool.request(req.get_method(), url, req.data, headers, self.timeout)
+        if (response.getheader('Content-Encoding') or '').lower() == 'gzip':
+            data = gzip.decompress(data)
+
+        # urlopenと同様に2xx以外の応答はHTTPErrorとして扱う（429のRetry-Afterなどは呼び出し元で処理される）
+        if not 200 <= response.status < 300:
+            raise HTTPError(url, response.status, response.reason, response.msg, io.BytesIO(data))
+        if response.msg.get_content_type() == 'application/gzip':
+            return {'status': response.status, 'headers': response.msg, 'body': data}
+        charset = response.msg.get_content_charset() or 'utf-8'
+        return {'status': response.status, 'headers': response.msg, 'body': data.decode(charset)}
@@ -1,9 +1,11 @@
+import threading
 from datetime import datetime
 
 class Logger:
     def __init__(self):
         self.last_action = None  # 直前に呼ばれたメソッドの名前を保持
         self.counter = 0  # 連続表示のカウンター
+        self._lock = threading.RLock()  # 複数ワーカーからの表示が混ざらないよう排他制御する
 
     def _reset_counter(self):
         """カウンターをリセットする。"""
@@ -11,10 +13,11 @@ class Logger:
 
     def _check_line_break(self):
         """80回連続表示で改行を挿入。"""
-        self.counter += 1
-        if self.counter >= 80:
-            print()  # 改行を挿入
-            self._reset_counter()
+        with self._lock:
+            self.counter += 1
+            if self.counter >= 80:
+                print()  # 改行を挿入
+                self._reset_counter()
 
     def view_message_access(self):
         """メッセージAPIアクセスの表示（>）"""
@@ -54,14 +57,15 @@ class Logger:
 
     def view_log(self, message: str):
         """ログ表示機能"""
-        # 直前にログ表示以外のアクションがあった場合、ログの表示前に改行を入れる
-        if self.last_action in ['message', 'thread', 'retry', 'email_api', 'email_cache']:
-            print()  # 改行を挿入
+        with self._lock:
+            # 直前にログ表示以外のアクションがあった場合、ログの表示前に改行を入れる
+            if self.last_action in ['message', 'thread', 'retry', 'email_api', 'email_cache']:
+                print()  # 改行を挿入
 
-        # 現在時刻とメッセージを表示
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        print(f"{current_time} - {message}")
+            # 現在時刻とメッセージを表示
+            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            print(f"{current_time} - {message}")
 
-        # アクションをリセット
-        self.last_action = 'log'
-        self._reset_counter()
+            # アクションをリセット
+            self.last_action = 'log'
+            self._reset_counter()
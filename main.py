@@ -3,10 +3,849 @@ import cacheLib
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 import mainUtils
+import writerLib
+import scheduler
 import logger
 import sys
+import argparse
+import asyncio
+import asyncConnector
+import checkpoint
+import responseStore
+import metrics
+import workQueue
+import historyStore
+import statsStore
+import pandas as pd
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+
+def parse_args(argv=None):
+    """
+    コマンドライン引数を解析する。
+
+    :param argv: 引数のリスト（省略時はsys.argv）
+    :return: 解析結果のNamespace
+    """
+    parser = argparse.ArgumentParser(description="Export Slack channel members and message history.")
+    parser.add_argument('--prefetch-users', action='store_true',
+                        help="Populate the user cache from users.list and saved memberEmails files before processing channels.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Fetch only messages newer than the last synced timestamp and merge them into the stored history.")
+    parser.add_argument('--rescan-thread-window', action='store_true',
+                        help="In --incremental mode, re-fetch the whole requestDateRange history instead of only checking "
+                             "known threads for new replies (also picks up new threads on older messages and reaction changes).")
+    parser.add_argument('--output-format', choices=sorted(writerLib.WRITERS), default='xlsx',
+                        help="File format of the history and reaction outputs.")
+    parser.add_argument('--history-store', default=None, metavar='DIR',
+                        help="Also keep the exported history and reactions in a Parquet dataset under DIR, "
+                             "partitioned by channel and month (see historyQuery.py).")
+    parser.add_argument('--stats-db', default=None, metavar='PATH',
+                        help="Maintain per-channel, per-user and per-stamp counts in the SQLite file at PATH while exporting "
+                             "and write them out as summary tables next to the run metrics.")
+    parser.add_argument('--channel-workers', type=int, default=1,
+                        help="Number of channel tasks (member lists and histories) processed concurrently.")
+    parser.add_argument('--thread-workers', type=int, default=1,
+                        help="Number of workers fetching thread replies concurrently.")
+    parser.add_argument('--history-shards', type=int, default=1,
+                        help="Split each channel history into time windows and fetch up to N windows concurrently.")
+    parser.add_argument('--connection-pool', type=int, default=0, metavar='N',
+                        help="Reuse up to N keep-alive HTTP connections for API calls and accept gzip responses "
+                             "(0 opens a new connection per request).")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="Run the export on an asyncio event loop with AsyncWebClient.")
+    parser.add_argument('--max-in-flight', type=int, default=16,
+                        help="Maximum number of concurrent API requests in --async mode.")
+    parser.add_argument('--api-base-url', default=None,
+                        help="Base URL of the Slack Web API (for example a local stand-in used by the benchmarks).")
+    parser.add_argument('--metrics-dir', default=None,
+                        help="Directory for the run metrics (metrics.json and slack_export.prom). Defaults to work/<date>.")
+    parser.add_argument('--work-queue', default=None, metavar='PATH',
+                        help="Share the channels of input.csv with other worker processes through the SQLite queue at PATH.")
+    parser.add_argument('--lease-seconds', type=float, default=600,
+                        help="Lease period of a claimed channel in --work-queue mode. Expired leases are reclaimed by other workers.")
+    parser.add_argument('--worker-id', default=None,
+                        help="Worker name recorded in the work queue (defaults to host:pid).")
+    response_mode = parser.add_mutually_exclusive_group()
+    response_mode.add_argument('--record-responses', action='store_true',
+                               help="Store every raw API response in work/responses.sqlite3.")
+    response_mode.add_argument('--replay-responses', action='store_true',
+                               help="Rebuild the outputs from work/responses.sqlite3 without calling the Slack API.")
+    return parser.parse_args(argv)
+
+
+def open_response_store(args):
+    """
+    --record-responses / --replay-responses が指定された場合にResponseStoreを開く。
+
+    :param args: コマンドライン引数の解析結果
+    :return: ResponseStoreインスタンス（どちらも指定されていない場合はNone）
+    """
+    if not (args.record_responses or args.replay_responses):
+        return None
+    return responseStore.ResponseStore(mainUtils.RESPONSE_STORE_PATH, replay=args.replay_responses)
+
+
+def open_work_queue(args, df):
+    """
+    --work-queue が指定された場合にWorkQueueを開き、input.csvのチャネルを登録する。
+
+    :param args: コマンドライン引数の解析結果
+    :param df: input.csvの内容
+    :return: WorkQueueインスタンス（指定されていない場合はNone）
+    """
+    if not args.work_queue:
+        return None
+    work_queue = workQueue.WorkQueue(args.work_queue, mainUtils.TODAY, lease_seconds=args.lease_seconds,
+                                     worker_id=args.worker_id)
+    work_queue.load(zip(df['id'], df['requestDateRange']))
+    work_queue.start_heartbeat()
+    return work_queue
+
+
+def prefetch_users(manager, user_cache):
+    """
+    チャネルの処理前にユーザーキャッシュを一括で準備する。
+    保存済みのメンバーリストからキャッシュを補完した後、users.listでワークスペース全体を取得する。
+
+    :param manager: SlackManagerインスタンス
+    :param user_cache: UserCacheインスタンス
+    """
+    seed_user_cache(manager.logger, user_cache)
+    manager.prefetch_user_directory()
+
+
+def seed_user_cache(lgr, user_cache):
+    """
+    保存済みのメンバーリストからユーザーキャッシュを補完する。
+
+    :param lgr: Loggerインスタンス
+    :param user_cache: UserCacheインスタンス
+    """
+    seeded = 0
+    for export_date, users in mainUtils.loadMemberEmailFiles():
+        seeded += user_cache.add_users(users, last_updated=export_date, persist=False)
+    lgr.view_log(f"Seeded {seeded} users from saved member lists.")
+
+
+def fetch_incremental_history(manager, channel_id, get_thread_date_length, rescan_window=False):
+    """
+    前回までに取得した最新のタイムスタンプ以降のメッセージのみを取得し、蓄積済みの履歴にマージする。
+    それより古いスレッド取得期間内のスレッドは親メッセージのみを取得して返信の変化を確認し、
+    前回から返信数・最終返信が変化したスレッドのみ返信を取得する。
+
+    :param manager: SlackManagerインスタンス
+    :param channel_id: チャネルID
+    :param get_thread_date_length: スレッドデータ取得の期間（日数）
+    :param rescan_window: Trueの場合はスレッド取得期間内の履歴を全て再取得する
+    :return: マージ後のメッセージ履歴のDataFrame
+    """
+    sync = prepare_incremental_fetch(manager, channel_id, get_thread_date_length, rescan_window)
+    new_df = manager.get_all_messages(channel_id, get_thread_date_length, oldest=sync['oldest'], thread_state=sync['thread_state'])
+    if sync['refresh_until'] is not None:
+        refreshed_df = manager.refresh_threads(channel_id, get_thread_date_length, sync['thread_state'], sync['refresh_until'])
+        new_df = append_refreshed_threads(new_df, refreshed_df)
+    return commit_incremental_fetch(manager, channel_id, sync, new_df)
+
+
+async def fetch_incremental_history_async(manager, channel_id, get_thread_date_length, rescan_window=False):
+    """
+    fetch_incremental_historyの非同期版。蓄積済みの履歴と状態の読み書きは別スレッドで行う。
+
+    :param manager: AsyncSlackManagerインスタンス
+    :param channel_id: チャネルID
+    :param get_thread_date_length: スレッドデータ取得の期間（日数）
+    :param rescan_window: Trueの場合はスレッド取得期間内の履歴を全て再取得する
+    :return: マージ後のメッセージ履歴のDataFrame
+    """
+    sync = await asyncio.to_thread(prepare_incremental_fetch, manager, channel_id, get_thread_date_length, rescan_window)
+    new_df = await manager.get_all_messages(channel_id, get_thread_date_length, oldest=sync['oldest'], thread_state=sync['thread_state'])
+    if sync['refresh_until'] is not None:
+        refreshed_df = await manager.refresh_threads(channel_id, get_thread_date_length, sync['thread_state'], sync['refresh_until'])
+        new_df = append_refreshed_threads(new_df, refreshed_df)
+    return await asyncio.to_thread(commit_incremental_fetch, manager, channel_id, sync, new_df)
+
+
+def append_refreshed_threads(new_df, refreshed_df):
+    """
+    新しく取得した履歴に、refresh_threadsで取得し直したスレッドの行を加える。
+
+    :param new_df: 新しく取得したメッセージ履歴のDataFrame
+    :param refreshed_df: refresh_threadsの戻り値
+    :return: DataFrame
+    """
+    if refreshed_df.empty:
+        return new_df
+    return pd.concat([new_df, refreshed_df], ignore_index=True)
+
+
+def prepare_incremental_fetch(manager, channel_id, get_thread_date_length, rescan_window=False):
+    """
+    差分取得に必要な状態を読み込み、conversations_historyに渡すoldestを決める。
+    履歴は前回までに取得した最新のタイムスタンプより新しいもののみを取得し、
+    それより古いスレッドはrefresh_threadsで返信の変化のみを確認する（refresh_untilにその境界を返す）。
+    rescan_windowがTrueの場合は、スレッド取得期間内の履歴を全て再取得する。
+    レスポンスを記録する場合は求めた範囲も記録し、再生する場合は記録した範囲を使う。
+
+    :param manager: SlackManagerインスタンス
+    :param channel_id: チャネルID
+    :param get_thread_date_length: スレッドデータ取得の期間（日数）
+    :param rescan_window: スレッド取得期間内の履歴を再取得する場合True
+    :return: state, stored_df, thread_state, oldest, refresh_untilをキーに持つ辞書
+    """
+    state = mainUtils.loadSyncState(channel_id)
+    stored_df = mainUtils.loadChannelStore(channel_id)
+    # 蓄積済みの履歴が無い場合はスキップしたスレッドの返信が欠落するため、スレッド状態を使わない
+    thread_state = mainUtils.loadThreadState(channel_id) if stored_df is not None else {}
+
+    oldest = refresh_until = None
+    response_store = manager.response_store
+    if response_store is not None and response_store.replay:
+        # 記録時の範囲を使う（前回の状態や現在時刻から求めると、記録したレスポンスのキーと一致しない）
+        recorded = response_store.get_fetch_range(channel_id)
+        if recorded is not None:
+            oldest, refresh_until = recorded['oldest'], recorded['refresh_until']
+    elif stored_df is not None and state.get('latest_ts'):
+        oldest = state['latest_ts']
+        if rescan_window:
+            thread_cutoff_ts = (datetime.now() - timedelta(days=get_thread_date_length)).timestamp()
+            oldest = f"{min(float(oldest), thread_cutoff_ts):.6f}"
+        else:
+            refresh_until = oldest
+    if response_store is not None and not response_store.replay:
+        response_store.put_fetch_range(channel_id, {'oldest': oldest, 'refresh_until': refresh_until})
+    if oldest is not None:
+        manager.logger.view_log(f"Fetching messages for channel {channel_id} newer than {oldest}.")
+
+    return {'state': state, 'stored_df': stored_df, 'thread_state': thread_state, 'oldest': oldest, 'refresh_until': refresh_until}
+
+
+def commit_incremental_fetch(manager, channel_id, sync, new_df):
+    """
+    新しく取得したメッセージを蓄積済みの履歴にマージし、履歴と差分取得の状態を保存する。
+
+    :param manager: SlackManagerインスタンス
+    :param channel_id: チャネルID
+    :param sync: prepare_incremental_fetchの戻り値
+    :param new_df: 新しく取得したメッセージ履歴のDataFrame
+    :return: マージ後のメッセージ履歴のDataFrame
+    """
+    lgr = manager.logger
+    state, thread_state = sync['state'], sync['thread_state']
+    merged_df = mainUtils.mergeHistory(sync['stored_df'], new_df)
+    mainUtils.saveChannelStore(channel_id, merged_df)
+    mainUtils.saveThreadState(channel_id, thread_state)
+
+    # 履歴の取得が途中で失敗した場合は、欠落分を次回取得できるよう状態を更新しない
+    if channel_id in manager.incomplete_channels:
+        lgr.view_log(f"History for channel {channel_id} is incomplete. Sync state is not advanced.")
+        return merged_df
+
+    top_level = merged_df['thread_ts'].isna() | (merged_df['thread_ts'] == merged_df['ts'])
+    if top_level.any():
+        state['latest_ts'] = max(merged_df.loc[top_level, 'ts'], key=float)
+        mainUtils.saveSyncState(channel_id, state)
+    return merged_df
+
+
+class HistoryPageWriters:
+    # 出力名（チェックポイントに書き込み位置を保存する際のキー）
+    HISTORY = 'history'
+    REACTIONS = 'reactions'
+    STORE = 'store'
+
+    def __init__(self, channel_id, output_format='xlsx', history_store=None, export_checkpoint=None):
+        """
+        HistoryPageWritersクラスの初期化メソッド。
+        チャネルの履歴とリアクションの出力ファイル、およびHistoryStoreのデータセットへページごとに書き込むライターをまとめる。
+        同期版と非同期版のエクスポートで共通に使い、非同期版ではwrite/close/abortを別スレッドから呼び出す。
+        export_checkpointを指定した場合は、ページを保存するたびに書き込み位置を確定し、
+        処理済みのページがあれば前回の実行の一時ファイルを引き継いで書き込みを再開する。
+        引き継ぐ一時ファイルが無い場合はFileNotFoundErrorを送出する。
+
+        :param channel_id: チャネルID
+        :param output_format: 出力形式（'xlsx', 'csv', 'parquet'）
+        :param history_store: HistoryStoreインスタンス（オプション）。指定した場合、データセットにも書き込む
+        :param export_checkpoint: ExportCheckpointインスタンス（オプション）
+        """
+        self.resumable = export_checkpoint is not None
+        resume = self.resumable and export_checkpoint.pages > 0
+
+        def resume_state(name):
+            if not resume:
+                return None
+            state = export_checkpoint.output_state(name)
+            if state is None:
+                raise FileNotFoundError(f"No saved position of the {name} output for channel {channel_id}.")
+            return state
+
+        self.writers = {}
+        try:
+            self.history_writer = self.writers[self.HISTORY] = mainUtils.openHistoryWriter(
+                channel_id, connector.MESSAGE_COLUMNS, output_format, self.resumable, resume_state(self.HISTORY))
+            self.reaction_writer = self.writers[self.REACTIONS] = mainUtils.openReactionsWriter(
+                channel_id, connector.REACTION_COLUMNS, output_format, self.resumable, resume_state(self.REACTIONS))
+            if history_store is not None:
+                self.writers[self.STORE] = history_store.open_channel(channel_id, self.resumable, resume_state(self.STORE))
+        except BaseException:
+            self.abort()
+            raise
+        if export_checkpoint is not None:
+            export_checkpoint.track_outputs(self.writers)
+
+    def write(self, message_batch, reaction_batch):
+        """
+        1ページ分の履歴とリアクションを書き込む。
+
+        :param message_batch: メッセージ履歴のDataFrame
+        :param reaction_batch: リアクションのDataFrame
+        """
+        self.history_writer.write(message_batch)
+        self.reaction_writer.write(reaction_batch)
+        if self.STORE in self.writers:
+            self.writers[self.STORE].write(message_batch, reaction_batch)
+
+    def close(self):
+        """
+        全ての書き込みを完了し、出力を確定する。途中で失敗した場合は残りの書き込みを中断する。
+        """
+        writers = list(self.writers.values())
+        for index, writer in enumerate(writers):
+            try:
+                writer.close()
+            except BaseException:
+                for remaining in writers[index + 1:]:
+                    self._abort_writer(remaining)
+                raise
+
+    def _abort_writer(self, writer):
+        if self.resumable:
+            writer.suspend()
+        else:
+            writer.discard()
+
+    def abort(self):
+        """
+        書き込みを中断する。チェックポイントを使う場合は次の実行で再開できるよう一時ファイルを残し、それ以外の場合は破棄する。
+        """
+        for writer in self.writers.values():
+            self._abort_writer(writer)
+
+    def discard(self):
+        """
+        全ての書き込みを破棄する。
+        """
+        for writer in self.writers.values():
+            writer.discard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+def open_history_writers(manager, channel_id, output_format, history_store, export_checkpoint):
+    """
+    チャネルの出力のHistoryPageWritersを作成する。
+    チェックポイントの処理済みのページを書き込んだ一時ファイルを引き継げない場合は、チェックポイントを破棄して最初のページから取得し直す。
+
+    :param manager: SlackManagerインスタンス
+    :param channel_id: チャネルID
+    :param output_format: 出力形式（'xlsx', 'csv', 'parquet'）
+    :param history_store: HistoryStoreインスタンス（またはNone）
+    :param export_checkpoint: ExportCheckpointインスタンス
+    :return: HistoryPageWritersインスタンス
+    """
+    try:
+        return HistoryPageWriters(channel_id, output_format, history_store, export_checkpoint)
+    except FileNotFoundError as e:
+        if not export_checkpoint.pages:
+            raise
+        manager.logger.view_log(f"Cannot resume the output for channel {channel_id} ({e}). Restarting from the first page.")
+    export_checkpoint.reset()
+    return HistoryPageWriters(channel_id, output_format, history_store, export_checkpoint)
+
+
+def save_history_page(manager, writers, message_batch, reaction_batch):
+    """
+    1ページ分の履歴とリアクションを書き込み、所要時間をsaveの段階として記録する。
+
+    :param manager: SlackManagerインスタンス
+    :param writers: HistoryPageWritersインスタンス
+    :param message_batch: メッセージ履歴のDataFrame
+    :param reaction_batch: リアクションのDataFrame
+    """
+    with manager.metrics.stage('save'):
+        writers.write(message_batch, reaction_batch)
+
+
+def finish_history_export(manager, channel_id, writers, export_checkpoint):
+    """
+    全てのページを書き込んだ後に、履歴が揃っていることを確認して出力を確定し、チェックポイントを削除する。
+    履歴が揃っていない場合は例外を送出し、書き込み途中の一時ファイルとチェックポイントを残す。
+
+    :param manager: SlackManagerインスタンス
+    :param channel_id: チャネルID
+    :param writers: HistoryPageWritersインスタンス
+    :param export_checkpoint: ExportCheckpointインスタンス
+    """
+    lgr = manager.logger
+    try:
+        check_history_complete(manager, channel_id)
+        manager.finish_channel_stats(channel_id)
+    except BaseException:
+        writers.abort()
+        raise
+
+    lgr.view_log(f"Saving message history and reactions for channel {channel_id}...")
+    with manager.metrics.stage('save'):
+        writers.close()
+    export_checkpoint.clear()
+    lgr.view_log(f"Message history ({writers.history_writer.rows_written} rows) and reactions ({writers.reaction_writer.rows_written} rows) for channel {channel_id} saved successfully.")
+
+
+def export_history(manager, channel_id, get_thread_date_length, output_format='xlsx', history_store=None):
+    """
+    チャネルのメッセージ履歴を1ページずつ取得し、履歴とリアクションをファイルへ逐次書き込む。
+
+    :param manager: SlackManagerインスタンス
+    :param channel_id: チャネルID
+    :param get_thread_date_length: スレッドデータ取得の期間（日数）
+    :param output_format: 出力形式（'xlsx', 'csv', 'parquet'）
+    :param history_store: HistoryStoreインスタンス（オプション）。指定した場合、履歴とリアクションをデータセットにも書き込む
+    """
+    run_metrics = manager.metrics
+    export_checkpoint = checkpoint.ExportCheckpoint(mainUtils.getCheckpointDir(channel_id))
+    writers = open_history_writers(manager, channel_id, output_format, history_store, export_checkpoint)
+    try:
+        message_batches = manager.iter_message_batches(channel_id, get_thread_date_length, checkpoint=export_checkpoint)
+        for message_batch in run_metrics.iter_stage('fetch', message_batches):
+            with run_metrics.stage('reaction_conversion'):
+                reaction_batch = manager.convert_messages_to_react_data(message_batch)
+            save_history_page(manager, writers, message_batch, reaction_batch)
+    except BaseException:
+        writers.abort()
+        raise
+    finish_history_export(manager, channel_id, writers, export_checkpoint)
+
+
+async def export_history_async(manager, channel_id, get_thread_date_length, output_format='xlsx', history_store=None):
+    """
+    export_historyの非同期版。ファイルへの書き込みはイベントループを止めないよう別スレッドで行う。
+
+    :param manager: AsyncSlackManagerインスタンス
+    :param channel_id: チャネルID
+    :param get_thread_date_length: スレッドデータ取得の期間（日数）
+    :param output_format: 出力形式（'xlsx', 'csv', 'parquet'）
+    :param history_store: HistoryStoreインスタンス（オプション）
+    """
+    run_metrics = manager.metrics
+    export_checkpoint = checkpoint.ExportCheckpoint(mainUtils.getCheckpointDir(channel_id))
+    writers = await asyncio.to_thread(open_history_writers, manager, channel_id, output_format, history_store, export_checkpoint)
+    try:
+        message_batches = manager.iter_message_batches(channel_id, get_thread_date_length, checkpoint=export_checkpoint)
+        async for message_batch in run_metrics.aiter_stage('fetch', message_batches):
+            with run_metrics.stage('reaction_conversion'):
+                reaction_batch = await manager.convert_reactions(message_batch)
+            await asyncio.to_thread(save_history_page, manager, writers, message_batch, reaction_batch)
+    except BaseException:
+        await asyncio.to_thread(writers.abort)
+        raise
+    await asyncio.to_thread(finish_history_export, manager, channel_id, writers, export_checkpoint)
+
+
+def open_stats_store(args):
+    """
+    --stats-db が指定された場合にStatsStoreを開く。
+
+    :param args: コマンドライン引数の解析結果
+    :return: StatsStoreインスタンス（指定されていない場合はNone）
+    """
+    if args.stats_db is None:
+        return None
+    return statsStore.StatsStore(args.stats_db)
+
+
+def open_history_store(args):
+    """
+    --history-store が指定された場合にHistoryStoreを作成する。
+
+    :param args: コマンドライン引数の解析結果
+    :return: HistoryStoreインスタンス（指定されていない場合はNone）
+    """
+    if args.history_store is None:
+        return None
+    return historyStore.HistoryStore(args.history_store)
+
+
+def check_history_complete(manager, channel_id):
+    """
+    チャネルの履歴を最後のページまで取得できたかを確認する。
+    途中のページで取得に失敗した場合は例外を送出し、出力ファイルを確定させずにチェックポイントを残す。
+    次回の実行では失敗したページから取得を再開する。
+
+    :param manager: SlackManagerインスタンス
+    :param channel_id: チャネルID
+    """
+    if channel_id in manager.incomplete_channels:
+        raise RuntimeError(f"Message history for channel {channel_id} is incomplete. Run again to resume from the checkpoint.")
+
+
+def save_incremental_history(manager, channel_id, message_list, reaction_list, output_format='xlsx', history_store=None):
+    """
+    差分取得でマージした履歴とリアクションを保存する。
+
+    :param manager: SlackManagerインスタンス
+    :param channel_id: チャネルID
+    :param message_list: マージ後のメッセージ履歴のDataFrame
+    :param reaction_list: リアクションのDataFrame
+    :param output_format: 出力形式（'xlsx', 'csv', 'parquet'）
+    :param history_store: HistoryStoreインスタンス（オプション）。指定した場合、データセットにも保存する
+    """
+    lgr = manager.logger
+    lgr.view_log(f"Saving message history and reactions for channel {channel_id}...")
+    with manager.metrics.stage('save'):
+        mainUtils.saveHistory(channel_id, message_list, output_format)
+        mainUtils.saveReactions(channel_id, reaction_list, output_format)
+        if history_store is not None:
+            history_store.save_channel(channel_id, message_list, reaction_list)
+    lgr.view_log(f"Message history and reactions for channel {channel_id} saved successfully.")
+
+
+def export_incremental_history(manager, channel_id, get_thread_date_length, output_format='xlsx', history_store=None,
+                               rescan_window=False):
+    """
+    差分取得したメッセージ履歴をマージし、履歴とリアクションを保存する。
+
+    :param manager: SlackManagerインスタンス
+    :param channel_id: チャネルID
+    :param get_thread_date_length: スレッドデータ取得の期間（日数）
+    :param output_format: 出力形式（'xlsx', 'csv', 'parquet'）
+    :param history_store: HistoryStoreインスタンス（オプション）。指定した場合、マージ後の履歴とリアクションをデータセットにも保存する
+    :param rescan_window: Trueの場合はスレッド取得期間内の履歴を全て再取得する
+    """
+    run_metrics = manager.metrics
+    with run_metrics.stage('fetch'):
+        message_list = fetch_incremental_history(manager, channel_id, get_thread_date_length, rescan_window)
+    manager.logger.view_log(f"Message list for channel {channel_id} retrieved successfully.")
+    with run_metrics.stage('reaction_conversion'):
+        reaction_list = manager.convert_messages_to_react_data(message_list)
+    save_incremental_history(manager, channel_id, message_list, reaction_list, output_format, history_store)
+
+
+async def export_incremental_history_async(manager, channel_id, get_thread_date_length, output_format='xlsx',
+                                           history_store=None, rescan_window=False):
+    """
+    export_incremental_historyの非同期版。ファイルへの書き込みは別スレッドで行う。
+
+    :param manager: AsyncSlackManagerインスタンス
+    :param channel_id: チャネルID
+    :param get_thread_date_length: スレッドデータ取得の期間（日数）
+    :param output_format: 出力形式（'xlsx', 'csv', 'parquet'）
+    :param history_store: HistoryStoreインスタンス（オプション）
+    :param rescan_window: Trueの場合はスレッド取得期間内の履歴を全て再取得する
+    """
+    run_metrics = manager.metrics
+    with run_metrics.stage('fetch'):
+        message_list = await fetch_incremental_history_async(manager, channel_id, get_thread_date_length, rescan_window)
+    manager.logger.view_log(f"Message list for channel {channel_id} retrieved successfully.")
+    with run_metrics.stage('reaction_conversion'):
+        reaction_list = await manager.convert_reactions(message_list)
+    await asyncio.to_thread(save_incremental_history, manager, channel_id, message_list, reaction_list, output_format, history_store)
+
+
+def member_list_exists(manager, channel_id):
+    """
+    チャネルのメンバーリストが保存済みかを確認する。保存済みの場合はスキップする旨をログに出力する。
+
+    :param manager: SlackManagerインスタンス
+    :param channel_id: チャネルID
+    :return: 保存済みの場合True
+    """
+    lgr = manager.logger
+    if mainUtils.checkMemberList(channel_id):
+        lgr.view_log(f"User list for channel {channel_id} already exists. Skipping user list retrieval.")
+        return True
+    lgr.view_log(f"Requesting user list for channel {channel_id}...")
+    return False
+
+
+def save_member_list(manager, channel_id, user_list):
+    """
+    チャネルのメンバーリストを保存する。
+
+    :param manager: SlackManagerインスタンス
+    :param channel_id: チャネルID
+    :param user_list: メンバーリストのDataFrame
+    """
+    with manager.metrics.stage('save'):
+        mainUtils.saveMemberList(channel_id, user_list)
+    manager.logger.view_log(f"User list for channel {channel_id} saved successfully.")
+
+
+def export_member_list(manager, channel_id):
+    """
+    チャネルのメンバーリストを取得して保存する。保存済みの場合はスキップする。
+
+    :param manager: SlackManagerインスタンス
+    :param channel_id: チャネルID
+    """
+    if member_list_exists(manager, channel_id):
+        return
+    with manager.metrics.stage('members'):
+        user_list = manager.get_all_user_info(channel_id)
+    save_member_list(manager, channel_id, user_list)
+
+
+async def export_member_list_async(manager, channel_id):
+    """
+    export_member_listの非同期版。
+
+    :param manager: AsyncSlackManagerインスタンス
+    :param channel_id: チャネルID
+    """
+    if member_list_exists(manager, channel_id):
+        return
+    with manager.metrics.stage('members'):
+        user_list = await manager.get_all_user_info(channel_id)
+    await asyncio.to_thread(save_member_list, manager, channel_id, user_list)
+
+
+def history_exists(manager, channel_id, output_format='xlsx'):
+    """
+    チャネルのメッセージ履歴が保存済みかを確認する。保存済みの場合はスキップする旨をログに出力する。
+
+    :param manager: SlackManagerインスタンス
+    :param channel_id: チャネルID
+    :param output_format: 出力形式（'xlsx', 'csv', 'parquet'）
+    :return: 保存済みの場合True
+    """
+    lgr = manager.logger
+    if mainUtils.checkIsHasHistory(channel_id, output_format):
+        lgr.view_log(f"Message history for channel {channel_id} already exists. Skipping message retrieval.")
+        return True
+    lgr.view_log(f"Requesting message list for channel {channel_id}...")
+    return False
+
+
+def export_channel_history(manager, channel_id, get_thread_date_length, args):
+    """
+    チャネルのメッセージ履歴とリアクションを取得して保存する。保存済みの場合はスキップする。
+
+    :param manager: SlackManagerインスタンス
+    :param channel_id: チャネルID
+    :param get_thread_date_length: スレッドデータ取得の期間（日数）
+    :param args: コマンドライン引数の解析結果
+    """
+    if history_exists(manager, channel_id, args.output_format):
+        return
+    history_store = open_history_store(args)
+    if args.incremental:
+        export_incremental_history(manager, channel_id, get_thread_date_length, args.output_format, history_store,
+                                   args.rescan_thread_window)
+    else:
+        export_history(manager, channel_id, get_thread_date_length, args.output_format, history_store)
+
+
+async def export_channel_history_async(manager, channel_id, get_thread_date_length, args):
+    """
+    export_channel_historyの非同期版。
+
+    :param manager: AsyncSlackManagerインスタンス
+    :param channel_id: チャネルID
+    :param get_thread_date_length: スレッドデータ取得の期間（日数）
+    :param args: コマンドライン引数の解析結果
+    """
+    if history_exists(manager, channel_id, args.output_format):
+        return
+    history_store = open_history_store(args)
+    if args.incremental:
+        await export_incremental_history_async(manager, channel_id, get_thread_date_length, args.output_format, history_store,
+                                               args.rescan_thread_window)
+    else:
+        await export_history_async(manager, channel_id, get_thread_date_length, args.output_format, history_store)
+
+
+def export_queued_channel(manager, task, args):
+    """
+    ワークキューから取得したチャネルのメンバーリストとメッセージ履歴を保存する。
+
+    :param manager: SlackManagerインスタンス
+    :param task: WorkQueue.claimが返した辞書
+    :param args: コマンドライン引数の解析結果
+    """
+    export_member_list(manager, task['channel_id'])
+    export_channel_history(manager, task['channel_id'], task['request_date_range'], args)
+
+
+async def export_queued_channel_async(manager, task, args):
+    """
+    export_queued_channelの非同期版。
+
+    :param manager: AsyncSlackManagerインスタンス
+    :param task: WorkQueue.claimが返した辞書
+    :param args: コマンドライン引数の解析結果
+    """
+    await export_member_list_async(manager, task['channel_id'])
+    await export_channel_history_async(manager, task['channel_id'], task['request_date_range'], args)
+
+
+def finish_queued_task(manager, work_queue, task, error=None, failures=None):
+    """
+    ワークキューのタスクを完了または失敗として記録する。
+    失敗した場合は、最大試行回数に達したタスクのみfailuresに加える（達していない場合はこのワーカーまたは他のワーカーが再試行する）。
+
+    :param manager: SlackManagerインスタンス
+    :param work_queue: WorkQueueインスタンス
+    :param task: WorkQueue.claimが返した辞書
+    :param error: 失敗した場合の例外
+    :param failures: 失敗したタスクの (タスク名, 例外) のリスト（オプション）
+    """
+    lgr = manager.logger
+    if error is not None:
+        name = f"channel:{task['channel_id']}"
+        lgr.view_log(f"Task {name} failed: {error}")
+        if failures is not None and task['attempts'] >= work_queue.max_attempts:
+            failures.append((name, error))
+    recorded = work_queue.complete(task) if error is None else work_queue.fail(task, error)
+    if not recorded:
+        lgr.view_log(f"Lease on channel {task['channel_id']} was taken over by another worker.")
+
+
+def next_queued_task(manager, work_queue):
+    """
+    ワークキューから次のタスクを取得する。
+    取得できるタスクが無くても他のワーカーがリースを持つタスクが残っている場合は、
+    そのワーカーが異常終了してリースが切れた時に引き継げるよう、リースが全て無くなるまで待機する。
+
+    :param manager: SlackManagerインスタンス
+    :param work_queue: WorkQueueインスタンス
+    :return: WorkQueue.claimが返した辞書（全てのタスクが終了した場合はNone）
+    """
+    while True:
+        task = work_queue.claim()
+        if task is not None:
+            if task['reclaimed_from']:
+                manager.logger.view_log(f"Reclaimed channel {task['channel_id']} from expired lease of {task['reclaimed_from']}.")
+            return task
+        if not work_queue.counts().get('leased'):
+            return None
+        time.sleep(min(30, work_queue.lease_seconds / 3))
+
+
+def consume_work_queue(manager, work_queue, args):
+    """
+    ワークキューが空になるまでチャネルを取得して処理する。--channel-workersの数だけ並行して処理する。
+
+    :param manager: SlackManagerインスタンス
+    :param work_queue: WorkQueueインスタンス
+    :param args: コマンドライン引数の解析結果
+    :return: 失敗したタスクの (タスク名, 例外) のリスト
+    """
+    failures = []
+
+    def worker():
+        while (task := next_queued_task(manager, work_queue)) is not None:
+            try:
+                export_queued_channel(manager, task, args)
+            except Exception as e:
+                finish_queued_task(manager, work_queue, task, e, failures)
+                continue
+            finish_queued_task(manager, work_queue, task)
+
+    with ThreadPoolExecutor(max_workers=args.channel_workers) as executor:
+        workers = [executor.submit(worker) for _ in range(args.channel_workers)]
+        for future in workers:
+            future.result()
+    return failures
+
+
+async def consume_work_queue_async(manager, work_queue, args):
+    """
+    consume_work_queueの非同期版。キューの操作はイベントループを止めないよう別スレッドで行う。
+
+    :param manager: AsyncSlackManagerインスタンス
+    :param work_queue: WorkQueueインスタンス
+    :param args: コマンドライン引数の解析結果
+    :return: 失敗したタスクの (タスク名, 例外) のリスト
+    """
+    failures = []
+
+    async def worker():
+        while (task := await asyncio.to_thread(next_queued_task, manager, work_queue)) is not None:
+            try:
+                await export_queued_channel_async(manager, task, args)
+            except Exception as e:
+                await asyncio.to_thread(finish_queued_task, manager, work_queue, task, e, failures)
+                continue
+            await asyncio.to_thread(finish_queued_task, manager, work_queue, task)
+
+    await asyncio.gather(*(worker() for _ in range(args.channel_workers)))
+    return failures
+
+
+async def export_all_async(args, df, user_cache, response_store=None, run_metrics=None, work_queue=None, stats_store=None):
+    """
+    全チャネルのエクスポートを1つのイベントループ上で非同期に実行する。
+    同時に処理するチャネルの処理数は--channel-workersで、同時に送信するリクエスト数は--max-in-flightで制限する。
+
+    :param args: コマンドライン引数の解析結果
+    :param df: input.csvの内容
+    :param user_cache: UserCacheインスタンス
+    :param response_store: ResponseStoreインスタンス（オプション）
+    :param run_metrics: Metricsインスタンス（オプション）
+    :param work_queue: WorkQueueインスタンス（オプション）。指定した場合はキューから取得したチャネルのみを処理する
+    :param stats_store: StatsStoreインスタンス（オプション）
+    :return: 失敗したタスクの (タスク名, 例外) のリスト
+    """
+    manager = asyncConnector.AsyncSlackManager(user_cache, max_in_flight=args.max_in_flight, response_store=response_store,
+                                               base_url=args.api_base_url, metrics_registry=run_metrics,
+                                               history_shards=args.history_shards, connection_pool_size=args.connection_pool,
+                                               stats_store=stats_store)
+    lgr = manager.logger
+
+    # 終了時に接続プールのセッションを閉じる
+    try:
+        # ユーザー情報の一括取得
+        if args.prefetch_users:
+            seed_user_cache(lgr, user_cache)
+            await manager.prefetch_user_directory()
+
+        if work_queue is not None:
+            return await consume_work_queue_async(manager, work_queue, args)
+
+        channel_slots = asyncio.Semaphore(args.channel_workers)
+
+        async def run_task(name, coroutine):
+            async with channel_slots:
+                try:
+                    await coroutine
+                except Exception as e:
+                    lgr.view_log(f"Task {name} failed: {e}")
+                    return name, e
+
+        tasks = []
+        for index, row in df.iterrows():
+            channel_id = row.id
+            tasks.append(run_task(f"members:{channel_id}", export_member_list_async(manager, channel_id)))
+            tasks.append(run_task(f"history:{channel_id}", export_channel_history_async(manager, channel_id, row.requestDateRange, args)))
+
+        results = await asyncio.gather(*tasks)
+        return [result for result in results if result is not None]
+    finally:
+        await manager.close()
+
+
+def main(argv=None):
+    args = parse_args(argv)
 
-def main():
     # ディレクトリのチェックと作成
     if not mainUtils.checkAndCreateDirs():
         print("Required files (input.csv or token.csv) are missing in the input directory. Exiting...")
@@ -21,50 +860,78 @@ def main():
         print("The input file is missing required columns (id, requestDateRange). Exiting...")
         sys.exit(1)  # プログラムを終了
 
-    # UserCacheインスタンスを作成
-    user_cache = cacheLib.UserCache(valid_days=100)
+    # UserCacheインスタンスを作成（ワークキューのモードでは他のプロセスと共有するため、書き込みを都度コミットする）
+    user_cache = cacheLib.UserCache(valid_days=100, commit_every=1 if args.work_queue else 100)
 
-    # SlackManagerインスタンスを作成
-    manager = connector.SlackManager(user_cache)
+    # APIの呼び出しと処理段階の集計
+    run_metrics = metrics.Metrics()
 
-    # Loggerインスタンスを作成
-    lgr = manager.logger
+    # ワークキューのモードでは、ワーカーごとに別のディレクトリへ集計結果を書き込む
+    work_queue = open_work_queue(args, df)
+    metrics_dir = args.metrics_dir
+    if work_queue is not None and metrics_dir is None:
+        metrics_dir = mainUtils.getWorkerMetricsDir(work_queue.worker_id)
 
-    # 各チャンネルの処理
-    for index, row in df.iterrows():
-        channel_id = row.id
-        get_thread_date_length = row.requestDateRange
+    # 終了時に集計結果と未コミットのキャッシュを書き込む
+    manager = None
+    response_store = None
+    stats_store = None
+    try:
+        # APIレスポンスの記録・再生用のストア
+        response_store = open_response_store(args)
+        # メッセージとリアクションの集計の保存先
+        stats_store = open_stats_store(args)
 
-        # チャネルのメンバーリストのチェックと取得
-        if mainUtils.checkMemberList(channel_id):
-            lgr.view_log(f"User list for channel {channel_id} already exists. Skipping user list retrieval.")
-        else:
-            lgr.view_log(f"Requesting user list for channel {channel_id}...")
-            user_list = manager.get_all_user_info(channel_id)
-            mainUtils.saveMemberList(channel_id, user_list)
-            lgr.view_log(f"User list for channel {channel_id} saved successfully.")
-
-        # チャネルのメッセージ履歴のチェックと取得
-        if mainUtils.checkIsHasHistory(channel_id):
-            lgr.view_log(f"Message history for channel {channel_id} already exists. Skipping message retrieval.")
+        # 非同期モードの場合はイベントループ上で全チャネルを処理
+        if args.use_async:
+            failures = asyncio.run(export_all_async(args, df, user_cache, response_store, run_metrics, work_queue, stats_store))
+            if failures:
+                print(f"{len(failures)} task(s) failed: {', '.join(name for name, _ in failures)}")
+                sys.exit(1)
+            return
+
+        # SlackManagerインスタンスを作成
+        manager = connector.SlackManager(user_cache, thread_workers=args.thread_workers, response_store=response_store,
+                                         base_url=args.api_base_url, metrics_registry=run_metrics,
+                                         history_shards=args.history_shards, connection_pool_size=args.connection_pool,
+                                         stats_store=stats_store)
+
+        # Loggerインスタンスを作成
+        lgr = manager.logger
+
+        # ユーザー情報の一括取得
+        if args.prefetch_users:
+            prefetch_users(manager, user_cache)
+
+        if work_queue is not None:
+            # ワークキューから取得したチャネルのみを処理
+            failures = consume_work_queue(manager, work_queue, args)
         else:
-            lgr.view_log(f"Requesting message list for channel {channel_id}...")
-            message_list = manager.get_all_messages(channel_id, get_thread_date_length)
-            lgr.view_log(f"Message list for channel {channel_id} retrieved successfully.")
-
-            # メッセージ履歴の保存
-            lgr.view_log(f"Saving message history for channel {channel_id}...")
-            mainUtils.saveHistory(channel_id, message_list)
-            lgr.view_log(f"Message history for channel {channel_id} saved successfully.")
-
-            # リアクションデータの変換と保存
-            lgr.view_log(f"Converting reactions for channel {channel_id}...")
-            reaction_list = manager.convert_messages_to_react_data(message_list)
-            lgr.view_log(f"Reactions converted for channel {channel_id}.")
-
-            lgr.view_log(f"Saving reactions for channel {channel_id}...")
-            mainUtils.saveReactions(channel_id, reaction_list)
-            lgr.view_log(f"Reactions for channel {channel_id} saved successfully.")
+            # 各チャンネルの処理をメンバーリストと履歴のタスクに分けてスケジューラーに登録
+            channel_scheduler = scheduler.ChannelScheduler(manager.token_pool, max_workers=args.channel_workers, logger=lgr)
+            for index, row in df.iterrows():
+                channel_id = row.id
+                get_thread_date_length = row.requestDateRange
+                channel_scheduler.submit('members', f"members:{channel_id}", export_member_list, manager, channel_id)
+                channel_scheduler.submit('history', f"history:{channel_id}", export_channel_history,
+                                         manager, channel_id, get_thread_date_length, args)
+
+            failures = channel_scheduler.run()
+        if failures:
+            lgr.view_log(f"{len(failures)} task(s) failed: {', '.join(name for name, _ in failures)}")
+            sys.exit(1)
+    finally:
+        mainUtils.saveMetrics(run_metrics, metrics_dir)
+        if stats_store is not None:
+            mainUtils.saveStats(stats_store, args.output_format, metrics_dir)
+            stats_store.close()
+        user_cache.close()
+        if manager is not None:
+            manager.close()
+        if response_store is not None:
+            response_store.close()
+        if work_queue is not None:
+            work_queue.close()
 
 if __name__ == "__main__":
     main()
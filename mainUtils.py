@@ -1,6 +1,10 @@
 import os
+import glob
+import json
+import re
 import pandas as pd
 from datetime import datetime
+import writerLib
 
 # グローバル変数の定義
 BASE_DIRS = {
@@ -10,6 +14,8 @@ BASE_DIRS = {
 }
 TODAY = datetime.now().strftime('%Y%m%d')
 TODAY_DIR = os.path.join(BASE_DIRS["work"], TODAY)
+SYNC_DIR = os.path.join(BASE_DIRS["work"], "sync")  # 差分取得用の状態と蓄積データの保存先
+RESPONSE_STORE_PATH = os.path.join(BASE_DIRS["work"], "responses.sqlite3")  # 記録したAPIレスポンスの保存先
 
 
 def checkAndCreateDirs():
@@ -26,9 +32,10 @@ def checkAndCreateDirs():
         if not os.path.exists(dir_path):
             os.makedirs(dir_path)
     
-    # workディレクトリ内に本日の日付のフォルダを作成
-    if not os.path.exists(TODAY_DIR):
-        os.makedirs(TODAY_DIR)
+    # workディレクトリ内に本日の日付のフォルダと差分取得用のフォルダを作成
+    for dir_path in [TODAY_DIR, SYNC_DIR]:
+        if not os.path.exists(dir_path):
+            os.makedirs(dir_path)
 
     # inputディレクトリ内にinput.csvとtoken.csvが存在するかをチェック
     input_files = ["input.csv", "token.csv"]
@@ -60,50 +67,84 @@ def checkMemberList(channel_id):
     return os.path.exists(os.path.join(TODAY_DIR, file_name))
 
 
-def checkIsHasReactions(channel_id):
+def checkIsHasReactions(channel_id, output_format='xlsx'):
     """
     引数にチャネルのIDを受取、workディレクトリ内に、
     ファイルがあるかを確認、結果をboolで返す。
 
     :param channel_id: チャネルID
+    :param output_format: 出力形式（'xlsx', 'csv', 'parquet'）
     :return: True if channelReactions file exists, else False
     """
-    file_name = f"{channel_id}_{TODAY}_channelReactions.xlsx"
+    file_name = f"{channel_id}_{TODAY}_channelReactions.{output_format}"
     return os.path.exists(os.path.join(TODAY_DIR, file_name))
 
 
-def checkIsHasHistory(channel_id):
+def checkIsHasHistory(channel_id, output_format='xlsx'):
     """
     引数にチャネルのIDを受取、workディレクトリ内に、
     ファイルがあるかを確認、結果をboolで返す。
 
     :param channel_id: チャネルID
+    :param output_format: 出力形式（'xlsx', 'csv', 'parquet'）
     :return: True if channelHistory file exists, else False
     """
-    file_name = f"{channel_id}_{TODAY}_channelHistory.xlsx"
+    file_name = f"{channel_id}_{TODAY}_channelHistory.{output_format}"
     return os.path.exists(os.path.join(TODAY_DIR, file_name))
 
 
-def saveHistory(channel_id, df):
+def saveHistory(channel_id, df, output_format='xlsx'):
     """
     所定のファイル名でhistoryデータを保存する。
 
     :param channel_id: チャネルID
     :param df: 保存するデータフレーム
+    :param output_format: 出力形式（'xlsx', 'csv', 'parquet'）
     """
-    file_name = f"{channel_id}_{TODAY}_channelHistory.xlsx"
-    df.to_excel(os.path.join(TODAY_DIR, file_name), index=False)
+    with openHistoryWriter(channel_id, df.columns, output_format) as writer:
+        writer.write(df)
 
 
-def saveReactions(channel_id, df):
+def saveReactions(channel_id, df, output_format='xlsx'):
     """
     所定のファイル名でリアクションデータを保存する。
 
     :param channel_id: チャネルID
     :param df: 保存するデータフレーム
+    :param output_format: 出力形式（'xlsx', 'csv', 'parquet'）
+    """
+    with openReactionsWriter(channel_id, df.columns, output_format) as writer:
+        writer.write(df)
+
+
+def openHistoryWriter(channel_id, columns, output_format='xlsx', resumable=False, resume_state=None):
+    """
+    所定のファイル名でhistoryデータを逐次書き込むライターを作成する。
+
+    :param channel_id: チャネルID
+    :param columns: 出力するカラムのリスト
+    :param output_format: 出力形式（'xlsx', 'csv', 'parquet'）
+    :param resumable: 中断後に書き込みを再開できるようにする場合True
+    :param resume_state: 前回の実行でcommitが返した状態（オプション）
+    :return: writerLib.StreamWriterインスタンス
     """
-    file_name = f"{channel_id}_{TODAY}_channelReactions.xlsx"
-    df.to_excel(os.path.join(TODAY_DIR, file_name), index=False)
+    base_name = f"{channel_id}_{TODAY}_channelHistory"
+    return writerLib.open_writer(os.path.join(TODAY_DIR, base_name), columns, output_format, resumable, resume_state)
+
+
+def openReactionsWriter(channel_id, columns, output_format='xlsx', resumable=False, resume_state=None):
+    """
+    所定のファイル名でリアクションデータを逐次書き込むライターを作成する。
+
+    :param channel_id: チャネルID
+    :param columns: 出力するカラムのリスト
+    :param output_format: 出力形式（'xlsx', 'csv', 'parquet'）
+    :param resumable: 中断後に書き込みを再開できるようにする場合True
+    :param resume_state: 前回の実行でcommitが返した状態（オプション）
+    :return: writerLib.StreamWriterインスタンス
+    """
+    base_name = f"{channel_id}_{TODAY}_channelReactions"
+    return writerLib.open_writer(os.path.join(TODAY_DIR, base_name), columns, output_format, resumable, resume_state)
 
 
 def saveMemberList(channel_id, df):
@@ -115,3 +156,183 @@ def saveMemberList(channel_id, df):
     """
     file_name = f"{channel_id}_{TODAY}_memberEmails.csv"
     df.to_csv(os.path.join(TODAY_DIR, file_name), index=False)
+
+
+def loadMemberEmailFiles():
+    """
+    workディレクトリ配下に保存済みの*_memberEmails.csvを全て読み込み、
+    ファイルごとのエクスポート日時とメンバーのメールアドレスを返す。
+    古いファイルから順に返すため、後から取得した情報で上書きできる。
+
+    :return: (export_date, [(member_id, email), ...]) のリスト
+    """
+    pattern = os.path.join(BASE_DIRS["work"], "*", "*_memberEmails.csv")
+    results = []
+    for file_path in glob.glob(pattern):
+        df = pd.read_csv(file_path, dtype=str).dropna(subset=['member_id', 'email'])
+        if df.empty:
+            continue
+        export_date = datetime.strptime(df['export_date'].iloc[0], '%Y-%m-%d')
+        results.append((export_date, list(zip(df['member_id'], df['email']))))
+
+    results.sort(key=lambda item: item[0])
+    return results
+
+
+def writeFileAtomically(path, write_func):
+    """
+    一時ファイルに書き込んでからリネームすることで、途中で中断しても壊れたファイルが残らないように保存する。
+
+    :param path: 保存先のパス
+    :param write_func: 一時ファイルのパスを受け取り、そこへ書き込む関数
+    """
+    tmp_path = f"{path}.tmp"
+    write_func(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def getCheckpointDir(channel_id):
+    """
+    チャネル履歴のエクスポートの途中経過を保存するディレクトリのパスを返す。
+
+    :param channel_id: チャネルID
+    :return: チェックポイントのディレクトリのパス
+    """
+    return os.path.join(TODAY_DIR, f"{channel_id}_checkpoint")
+
+
+def getWorkerMetricsDir(worker_id):
+    """
+    ワークキューのワーカーごとのメトリクスの保存先のパスを返す。複数のワーカーが同じファイルに書き込まないようにする。
+
+    :param worker_id: ワーカーの識別子
+    :return: メトリクスの保存先のディレクトリのパス
+    """
+    return os.path.join(TODAY_DIR, "metrics", re.sub(r'[^A-Za-z0-9_.-]', '_', worker_id))
+
+
+def saveMetrics(run_metrics, metrics_dir=None):
+    """
+    実行中に集計したメトリクスをJSONとPrometheusのテキスト形式で保存する。
+
+    :param run_metrics: Metricsインスタンス
+    :param metrics_dir: 保存先のディレクトリ（省略時はTODAY_DIR）
+    """
+    metrics_dir = metrics_dir or TODAY_DIR
+    os.makedirs(metrics_dir, exist_ok=True)
+    outputs = {'metrics.json': run_metrics.to_json(), 'slack_export.prom': run_metrics.to_prometheus()}
+    for file_name, text in outputs.items():
+        def write(tmp_path, text=text):
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                file.write(text)
+
+        writeFileAtomically(os.path.join(metrics_dir, file_name), write)
+
+
+def saveStats(stats_store, output_format='xlsx', stats_dir=None):
+    """
+    StatsStoreの集計表（チャネルごと、ユーザーごと、スタンプごと）を保存する。
+
+    :param stats_store: StatsStoreインスタンス
+    :param output_format: 出力形式（'xlsx', 'csv', 'parquet'）
+    :param stats_dir: 保存先のディレクトリ（省略時はTODAY_DIR）
+    """
+    stats_dir = stats_dir or TODAY_DIR
+    os.makedirs(stats_dir, exist_ok=True)
+    for name, df in stats_store.summaries().items():
+        with writerLib.open_writer(os.path.join(stats_dir, f"{TODAY}_{name}"), df.columns, output_format) as writer:
+            writer.write(df)
+
+
+def loadSyncState(channel_id):
+    """
+    チャネルの差分取得の状態（取得済みの最新タイムスタンプなど）を読み込む。
+
+    :param channel_id: チャネルID
+    :return: 状態の辞書（未取得の場合は空の辞書）
+    """
+    path = os.path.join(SYNC_DIR, f"{channel_id}_state.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def saveSyncState(channel_id, state):
+    """
+    チャネルの差分取得の状態を保存する。
+
+    :param channel_id: チャネルID
+    :param state: 状態の辞書
+    """
+    def write(tmp_path):
+        with open(tmp_path, 'w') as file:
+            json.dump(state, file)
+
+    writeFileAtomically(os.path.join(SYNC_DIR, f"{channel_id}_state.json"), write)
+
+
+def loadThreadState(channel_id):
+    """
+    チャネルのスレッド状態（thread_ts -> reply_count, latest_reply）を読み込む。
+
+    :param channel_id: チャネルID
+    :return: スレッド状態の辞書（未取得の場合は空の辞書）
+    """
+    path = os.path.join(SYNC_DIR, f"{channel_id}_threads.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def saveThreadState(channel_id, thread_state):
+    """
+    チャネルのスレッド状態を保存する。
+
+    :param channel_id: チャネルID
+    :param thread_state: スレッド状態の辞書
+    """
+    def write(tmp_path):
+        with open(tmp_path, 'w') as file:
+            json.dump(thread_state, file)
+
+    writeFileAtomically(os.path.join(SYNC_DIR, f"{channel_id}_threads.json"), write)
+
+
+def loadChannelStore(channel_id):
+    """
+    差分取得で蓄積したチャネルのメッセージ履歴を読み込む。
+
+    :param channel_id: チャネルID
+    :return: pandas DataFrame（未取得の場合はNone）
+    """
+    path = os.path.join(SYNC_DIR, f"{channel_id}_channelHistory.pkl")
+    if not os.path.exists(path):
+        return None
+    return pd.read_pickle(path)
+
+
+def saveChannelStore(channel_id, df):
+    """
+    差分取得で蓄積したチャネルのメッセージ履歴を保存する。
+
+    :param channel_id: チャネルID
+    :param df: 保存するデータフレーム
+    """
+    writeFileAtomically(os.path.join(SYNC_DIR, f"{channel_id}_channelHistory.pkl"), df.to_pickle)
+
+
+def mergeHistory(stored_df, new_df):
+    """
+    蓄積済みのメッセージ履歴に新しく取得したメッセージをマージする。
+    同じ(ts, thread_ts)のメッセージは新しく取得した方を残す。
+
+    :param stored_df: 蓄積済みのデータフレーム（Noneの場合はnew_dfをそのまま返す）
+    :param new_df: 新しく取得したデータフレーム
+    :return: マージ後のデータフレーム
+    """
+    if stored_df is None:
+        return new_df
+    merged = pd.concat([new_df, stored_df], ignore_index=True)
+    return merged.drop_duplicates(subset=['ts', 'thread_ts'], keep='first').reset_index(drop=True)
@@ -0,0 +1,244 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+    # リクエスト時間のヒストグラムのバケット上限（秒）
+    LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    # Prometheusのメトリクス名の接頭辞
+    PREFIX = 'slack_export'
+
+    def __init__(self):
+        """
+        Metricsクラスの初期化メソッド。
+        APIメソッドごとの呼び出し回数・リトライ回数・レート制限の回数・リクエスト時間のヒストグラム・
+        待機時間・受信バイト数と、処理段階ごとの所要時間を集計する。複数のワーカーから同時に記録できる。
+        """
+        self.started_at = time.time()
+        self.methods = {}  # メソッド名 -> 集計値の辞書
+        self.stages = {}  # 処理段階名 -> {'seconds', 'count'}
+        self._lock = threading.Lock()
+
+    def _method(self, method):
+        # 呼び出し元でロックを取得していること
+        if method not in self.methods:
+            self.methods[method] = {
+                'calls': 0, 'errors': 0, 'retries': 0, 'ratelimited': 0, 'failures': 0,
+                'network_seconds': 0.0, 'ratelimit_wait_seconds': 0.0, 'retry_sleep_seconds': 0.0,
+                'bytes_received': 0,
+                'latency_buckets': [0] * len(self.LATENCY_BUCKETS),
+            }
+        return self.methods[method]
+
+    @staticmethod
+    def response_size(response):
+        """
+        レスポンスの受信バイト数を返す。Content-Lengthヘッダーが無い場合はJSONに変換した長さで代用する。
+
+        :param response: SlackResponse、またはレスポンスの辞書
+        :return: バイト数
+        """
+        headers = getattr(response, 'headers', None) or {}
+        for key, value in headers.items():
+            if key.lower() == 'content-length':
+                try:
+                    return int(value[0] if isinstance(value, list) else value)
+                except (TypeError, ValueError):
+                    break
+        data = getattr(response, 'data', response)
+        if isinstance(data, (bytes, str)):
+            return len(data)
+        return len(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+
+    def record_request(self, method, seconds, response=None, error=None):
+        """
+        APIの1回の呼び出しを記録する。
+
+        :param method: APIメソッド名
+        :param seconds: 応答までの時間（秒）
+        :param response: 成功した場合のレスポンス
+        :param error: 失敗した場合のエラーコード（'ratelimited'など）または例外
+        """
+        size = self.response_size(response) if response is not None else 0
+        with self._lock:
+            values = self._method(method)
+            values['calls'] += 1
+            values['network_seconds'] += seconds
+            values['bytes_received'] += size
+            for index, upper in enumerate(self.LATENCY_BUCKETS):
+                if seconds <= upper:
+                    values['latency_buckets'][index] += 1
+                    break
+            if error is not None:
+                values['errors'] += 1
+                if 'ratelimited' in str(error):
+                    values['ratelimited'] += 1
+
+    def record_wait(self, method, seconds, reason):
+        """
+        リクエスト以外の待機時間を記録する。
+
+        :param method: APIメソッド名
+        :param seconds: 待機した秒数
+        :param reason: 'ratelimit'（レート制御の枠の待機）または 'retry'（リトライ前の待機）
+        """
+        if seconds <= 0:
+            return
+        with self._lock:
+            self._method(method)[f"{'ratelimit_wait' if reason == 'ratelimit' else 'retry_sleep'}_seconds"] += seconds
+
+    def record_retry(self, method):
+        """リトライを1回記録する。"""
+        with self._lock:
+            self._method(method)['retries'] += 1
+
+    def record_failure(self, method):
+        """全てのリトライに失敗した呼び出しを1回記録する。"""
+        with self._lock:
+            self._method(method)['failures'] += 1
+
+    def add_stage_time(self, stage, seconds):
+        """
+        処理段階の所要時間を加算する。
+
+        :param stage: 処理段階名（'fetch', 'email_resolution', 'reaction_conversion', 'save'など）
+        :param seconds: 所要時間（秒）
+        """
+        with self._lock:
+            values = self.stages.setdefault(stage, {'seconds': 0.0, 'count': 0})
+            values['seconds'] += seconds
+            values['count'] += 1
+
+    @contextmanager
+    def stage(self, stage):
+        """
+        withブロックの所要時間を処理段階の時間として記録するコンテキストマネージャー。
+
+        :param stage: 処理段階名
+        """
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage_time(stage, time.perf_counter() - started_at)
+
+    def iter_stage(self, stage, iterable):
+        """
+        イテラブルから次の要素を取り出すまでの時間を処理段階の時間として記録するジェネレーター。
+
+        :param stage: 処理段階名
+        :param iterable: 元のイテラブル
+        :return: 元の要素をそのまま返すジェネレーター
+        """
+        iterator = iter(iterable)
+        while True:
+            started_at = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_stage_time(stage, time.perf_counter() - started_at)
+                return
+            self.add_stage_time(stage, time.perf_counter() - started_at)
+            yield item
+
+    async def aiter_stage(self, stage, async_iterable):
+        """
+        iter_stageの非同期版（非同期ジェネレーター）。
+
+        :param stage: 処理段階名
+        :param async_iterable: 元の非同期イテラブル
+        :return: 元の要素をそのまま返す非同期ジェネレーター
+        """
+        iterator = async_iterable.__aiter__()
+        while True:
+            started_at = time.perf_counter()
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                self.add_stage_time(stage, time.perf_counter() - started_at)
+                return
+            self.add_stage_time(stage, time.perf_counter() - started_at)
+            yield item
+
+    def to_dict(self):
+        """
+        集計値を辞書として返す。
+
+        :return: 集計値の辞書
+        """
+        with self._lock:
+            methods = {}
+            for method, values in sorted(self.methods.items()):
+                values = dict(values)
+                buckets = values.pop('latency_buckets')
+                values['latency_histogram'] = {
+                    str(upper): count for upper, count in zip(self.LATENCY_BUCKETS, buckets)
+                }
+                values['latency_histogram']['+Inf'] = values['calls'] - sum(buckets)
+                methods[method] = values
+            return {
+                'started_at': self.started_at,
+                'elapsed_seconds': time.time() - self.started_at,
+                'methods': methods,
+                'stages': {stage: dict(values) for stage, values in sorted(self.stages.items())},
+            }
+
+    def to_json(self):
+        """
+        集計値をJSON文字列として返す。
+
+        :return: JSON文字列
+        """
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self):
+        """
+        集計値をPrometheusのテキスト形式（node_exporterのtextfile collector用）で返す。
+
+        :return: テキスト形式の文字列
+        """
+        summary = self.to_dict()
+        prefix = self.PREFIX
+        lines = []
+
+        def metric(name, metric_type, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {metric_type}")
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{label}"' for key, label in labels)
+                lines.append(f"{prefix}_{name}{{{label_text}}} {value}" if labels else f"{prefix}_{name} {value}")
+
+        methods = summary['methods']
+        counters = [
+            ('api_calls_total', 'calls', "API requests sent, including failed attempts."),
+            ('api_errors_total', 'errors', "API requests that returned an error."),
+            ('api_retries_total', 'retries', "API requests retried after a failed attempt."),
+            ('api_ratelimited_total', 'ratelimited', "API requests answered with ratelimited."),
+            ('api_failures_total', 'failures', "API calls that failed after all retries."),
+            ('api_network_seconds_total', 'network_seconds', "Time spent waiting for API responses."),
+            ('api_ratelimit_wait_seconds_total', 'ratelimit_wait_seconds', "Time spent waiting for the client-side rate limiter."),
+            ('api_retry_sleep_seconds_total', 'retry_sleep_seconds', "Time spent sleeping before retries."),
+            ('api_bytes_received_total', 'bytes_received', "Bytes received in API responses."),
+        ]
+        for name, key, help_text in counters:
+            metric(name, 'counter', help_text, [((('method', method),), values[key]) for method, values in methods.items()])
+
+        lines.append(f"# HELP {prefix}_api_request_duration_seconds API request latency.")
+        lines.append(f"# TYPE {prefix}_api_request_duration_seconds histogram")
+        for method, values in methods.items():
+            cumulative = 0
+            for upper, count in values['latency_histogram'].items():
+                cumulative += count
+                lines.append(f'{prefix}_api_request_duration_seconds_bucket{{method="{method}",le="{upper}"}} {cumulative}')
+            lines.append(f'{prefix}_api_request_duration_seconds_sum{{method="{method}"}} {values["network_seconds"]}')
+            lines.append(f'{prefix}_api_request_duration_seconds_count{{method="{method}"}} {values["calls"]}')
+
+        stages = summary['stages']
+        metric('stage_seconds_total', 'counter', "Time spent in each export stage (summed over workers).",
+               [((('stage', stage),), values['seconds']) for stage, values in stages.items()])
+        metric('stage_runs_total', 'counter', "Number of timed runs of each export stage.",
+               [((('stage', stage),), values['count']) for stage, values in stages.items()])
+        metric('run_elapsed_seconds', 'gauge', "Wall time of the run.", [((), summary['elapsed_seconds'])])
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,169 @@
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, burst: int):
+        """
+        トークンバケットの初期化メソッド。
+        トークンは1分あたりrate_per_minute個のペースで補充され、最大burst個まで貯められる。
+
+        :param rate_per_minute: 1分あたりの呼び出し可能回数
+        :param burst: 連続して呼び出せる最大回数
+        """
+        self.rate = rate_per_minute / 60
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0  # Retry-Afterにより呼び出しを停止する時刻（time.monotonic基準）
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        # 前回の更新からの経過時間に応じてトークンを補充（停止中の時間は補充の対象外）
+        elapsed = now - max(self.updated_at, self.blocked_until)
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = max(self.updated_at, now)
+
+    def _try_take(self):
+        # トークンを取得できた場合は0を、できなかった場合は次に取得を試みるまでの秒数を返す
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """
+        トークンを1つ取得する。取得できるまで待機する。
+
+        :return: 待機した秒数
+        """
+        waited = 0.0
+        while True:
+            wait = self._try_take()
+            if wait == 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    async def acquire_async(self):
+        """
+        acquireの非同期版。イベントループをブロックせずにトークンを取得できるまで待機する。
+
+        :return: 待機した秒数
+        """
+        waited = 0.0
+        while True:
+            wait = self._try_take()
+            if wait == 0:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def available_in(self):
+        """
+        次のトークンを取得できるまでの秒数を返す。トークンは消費しない。
+
+        :return: 待機が必要な秒数（すぐに取得できる場合は0）
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            return max(0.0, (1 - self.tokens) / self.rate)
+
+    def block_for(self, seconds: float):
+        """
+        指定秒数の間、トークンの払い出しを停止する。
+        停止明けに呼び出しが集中しないよう、貯まっているトークンは1回分だけ残して破棄する。
+
+        :param seconds: 停止する秒数
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.blocked_until = max(self.blocked_until, now + seconds)
+            self.tokens = min(self.tokens, 1.0)
+
+
+class RateLimiter:
+    # Slack APIのティアごとの既定値（1分あたりの呼び出し回数, バースト回数）
+    DEFAULT_TIERS = {
+        'history': (50, 5),      # conversations.history (Tier 3)
+        'replies': (50, 5),      # conversations.replies (Tier 3)
+        'users_info': (100, 10),  # users.info (Tier 4)
+        'members': (100, 10),    # conversations.members (Tier 4)
+        'users_list': (20, 2),   # users.list (Tier 2)
+    }
+
+    def __init__(self, tiers=None):
+        """
+        RateLimiterクラスの初期化メソッド。
+        Slack APIのティアごとにトークンバケットを1つずつ持つ。
+
+        :param tiers: ティア名 -> (1分あたりの呼び出し回数, バースト回数) の辞書（省略時はDEFAULT_TIERS）
+        """
+        self.buckets = {
+            tier: TokenBucket(rate_per_minute, burst)
+            for tier, (rate_per_minute, burst) in (tiers or self.DEFAULT_TIERS).items()
+        }
+
+    def acquire(self, tier: str):
+        """
+        指定されたティアの呼び出し枠を1つ取得する。取得できるまで待機する。
+
+        :param tier: ティア名
+        :return: 待機した秒数
+        """
+        return self.buckets[tier].acquire()
+
+    async def acquire_async(self, tier: str):
+        """
+        acquireの非同期版。
+
+        :param tier: ティア名
+        :return: 待機した秒数
+        """
+        return await self.buckets[tier].acquire_async()
+
+    def available_in(self, tier: str):
+        """
+        指定されたティアの呼び出し枠を取得できるまでの秒数を返す。
+
+        :param tier: ティア名
+        :return: 待機が必要な秒数（すぐに取得できる場合は0）
+        """
+        return self.buckets[tier].available_in()
+
+    def penalize(self, tier: str, retry_after: float):
+        """
+        レート制限に達した場合に、Retry-Afterで指定された秒数だけティアの呼び出しを停止する。
+
+        :param tier: ティア名
+        :param retry_after: Retry-Afterヘッダーの秒数
+        """
+        self.buckets[tier].block_for(retry_after)
+
+    @staticmethod
+    def parse_retry_after(headers, default: float = 60):
+        """
+        レスポンスヘッダーからRetry-Afterの秒数を取り出す。
+
+        :param headers: レスポンスヘッダーの辞書
+        :param default: ヘッダーが無い場合の秒数
+        :return: 待機秒数
+        """
+        for key, value in (headers or {}).items():
+            if key.lower() == 'retry-after':
+                try:
+                    return float(value[0] if isinstance(value, list) else value)
+                except (TypeError, ValueError):
+                    break
+        return default
@@ -0,0 +1,162 @@
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+
+class WatchedRequest:
+    __slots__ = ('request_id', 'method', 'timeout', 'started_at', 'deadline_at', 'next_progress_at', 'on_expire',
+                 'expired')
+
+    def __init__(self, request_id, method, timeout, started_at, progress_interval, on_expire=None):
+        """
+        監視中のリクエスト1件の状態。
+
+        :param request_id: リクエストの通し番号
+        :param method: APIメソッド名
+        :param timeout: 応答を待つ期限（秒、Noneの場合は期限なし）
+        :param started_at: 送信した時刻（time.monotonic基準）
+        :param progress_interval: 待機中の表示を行う間隔（秒）
+        :param on_expire: 期限を過ぎた時に監視スレッドから呼び出す関数（オプション）
+        """
+        self.request_id = request_id
+        self.method = method
+        self.timeout = timeout
+        self.started_at = started_at
+        self.deadline_at = started_at + timeout if timeout is not None else float('inf')
+        self.next_progress_at = started_at + progress_interval
+        self.on_expire = on_expire
+        self.expired = False
+
+    @property
+    def next_event_at(self):
+        """次に監視スレッドが処理すべき時刻"""
+        return self.next_progress_at if self.expired else min(self.next_progress_at, self.deadline_at)
+
+
+class RequestWatchdog:
+    def __init__(self, logger, progress_interval=10):
+        """
+        RequestWatchdogクラスの初期化メソッド。
+        1つの常駐スレッドで送信中の全てのリクエストを監視し、応答が遅いリクエストの待機表示と期限切れの検出を行う。
+        リクエストごとにタイマーのスレッドを作成しないため、呼び出し回数や同時実行数が多くてもスレッド数は増えない。
+
+        :param logger: 待機表示に使うLoggerインスタンス
+        :param progress_interval: 応答待ちのリクエストについて待機表示を行う間隔（秒）
+        """
+        self.logger = logger
+        self.progress_interval = progress_interval
+        self.requests = {}  # request_id -> WatchedRequest
+        self._ids = itertools.count(1)
+        self._condition = threading.Condition()
+        self._next_wakeup_at = float('inf')  # 監視スレッドが次に起きる予定の時刻
+        self._changed = False  # 監視スレッドの待機中に予定より早い時刻の監視対象が追加されたかどうか
+        self._stopped = False
+        self._thread = None
+
+    def _ensure_started(self):
+        # 呼び出し元でロックを取得していること
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='RequestWatchdog', daemon=True)
+            self._thread.start()
+
+    def track(self, method, timeout=None, on_expire=None):
+        """
+        リクエストを監視対象に追加する。
+
+        :param method: APIメソッド名
+        :param timeout: 応答を待つ期限（秒、Noneの場合は期限なし）
+        :param on_expire: 期限を過ぎた時に監視スレッドから呼び出す関数（オプション）
+        :return: WatchedRequestインスタンス
+        """
+        with self._condition:
+            request = WatchedRequest(next(self._ids), method, timeout, time.monotonic(), self.progress_interval,
+                                     on_expire=on_expire)
+            self.requests[request.request_id] = request
+            self._ensure_started()
+            # 監視スレッドが予定より早く起きる必要がある場合のみ通知する
+            if request.next_event_at < self._next_wakeup_at:
+                self._changed = True
+                self._condition.notify()
+            return request
+
+    def untrack(self, request):
+        """
+        リクエストを監視対象から外す。
+
+        :param request: trackが返したWatchedRequestインスタンス
+        :return: 期限を過ぎていた場合はTrue
+        """
+        with self._condition:
+            self.requests.pop(request.request_id, None)
+            return request.expired
+
+    @contextmanager
+    def watch(self, method, timeout=None, on_expire=None):
+        """
+        withブロックの間、リクエストを監視対象とするコンテキストマネージャー。
+
+        :param method: APIメソッド名
+        :param timeout: 応答を待つ期限（秒、Noneの場合は期限なし）
+        :param on_expire: 期限を過ぎた時に監視スレッドから呼び出す関数（オプション）
+        :return: WatchedRequestインスタンス
+        """
+        request = self.track(method, timeout=timeout, on_expire=on_expire)
+        try:
+            yield request
+        finally:
+            self.untrack(request)
+
+    @property
+    def in_flight(self):
+        """監視中のリクエスト数"""
+        with self._condition:
+            return len(self.requests)
+
+    def stop(self):
+        """
+        監視スレッドを停止する。
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _collect_due(self, now):
+        # 呼び出し元でロックを取得していること。待機表示と期限切れの対象を集め、次に起きる時刻を更新する
+        progressing, expiring = [], []
+        next_wakeup_at = float('inf')
+        for request in self.requests.values():
+            if not request.expired and request.deadline_at <= now:
+                request.expired = True
+                expiring.append(request)
+            if request.next_progress_at <= now:
+                progressing.append(request)
+                while request.next_progress_at <= now:
+                    request.next_progress_at += self.progress_interval
+            next_wakeup_at = min(next_wakeup_at, request.next_event_at)
+        self._next_wakeup_at = next_wakeup_at
+        return progressing, expiring
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._changed and not self._stopped:
+                    timeout = self._next_wakeup_at - time.monotonic() if self.requests else None
+                    self._condition.wait(timeout=None if timeout is None else max(0.0, timeout))
+                self._changed = False
+                if self._stopped:
+                    return
+                progressing, expiring = self._collect_due(time.monotonic())
+
+            # 表示とコールバックはロックの外で行い、監視対象の追加を妨げない
+            for _ in progressing:
+                self.logger.view_api_result_waiting()
+            for request in expiring:
+                self.logger.view_log(f"{request.method} has not responded within {request.timeout} seconds.")
+                if request.on_expire is not None:
+                    try:
+                        request.on_expire()
+                    except Exception as e:
+                        self.logger.view_log(f"Error in the deadline handler of {request.method}: {e!r}")
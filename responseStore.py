@@ -0,0 +1,111 @@
+import json
+import sqlite3
+import threading
+import zlib
+
+
+class ResponseStore:
+    def __init__(self, db_path: str, replay=False):
+        """
+        ResponseStoreクラスの初期化メソッド。
+        Slack APIの生のレスポンスを、メソッド名と引数をキーとしてSQLiteに圧縮して保存する。
+        replayがTrueの場合は保存済みのレスポンスのみを返し、APIへのリクエストは行わない。
+
+        :param db_path: 保存先のSQLiteファイルのパス
+        :param replay: 保存済みのレスポンスを再生するモードの場合True
+        """
+        self.db_path = db_path
+        self.replay = replay
+        self._lock = threading.Lock()  # 複数のワーカーから同じ接続を使うため排他制御する
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        # 作業ディレクトリを共有する他のホストのワーカーからも書き込まれるため、WALは使わない
+        self.connection.execute("PRAGMA journal_mode=DELETE")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "method TEXT NOT NULL, params TEXT NOT NULL, body BLOB NOT NULL, "
+            "PRIMARY KEY (method, params))"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS fetch_ranges (channel_id TEXT PRIMARY KEY, fetch_range TEXT NOT NULL)"
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def make_key(method: str, params: dict):
+        """
+        メソッド名と引数からレスポンスのキーを作成する。値がNoneの引数は送信されないため除外する。
+
+        :param method: APIメソッド名（例: 'conversations_history'）
+        :param params: APIに渡したキーワード引数
+        :return: (メソッド名, 引数のJSON文字列) のタプル
+        """
+        return method, json.dumps({key: value for key, value in params.items() if value is not None}, sort_keys=True)
+
+    def get(self, method: str, params: dict):
+        """
+        保存済みのレスポンスを取得する。
+
+        :param method: APIメソッド名
+        :param params: APIに渡したキーワード引数
+        :return: レスポンスの辞書（保存されていない場合はNone）
+        """
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT body FROM responses WHERE method = ? AND params = ?", self.make_key(method, params)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, method: str, params: dict, response):
+        """
+        レスポンスを保存する。同じキーのレスポンスが保存済みの場合は上書きする。
+
+        :param method: APIメソッド名
+        :param params: APIに渡したキーワード引数
+        :param response: SlackResponse、またはレスポンスの辞書
+        """
+        data = getattr(response, 'data', response)
+        body = zlib.compress(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (method, params, body) VALUES (?, ?, ?)",
+                (*self.make_key(method, params), body)
+            )
+            self.connection.commit()
+
+    def get_fetch_range(self, channel_id: str):
+        """
+        記録時に差分取得で求めた取得範囲を返す。
+
+        :param channel_id: チャネルID
+        :return: put_fetch_rangeで保存した辞書（保存されていない場合はNone）
+        """
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT fetch_range FROM fetch_ranges WHERE channel_id = ?", (channel_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def put_fetch_range(self, channel_id: str, fetch_range: dict):
+        """
+        差分取得で求めた取得範囲（前回の状態や現在時刻から求めたoldestなど）を保存する。
+        これらの値はリクエストの引数になるため、再生時は求め直さずに保存した値を使う。
+
+        :param channel_id: チャネルID
+        :param fetch_range: 取得範囲の辞書
+        """
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO fetch_ranges (channel_id, fetch_range) VALUES (?, ?)",
+                (channel_id, json.dumps(fetch_range))
+            )
+            self.connection.commit()
+
+    def close(self):
+        """
+        データベースの接続を閉じる。
+        """
+        with self._lock:
+            self.connection.close()
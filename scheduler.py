@@ -0,0 +1,82 @@
+import itertools
+import threading
+
+
+class ChannelScheduler:
+    def __init__(self, rate_limiter, max_workers: int = 1, logger=None):
+        """
+        ChannelSchedulerクラスの初期化メソッド。
+        チャネル単位の処理をタスクとして受け取り、最大max_workers個を並行して実行する。
+        タスクは主に使うSlack APIのティアを持ち、実行中のタスクが少なく、呼び出し枠がすぐに空くティアのタスクから順に実行する。
+        これにより、あるティアがレート制限で待っている間も他のティアの呼び出し枠を使い続けられる。
+        max_workersが1の場合も、ティアの呼び出し枠の空き具合が異なると、タスクは登録順とは異なる順序で実行される。
+
+        :param rate_limiter: SlackManagerと共有するRateLimiterまたはTokenPoolインスタンス（available_inとbucketsを参照する）
+        :param max_workers: 同時に実行するタスクの最大数
+        :param logger: Loggerインスタンス（タスクの失敗をログに出力する）
+        """
+        self.rate_limiter = rate_limiter
+        self.max_workers = max_workers
+        self.logger = logger
+        self.queues = {}  # ティア名 -> 待機中のタスクのリスト
+        self.running = {}  # ティア名 -> 実行中のタスク数
+        self.failures = []  # (タスク名, 例外) のリスト
+        self._sequence = itertools.count()  # 同条件のタスクは登録順に実行する
+        self._lock = threading.Lock()
+
+    def submit(self, tier: str, name: str, func, *args, **kwargs):
+        """
+        タスクを登録する。タスクはrunの呼び出し前に全て登録しておく。
+
+        :param tier: タスクが主に使うティア名
+        :param name: タスク名（ログ出力用）
+        :param func: 実行する関数
+        :param args: 関数に渡す引数
+        :param kwargs: 関数に渡すキーワード引数
+        """
+        with self._lock:
+            self.queues.setdefault(tier, []).append((next(self._sequence), name, func, args, kwargs))
+            self.running.setdefault(tier, 0)
+
+    def _next_task(self):
+        # 実行中のタスク数、呼び出し枠が空くまでの秒数、登録順の優先度でティアを選ぶ
+        candidates = [
+            (self.running[tier], self.rate_limiter.available_in(tier) if tier in self.rate_limiter.buckets else 0, queue[0][0], tier)
+            for tier, queue in self.queues.items() if queue
+        ]
+        if not candidates:
+            return None, None
+        tier = min(candidates)[3]
+        return tier, self.queues[tier].pop(0)
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                tier, task = self._next_task()
+                if task is None:
+                    return
+                self.running[tier] += 1
+
+            _, name, func, args, kwargs = task
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                self.failures.append((name, e))
+                if self.logger:
+                    self.logger.view_log(f"Task {name} failed: {e}")
+            finally:
+                with self._lock:
+                    self.running[tier] -= 1
+
+    def run(self):
+        """
+        登録された全てのタスクを実行し、完了まで待機する。
+
+        :return: 失敗したタスクの (タスク名, 例外) のリスト
+        """
+        workers = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.max_workers)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return self.failures
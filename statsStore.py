@@ -0,0 +1,345 @@
+import json
+import sqlite3
+import threading
+import uuid
+from collections import Counter, defaultdict
+import pandas as pd
+
+# SQLiteの1文のパラメーター数の上限を超えないよう、既存の行の問い合わせはこの件数ずつ行う
+QUERY_CHUNK = 500
+
+# 集計表の名前 -> カラム
+SUMMARY_COLUMNS = {
+    'channelStats': ['channel_id', 'messages', 'users', 'threads', 'thread_replies', 'reactions'],
+    'userStats': ['channel_id', 'user', 'messages', 'threads', 'thread_replies', 'reactions_given', 'reactions_received'],
+    'reactionStats': ['channel_id', 'stamp', 'reactions', 'users'],
+}
+
+
+class _StatsDelta:
+    def __init__(self):
+        """
+        メッセージの追加・変更・削除による集計値の増減をまとめる。
+        """
+        # (チャネルID, ユーザー) -> [メッセージ数, スレッドの返信数, したリアクション数, されたリアクション数]
+        self.users = defaultdict(lambda: [0, 0, 0, 0])
+        self.threads = Counter()  # (チャネルID, thread_ts, ユーザー) -> スレッド内のメッセージ数
+        self.reactions = Counter()  # (チャネルID, スタンプ, リアクションしたユーザー) -> リアクション数
+
+    def add(self, channel_id, ts, thread_ts, user, reactions, sign=1):
+        """
+        1メッセージ分の集計値を加える（signが-1の場合は差し引く）。
+
+        :param channel_id: チャネルID
+        :param ts: メッセージのタイムスタンプ
+        :param thread_ts: スレッドのタイムスタンプ（スレッドに属さない場合は空文字）
+        :param user: 投稿したユーザー（無い場合は空文字）
+        :param reactions: (スタンプ, リアクションしたユーザー) のリスト
+        :param sign: 1または-1
+        """
+        counts = self.users[(channel_id, user)]
+        counts[0] += sign
+        if thread_ts:
+            # スレッドの親メッセージも参加として数える
+            self.threads[(channel_id, thread_ts, user)] += sign
+            if thread_ts != ts:
+                counts[1] += sign
+        for stamp, reactor in reactions:
+            self.users[(channel_id, reactor)][2] += sign
+            counts[3] += sign
+            self.reactions[(channel_id, stamp, reactor)] += sign
+
+
+def _text(value):
+    # None、NaN（pandasの欠損値）は空文字にそろえる
+    if value is None or (isinstance(value, float) and value != value):
+        return ''
+    return str(value)
+
+
+class StatsStore:
+    def __init__(self, db_path: str, run_id=None):
+        """
+        StatsStoreクラスの初期化メソッド。
+        チャネルごと・ユーザーごとのメッセージ数、スレッドへの参加、スタンプごとのリアクション数を、
+        エクスポート中に流れるメッセージのページから集計してSQLiteに保存する。
+        メッセージごとの集計への寄与（投稿者、スレッド、リアクション）もキー(チャネルID, ts, thread_ts)で保存し、
+        同じメッセージを再び受け取った場合は前回の寄与との差分のみを集計値に反映する。
+        差分取得での再取得、チェックポイントからの再開、翌日以降の実行で同じメッセージが何度現れても二重に数えない。
+        複数のワーカープロセスから同じファイルを使ってよい。チャネルごとに最後にclaim_channelした実行のみが書き込むため、
+        リースの期限切れで同じチャネルを2つのワーカーが同時に処理した場合も、先のワーカーは後のワーカーの寄与を変更しない。
+
+        :param db_path: 保存先のSQLiteファイルのパス
+        :param run_id: 実行の識別子（省略時は新規に作成）。prune_channelでこの実行で受け取らなかったメッセージを判定する
+        """
+        self.db_path = db_path
+        self.run_id = run_id or uuid.uuid4().hex
+        self._lock = threading.Lock()  # 複数のワーカーから同じ接続を使うため排他制御する
+        # トランザクションは明示的に開始する（既存の寄与の読み込みから更新までを1つのトランザクションで行うため）
+        self.connection = sqlite3.connect(db_path, timeout=60, isolation_level=None, check_same_thread=False)
+        # 作業ディレクトリごと共有ストレージに置いて複数のホストから使われるため、WALではなくロールバックジャーナルを使う
+        self.connection.execute("PRAGMA journal_mode=DELETE")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS message_stats ("
+            "channel_id TEXT NOT NULL, ts TEXT NOT NULL, thread_ts TEXT NOT NULL, user TEXT NOT NULL, "
+            "reactions TEXT NOT NULL, run_id TEXT NOT NULL, "
+            "PRIMARY KEY (channel_id, ts, thread_ts))"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS user_stats ("
+            "channel_id TEXT NOT NULL, user TEXT NOT NULL, messages INTEGER NOT NULL, thread_replies INTEGER NOT NULL, "
+            "reactions_given INTEGER NOT NULL, reactions_received INTEGER NOT NULL, "
+            "PRIMARY KEY (channel_id, user))"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS thread_stats ("
+            "channel_id TEXT NOT NULL, thread_ts TEXT NOT NULL, user TEXT NOT NULL, messages INTEGER NOT NULL, "
+            "PRIMARY KEY (channel_id, thread_ts, user))"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS reaction_stats ("
+            "channel_id TEXT NOT NULL, stamp TEXT NOT NULL, user TEXT NOT NULL, reactions INTEGER NOT NULL, "
+            "PRIMARY KEY (channel_id, stamp, user))"
+        )
+        self.connection.execute("CREATE TABLE IF NOT EXISTS channel_owners (channel_id TEXT PRIMARY KEY, run_id TEXT NOT NULL)")
+
+    def _transaction(self, func, *args):
+        # 書き込みロックを先に取得し、他のワーカーと同じメッセージの寄与を同時に更新しないようにする
+        with self._lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(*args)
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+        return result
+
+    def _owns(self, channel_id):
+        # チャネルを集計している実行がこの実行かどうか（まだ誰も集計していないチャネルはこの実行が引き受ける）
+        row = self.connection.execute("SELECT run_id FROM channel_owners WHERE channel_id = ?", (channel_id,)).fetchone()
+        if row is None:
+            self._claim_channel(channel_id)
+            return True
+        return row[0] == self.run_id
+
+    def _claim_channel(self, channel_id):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO channel_owners (channel_id, run_id) VALUES (?, ?)", (channel_id, self.run_id)
+        )
+
+    def claim_channel(self, channel_id: str):
+        """
+        チャネルの取得を始める際に呼び出し、以降のチャネルの集計をこの実行が行うものとする。
+        前の実行（リースの期限が切れた後も処理を続けているワーカーを含む）のrecordとprune_channelは以降何もしない。
+
+        :param channel_id: チャネルID
+        """
+        self._transaction(self._claim_channel, channel_id)
+
+    def record(self, channel_id: str, messages):
+        """
+        メッセージの寄与を保存し、前回までの寄与との差分を集計値に反映する。
+        チャネルを別の実行がclaim_channelしている場合は何もしない。
+
+        :param channel_id: チャネルID
+        :param messages: (ts, thread_ts, user, (スタンプ, リアクションしたユーザー) のリスト) のイテラブル
+        :return: 集計値が変化したメッセージの数
+        """
+        rows = {}
+        for ts, thread_ts, user, reactions in messages:
+            ts = _text(ts)
+            if not ts:
+                continue
+            rows[(ts, _text(thread_ts))] = (_text(user), json.dumps(sorted({(stamp, reactor) for stamp, reactor in reactions})))
+        if not rows:
+            return 0
+        return self._transaction(self._record, channel_id, rows)
+
+    def _record(self, channel_id, rows):
+        if not self._owns(channel_id):
+            return 0
+        stored = self._load_contributions(channel_id, sorted({ts for ts, _ in rows}))
+        delta = _StatsDelta()
+        changed = 0
+        for (ts, thread_ts), contribution in rows.items():
+            previous = stored.get((ts, thread_ts))
+            if previous == contribution:
+                continue
+            if previous is not None:
+                delta.add(channel_id, ts, thread_ts, previous[0], json.loads(previous[1]), -1)
+            delta.add(channel_id, ts, thread_ts, contribution[0], json.loads(contribution[1]))
+            changed += 1
+        # 変化の無いメッセージもこの実行で受け取ったことを記録する
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO message_stats (channel_id, ts, thread_ts, user, reactions, run_id) VALUES (?, ?, ?, ?, ?, ?)",
+            ((channel_id, ts, thread_ts, user, reactions, self.run_id) for (ts, thread_ts), (user, reactions) in rows.items())
+        )
+        self._apply(delta)
+        return changed
+
+    def _load_contributions(self, channel_id, timestamps):
+        stored = {}
+        for start in range(0, len(timestamps), QUERY_CHUNK):
+            chunk = timestamps[start:start + QUERY_CHUNK]
+            cursor = self.connection.execute(
+                f"SELECT ts, thread_ts, user, reactions FROM message_stats "
+                f"WHERE channel_id = ? AND ts IN ({', '.join('?' * len(chunk))})",
+                (channel_id, *chunk)
+            )
+            for ts, thread_ts, user, reactions in cursor:
+                stored[(ts, thread_ts)] = (user, reactions)
+        return stored
+
+    def _apply(self, delta):
+        users = [(*key, *counts) for key, counts in delta.users.items() if any(counts)]
+        threads = [(*key, count) for key, count in delta.threads.items() if count]
+        reactions = [(*key, count) for key, count in delta.reactions.items() if count]
+        self.connection.executemany(
+            "INSERT INTO user_stats (channel_id, user, messages, thread_replies, reactions_given, reactions_received) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (channel_id, user) DO UPDATE SET "
+            "messages = messages + excluded.messages, thread_replies = thread_replies + excluded.thread_replies, "
+            "reactions_given = reactions_given + excluded.reactions_given, "
+            "reactions_received = reactions_received + excluded.reactions_received",
+            users
+        )
+        self.connection.executemany(
+            "INSERT INTO thread_stats (channel_id, thread_ts, user, messages) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (channel_id, thread_ts, user) DO UPDATE SET messages = messages + excluded.messages",
+            threads
+        )
+        self.connection.executemany(
+            "INSERT INTO reaction_stats (channel_id, stamp, user, reactions) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (channel_id, stamp, user) DO UPDATE SET reactions = reactions + excluded.reactions",
+            reactions
+        )
+        # 寄与が無くなった行は削除する（変化した行のみを対象とする）
+        self.connection.executemany(
+            "DELETE FROM user_stats WHERE channel_id = ? AND user = ? AND messages = 0 AND thread_replies = 0 "
+            "AND reactions_given = 0 AND reactions_received = 0",
+            (row[:2] for row in users)
+        )
+        self.connection.executemany(
+            "DELETE FROM thread_stats WHERE channel_id = ? AND thread_ts = ? AND user = ? AND messages = 0",
+            (row[:3] for row in threads)
+        )
+        self.connection.executemany(
+            "DELETE FROM reaction_stats WHERE channel_id = ? AND stamp = ? AND user = ? AND reactions = 0",
+            (row[:3] for row in reactions)
+        )
+
+    def adopt_channel(self, channel_id: str, run_id: str):
+        """
+        別の実行（中断したエクスポート）で保存したチャネルのメッセージの寄与を、この実行で受け取ったものとして扱い、
+        チャネルをこの実行がclaim_channelする。集計値は変化しない。
+
+        :param channel_id: チャネルID
+        :param run_id: 引き継ぐ実行の識別子
+        :return: 引き継いだメッセージの数
+        """
+        return self._transaction(self._adopt_channel, channel_id, run_id)
+
+    def _adopt_channel(self, channel_id, run_id):
+        self._claim_channel(channel_id)
+        if run_id == self.run_id:
+            return 0
+        cursor = self.connection.execute(
+            "UPDATE message_stats SET run_id = ? WHERE channel_id = ? AND run_id = ?", (self.run_id, channel_id, run_id)
+        )
+        return cursor.rowcount
+
+    def prune_channel(self, channel_id: str):
+        """
+        チャネルの全履歴を取得し終えた後に呼び出し、この実行で受け取らなかったメッセージ（削除されたメッセージ、
+        スレッド取得期間から外れたスレッドの返信など）の寄与を集計値から除く。
+        差分取得では前回までに取得したメッセージを受け取り直さないため呼び出さない。そのため、差分取得の間に削除されたメッセージと、
+        前回までに取得したメッセージに後から付いたリアクションの変化は、次に全履歴を取得するまで集計値に反映されない。
+
+        :param channel_id: チャネルID
+        :return: 除いたメッセージの数（チャネルを別の実行がclaim_channelしている場合は何もせずNone）
+        """
+        return self._transaction(self._prune_channel, channel_id)
+
+    def _prune_channel(self, channel_id):
+        # 後から同じチャネルを引き受けた実行の寄与を除かないよう、チャネルを集計している実行のみが行う
+        if not self._owns(channel_id):
+            return None
+        stale = self.connection.execute(
+            "SELECT ts, thread_ts, user, reactions FROM message_stats WHERE channel_id = ? AND run_id != ?",
+            (channel_id, self.run_id)
+        ).fetchall()
+        if not stale:
+            return 0
+        delta = _StatsDelta()
+        for ts, thread_ts, user, reactions in stale:
+            delta.add(channel_id, ts, thread_ts, user, json.loads(reactions), -1)
+        self.connection.execute("DELETE FROM message_stats WHERE channel_id = ? AND run_id != ?", (channel_id, self.run_id))
+        self._apply(delta)
+        return len(stale)
+
+    def _query(self, sql, columns):
+        with self._lock:
+            rows = self.connection.execute(sql).fetchall()
+        return pd.DataFrame(rows, columns=columns)
+
+    def channel_summary(self):
+        """
+        チャネルごとの集計表を返す。
+
+        :return: DataFrame（カラム: channel_id, messages（メッセージ数）, users（投稿したユーザー数）, threads（スレッド数）,
+            thread_replies（スレッドの返信数）, reactions（リアクション数））
+        """
+        return self._query(
+            "SELECT u.channel_id, SUM(u.messages), SUM(u.messages > 0), COALESCE(t.threads, 0), "
+            "SUM(u.thread_replies), SUM(u.reactions_received) FROM user_stats u "
+            "LEFT JOIN (SELECT channel_id, COUNT(DISTINCT thread_ts) AS threads FROM thread_stats GROUP BY channel_id) t "
+            "ON t.channel_id = u.channel_id GROUP BY u.channel_id ORDER BY u.channel_id",
+            SUMMARY_COLUMNS['channelStats']
+        )
+
+    def user_summary(self):
+        """
+        チャネルとユーザーごとの集計表を返す。ユーザーIDの無いメッセージ（botの投稿など）のuserは空文字となる。
+
+        :return: DataFrame（カラム: channel_id, user, messages（メッセージ数）, threads（参加したスレッド数）,
+            thread_replies（スレッドの返信数）, reactions_given（したリアクション数）, reactions_received（されたリアクション数））
+        """
+        return self._query(
+            "SELECT u.channel_id, u.user, u.messages, COALESCE(t.threads, 0), u.thread_replies, "
+            "u.reactions_given, u.reactions_received FROM user_stats u "
+            "LEFT JOIN (SELECT channel_id, user, COUNT(*) AS threads FROM thread_stats GROUP BY channel_id, user) t "
+            "ON t.channel_id = u.channel_id AND t.user = u.user ORDER BY u.channel_id, u.user",
+            SUMMARY_COLUMNS['userStats']
+        )
+
+    def reaction_summary(self):
+        """
+        チャネルとスタンプごとの集計表を返す。
+
+        :return: DataFrame（カラム: channel_id, stamp, reactions（リアクション数）, users（リアクションしたユーザー数））
+        """
+        return self._query(
+            "SELECT channel_id, stamp, SUM(reactions), COUNT(*) FROM reaction_stats "
+            "GROUP BY channel_id, stamp ORDER BY channel_id, stamp",
+            SUMMARY_COLUMNS['reactionStats']
+        )
+
+    def summaries(self):
+        """
+        全ての集計表を返す。
+
+        :return: 集計表の名前（SUMMARY_COLUMNSのキー） -> DataFrame の辞書
+        """
+        return {
+            'channelStats': self.channel_summary(),
+            'userStats': self.user_summary(),
+            'reactionStats': self.reaction_summary(),
+        }
+
+    def close(self):
+        """
+        データベースの接続を閉じる。
+        """
+        with self._lock:
+            self.connection.close()
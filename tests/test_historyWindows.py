@@ -0,0 +1,130 @@
+"""
+historyWindows.HistoryWindowPlanの範囲の分割、取得結果の結合、範囲の端で重複したメッセージの除去のテスト。
+APIの代わりに、conversations.historyと同じく範囲の両端を含めて新しい順にページを返す関数を使う。
+
+使い方: python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import historyWindows  # noqa: E402
+
+
+def make_messages(timestamps):
+    return [{'ts': f"{ts}.000000"} for ts in sorted(timestamps, reverse=True)]
+
+
+def fake_history(timestamps, limit):
+    """
+    conversations.historyの代わりに範囲の引数を受け取ってレスポンスを返す関数を作成する。
+
+    :param timestamps: チャネルの全てのメッセージのタイムスタンプ（整数）
+    :param limit: 1ページのメッセージ数
+    :return: HistoryWindow.paramsの辞書を受け取り、レスポンスの辞書を返す関数
+    """
+    def fetch(params):
+        oldest = Decimal(params['oldest']) if 'oldest' in params else None
+        latest = Decimal(params['latest']) if 'latest' in params else None
+        matched = [ts for ts in sorted(timestamps, reverse=True)
+                   if (oldest is None or ts >= oldest) and (latest is None or ts <= latest)]
+        offset = int(params.get('cursor', 0))
+        page = matched[offset:offset + limit]
+        has_more = len(matched) > offset + limit
+        return {
+            'messages': make_messages(page),
+            'has_more': has_more,
+            'response_metadata': {'next_cursor': str(offset + limit) if has_more else ''},
+        }
+
+    return fetch
+
+
+def run_plan(plan, fetch):
+    # 取得を開始した範囲の結果を受け取る順に結合する（ワーカーでの同時取得の代わりに順に呼び出す）
+    results = {}
+    merged = []
+    while not plan.finished:
+        for window in plan.windows_to_start():
+            results[window] = fetch(window.params())
+        window = plan.next_window()
+        merged.extend(plan.merge(window, results.pop(window)))
+    return merged
+
+
+class SplitTest(unittest.TestCase):
+    def test_split_by_page_span(self):
+        plan = historyWindows.HistoryWindowPlan(4)
+        windows = plan.split(historyWindows.HistoryWindow(), make_messages(range(900, 1001)))
+        self.assertEqual(
+            [(window.oldest, window.latest) for window in windows],
+            [(800, 900), (700, 800), (600, 700), (None, 600)]
+        )
+
+    def test_split_stops_at_window_oldest(self):
+        plan = historyWindows.HistoryWindowPlan(4)
+        window = historyWindows.HistoryWindow(Decimal(750), None)
+        windows = plan.split(window, make_messages(range(900, 1001)))
+        self.assertEqual([(window.oldest, window.latest) for window in windows], [(800, 900), (750, 800)])
+
+    def test_split_with_single_shard_keeps_one_window(self):
+        plan = historyWindows.HistoryWindowPlan(1)
+        windows = plan.split(historyWindows.HistoryWindow(), make_messages(range(900, 1001)))
+        self.assertEqual([(window.oldest, window.latest) for window in windows], [(None, 900)])
+
+
+class MergeTest(unittest.TestCase):
+    def assert_same_as_cursor(self, timestamps, shards, limit, oldest=None, latest=None):
+        expected = [message['ts'] for message in make_messages(
+            ts for ts in timestamps if (oldest is None or ts > oldest) and (latest is None or ts < latest))]
+        plan = historyWindows.HistoryWindowPlan(shards, oldest, latest)
+        merged = [message['ts'] for message in run_plan(plan, fake_history(timestamps, limit))]
+        self.assertEqual(merged, expected)
+
+    def test_merge_returns_all_messages_newest_first(self):
+        self.assert_same_as_cursor(range(1, 1001), shards=4, limit=50)
+
+    def test_merge_drops_duplicates_at_window_edges(self):
+        # 分割した範囲の境界（ページの期間の長さの倍数）にメッセージがあり、両側の範囲で取得される
+        timestamps = list(range(100, 1001, 10))
+        plan = historyWindows.HistoryWindowPlan(3)
+        fetch = fake_history(timestamps, 11)
+        merged = [message['ts'] for message in run_plan(plan, fetch)]
+        self.assertEqual(len(merged), len(set(merged)))
+        self.assertEqual(merged, [message['ts'] for message in make_messages(timestamps)])
+
+    def test_merge_excludes_messages_outside_range(self):
+        self.assert_same_as_cursor(range(1, 501), shards=3, limit=20, oldest=Decimal(100), latest=Decimal(400))
+
+    def test_merge_with_uneven_density(self):
+        timestamps = list(range(1, 200)) + list(range(10000, 10005)) + list(range(50000, 50300))
+        self.assert_same_as_cursor(timestamps, shards=4, limit=30)
+
+    def test_empty_page_with_more_continues_with_cursor(self):
+        fetch = fake_history(range(1, 101), 10)
+        calls = []
+
+        def fetch_with_empty_first_page(params):
+            # 最初のページはメッセージが無く、続きのカーソルのみを返す
+            calls.append(params)
+            if len(calls) == 1:
+                return {'messages': [], 'has_more': True, 'response_metadata': {'next_cursor': '0'}}
+            return fetch(params)
+
+        plan = historyWindows.HistoryWindowPlan(2)
+        merged = [message['ts'] for message in run_plan(plan, fetch_with_empty_first_page)]
+        self.assertEqual(calls[1], {'inclusive': True, 'cursor': '0'})
+        self.assertEqual(merged, [message['ts'] for message in make_messages(range(1, 101))])
+
+    def test_empty_page_with_more_and_no_cursor_raises(self):
+        plan = historyWindows.HistoryWindowPlan(2)
+        window = plan.next_window()
+        with self.assertRaises(ValueError):
+            plan.merge(window, {'messages': [], 'has_more': True})
+
+
+if __name__ == '__main__':
+    unittest.main()
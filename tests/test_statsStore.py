@@ -0,0 +1,157 @@
+"""
+statsStore.StatsStoreのメッセージごとの寄与の差分による集計、受け取らなかったメッセージの除去、
+実行間の引き継ぎとチャネルを引き受けた実行による書き込みの制限のテスト。
+
+使い方: python -m unittest discover tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import statsStore  # noqa: E402
+
+CHANNEL = 'C1'
+
+
+class StatsStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, 'stats.sqlite3')
+        self.stores = []
+
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def open_store(self, run_id):
+        store = statsStore.StatsStore(self.db_path, run_id=run_id)
+        self.stores.append(store)
+        return store
+
+    @staticmethod
+    def users(store):
+        return {
+            row.user: (row.messages, row.threads, row.thread_replies, row.reactions_given, row.reactions_received)
+            for row in store.user_summary().itertuples()
+        }
+
+    @staticmethod
+    def channel(store):
+        rows = store.channel_summary()
+        return tuple(rows.iloc[0][1:]) if len(rows) else None
+
+
+class RecordTest(StatsStoreTestCase):
+    def test_counts_messages_threads_and_reactions(self):
+        store = self.open_store('run1')
+        changed = store.record(CHANNEL, [
+            ('1.0', '1.0', 'U1', [('smile', 'U2')]),
+            ('2.0', '1.0', 'U2', []),
+            ('3.0', None, 'U1', [('smile', 'U3'), ('tada', 'U2')]),
+        ])
+        self.assertEqual(changed, 3)
+        self.assertEqual(self.users(store), {
+            'U1': (2, 1, 0, 0, 3),
+            'U2': (1, 1, 1, 2, 0),
+            'U3': (0, 0, 0, 1, 0),
+        })
+        self.assertEqual(self.channel(store), (3, 2, 1, 1, 3))
+        reactions = {row.stamp: (row.reactions, row.users) for row in store.reaction_summary().itertuples()}
+        self.assertEqual(reactions, {'smile': (2, 2), 'tada': (1, 1)})
+
+    def test_same_message_is_not_counted_twice(self):
+        store = self.open_store('run1')
+        messages = [('1.0', '', 'U1', [('smile', 'U2')])]
+        store.record(CHANNEL, messages)
+        self.assertEqual(store.record(CHANNEL, messages), 0)
+        next_run = self.open_store('run2')
+        next_run.claim_channel(CHANNEL)
+        self.assertEqual(next_run.record(CHANNEL, messages), 0)
+        self.assertEqual(self.users(store), {'U1': (1, 0, 0, 0, 1), 'U2': (0, 0, 0, 1, 0)})
+
+    def test_changed_reactions_apply_only_the_difference(self):
+        store = self.open_store('run1')
+        store.record(CHANNEL, [('1.0', '', 'U1', [('smile', 'U2'), ('tada', 'U3')])])
+        self.assertEqual(store.record(CHANNEL, [('1.0', '', 'U1', [('smile', 'U2'), ('smile', 'U4')])]), 1)
+        self.assertEqual(self.users(store), {'U1': (1, 0, 0, 0, 2), 'U2': (0, 0, 0, 1, 0), 'U4': (0, 0, 0, 1, 0)})
+        reactions = {row.stamp: (row.reactions, row.users) for row in store.reaction_summary().itertuples()}
+        self.assertEqual(reactions, {'smile': (2, 2)})
+
+    def test_duplicate_reactions_are_counted_once(self):
+        store = self.open_store('run1')
+        store.record(CHANNEL, [('1.0', '', 'U1', [('smile', 'U2'), ('smile', 'U2')])])
+        self.assertEqual(self.users(store)['U1'], (1, 0, 0, 0, 1))
+
+    def test_messages_without_ts_are_ignored(self):
+        store = self.open_store('run1')
+        self.assertEqual(store.record(CHANNEL, [(None, '', 'U1', []), (float('nan'), '', 'U1', [])]), 0)
+        self.assertIsNone(self.channel(store))
+
+
+class PruneTest(StatsStoreTestCase):
+    def test_prune_removes_messages_not_received_in_this_run(self):
+        first = self.open_store('run1')
+        first.record(CHANNEL, [('1.0', '1.0', 'U1', []), ('2.0', '1.0', 'U2', [('smile', 'U1')]), ('3.0', '', 'U1', [])])
+
+        second = self.open_store('run2')
+        second.claim_channel(CHANNEL)
+        second.record(CHANNEL, [('1.0', '1.0', 'U1', []), ('3.0', '', 'U1', [])])
+        self.assertEqual(second.prune_channel(CHANNEL), 1)
+        self.assertEqual(self.users(second), {'U1': (2, 1, 0, 0, 0)})
+        self.assertEqual(second.prune_channel(CHANNEL), 0)
+
+    def test_adopted_messages_are_kept(self):
+        first = self.open_store('run1')
+        first.record(CHANNEL, [('1.0', '', 'U1', []), ('2.0', '', 'U2', [])])
+
+        resumed = self.open_store('run2')
+        self.assertEqual(resumed.adopt_channel(CHANNEL, 'run1'), 2)
+        resumed.record(CHANNEL, [('3.0', '', 'U1', [])])
+        self.assertEqual(resumed.prune_channel(CHANNEL), 0)
+        self.assertEqual(self.channel(resumed), (3, 2, 0, 0, 0))
+
+    def test_prune_only_affects_the_channel(self):
+        first = self.open_store('run1')
+        first.record(CHANNEL, [('1.0', '', 'U1', [])])
+        first.record('C2', [('1.0', '', 'U1', [])])
+
+        second = self.open_store('run2')
+        second.claim_channel(CHANNEL)
+        self.assertEqual(second.prune_channel(CHANNEL), 1)
+        self.assertEqual(list(second.channel_summary()['channel_id']), ['C2'])
+
+
+class ClaimTest(StatsStoreTestCase):
+    def test_taken_over_run_does_not_record_or_prune(self):
+        first = self.open_store('run1')
+        first.claim_channel(CHANNEL)
+        first.record(CHANNEL, [('1.0', '', 'U1', []), ('2.0', '', 'U2', [])])
+
+        # リースの期限切れで別のワーカーが同じチャネルを引き継ぎ、元のワーカーも処理を続ける
+        second = self.open_store('run2')
+        second.adopt_channel(CHANNEL, 'run1')
+        second.record(CHANNEL, [('3.0', '', 'U3', [])])
+
+        self.assertEqual(first.record(CHANNEL, [('4.0', '', 'U4', [])]), 0)
+        self.assertIsNone(first.prune_channel(CHANNEL))
+        self.assertEqual(self.channel(second), (3, 3, 0, 0, 0))
+
+        self.assertEqual(second.prune_channel(CHANNEL), 0)
+        self.assertEqual(set(self.users(second)), {'U1', 'U2', 'U3'})
+
+    def test_unclaimed_channel_is_claimed_by_first_record(self):
+        first = self.open_store('run1')
+        first.record(CHANNEL, [('1.0', '', 'U1', [])])
+        second = self.open_store('run2')
+        self.assertEqual(second.record(CHANNEL, [('2.0', '', 'U2', [])]), 0)
+        second.claim_channel(CHANNEL)
+        self.assertEqual(second.record(CHANNEL, [('2.0', '', 'U2', [])]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import itertools
+import threading
+
+import rateLimiter
+
+# トークンが失効・無効化されたことを示すSlack APIのエラーコード
+REVOKED_ERRORS = ('invalid_auth', 'not_authed', 'account_inactive', 'token_revoked', 'token_expired')
+
+
+class TokenSlot:
+    def __init__(self, index, token, client, rate_limiter):
+        """
+        1つのトークンに対応するAPIクライアントとレート制御の組。
+
+        :param index: token.csv内の順番（0始まり、ログ出力ではトークンの代わりに使う）
+        :param token: Slackのトークン
+        :param client: トークンを設定したAPIクライアント
+        :param rate_limiter: トークン専用のRateLimiterインスタンス
+        """
+        self.index = index
+        self.token = token
+        self.client = client
+        self.rate_limiter = rate_limiter
+        self.revoked = False
+
+    @property
+    def label(self):
+        """ログ出力用の名前（トークンそのものは出力しない）"""
+        return f"token #{self.index + 1}"
+
+
+class TokenPool:
+    def __init__(self, tokens, create_client, rate_limiter=None):
+        """
+        TokenPoolクラスの初期化メソッド。
+        トークンごとにAPIクライアントとRateLimiterを1つずつ持ち、リクエストごとに呼び出し枠がすぐに空くトークンを選ぶ。
+        Slackのレート制限はトークン（アプリ）単位のため、トークンの数だけ呼び出し枠が増える。
+        レート制限に達したトークンは停止中の枠が空くまで選ばれにくくなり、失効したトークンは以降使わない。
+
+        :param tokens: トークンのリスト（1つ以上）
+        :param create_client: トークンを受け取りAPIクライアントを返す関数
+        :param rate_limiter: 1つ目のトークンに使うRateLimiterインスタンス（省略時は既定のティア設定で作成）
+        """
+        self.slots = [
+            TokenSlot(index, token, create_client(token),
+                      rate_limiter if index == 0 and rate_limiter is not None else rateLimiter.RateLimiter())
+            for index, token in enumerate(tokens)
+        ]
+        self._round_robin = itertools.count()  # 呼び出し枠の空き具合が同じトークンは順番に使う
+        self._lock = threading.Lock()
+
+    @property
+    def active_slots(self):
+        """失効していないトークンのリスト"""
+        return [slot for slot in self.slots if not slot.revoked]
+
+    def select(self, tier: str):
+        """
+        指定されたティアの呼び出し枠が最も早く空くトークンを選ぶ。
+
+        :param tier: ティア名
+        :return: TokenSlotインスタンス（使えるトークンが無い場合はNone）
+        """
+        slots = self.active_slots
+        if not slots:
+            return None
+        with self._lock:
+            offset = next(self._round_robin)
+        # 待ち時間が同じ場合は呼び出しごとに先頭をずらして偏りを防ぐ
+        return min(
+            (slots[(offset + position) % len(slots)] for position in range(len(slots))),
+            key=lambda slot: slot.rate_limiter.available_in(tier)
+        )
+
+    def revoke(self, slot: TokenSlot):
+        """
+        トークンを失効したものとして以降の選択から外す。
+
+        :param slot: 失効したトークンのTokenSlot
+        :return: 今回初めて失効とした場合はTrue
+        """
+        with self._lock:
+            if slot.revoked:
+                return False
+            slot.revoked = True
+            return True
+
+    @staticmethod
+    def is_revoked_error(error):
+        """
+        エラーコードがトークンの失効を示すかどうかを返す。
+
+        :param error: Slack APIのエラーコード
+        :return: 失効を示す場合はTrue
+        """
+        return error in REVOKED_ERRORS
+
+    @property
+    def buckets(self):
+        """全トークンに共通するティア名（ChannelSchedulerがRateLimiterと同様に参照する）"""
+        return self.slots[0].rate_limiter.buckets
+
+    def available_in(self, tier: str):
+        """
+        いずれかのトークンでティアの呼び出し枠を取得できるまでの秒数を返す。
+
+        :param tier: ティア名
+        :return: 待機が必要な秒数（すぐに取得できる場合は0）
+        """
+        slots = self.active_slots or self.slots
+        return min(slot.rate_limiter.available_in(tier) for slot in slots)
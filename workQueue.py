@@ -0,0 +1,187 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+
+class WorkQueue:
+    def __init__(self, db_path: str, export_date: str, lease_seconds: float = 600, max_attempts: int = 3, worker_id=None):
+        """
+        WorkQueueクラスの初期化メソッド。
+        チャネルをタスクとしてSQLiteのファイルに保存し、複数のワーカープロセスで分担して処理する。
+        ワーカーは期限付きのリース（lease）を取得してからチャネルを処理し、処理中は常駐スレッドがリースを延長する。
+        ワーカーが異常終了した場合はリースが延長されなくなり、期限が切れたタスクは他のワーカーが取得し直す。
+        タスクはエクスポート日ごとに管理するため、同じファイルを毎日使い続けてもよい。
+
+        :param db_path: キューのSQLiteファイルのパス（複数のホストで使う場合は、POSIXのファイルロックを正しく実装した共有ストレージに置く）
+        :param export_date: エクスポート日（'YYYYmmdd'、work/<日付>と同じ値）
+        :param lease_seconds: リースの有効期間（秒）
+        :param max_attempts: タスクの最大試行回数（超えたタスクはfailedとして以降取得しない）
+        :param worker_id: ワーカーの識別子（省略時は ホスト名:プロセスID）
+        """
+        self.db_path = db_path
+        self.export_date = export_date
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()  # 複数のスレッドから同じ接続を使うため排他制御する
+        self._heartbeat_stop = threading.Event()
+        self._heartbeat = None
+        # トランザクションは明示的に開始する（取得処理でBEGIN IMMEDIATEを使うため）
+        self.connection = sqlite3.connect(db_path, timeout=60, isolation_level=None, check_same_thread=False)
+        # WALは共有メモリを使うため、ネットワーク越しの共有ストレージでは別のホストの更新を正しく扱えない。ロールバックジャーナルを使う
+        self.connection.execute("PRAGMA journal_mode=DELETE")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            "export_date TEXT NOT NULL, channel_id TEXT NOT NULL, request_date_range INTEGER NOT NULL, "
+            "status TEXT NOT NULL DEFAULT 'pending', owner TEXT, lease_expires_at REAL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, error TEXT, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (export_date, channel_id))"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks (export_date, status, lease_expires_at)")
+
+    def load(self, rows):
+        """
+        チャネルをタスクとして登録する。登録済みのチャネルは状態を変更しないため、全てのワーカーが同じ入力を登録してよい。
+
+        :param rows: (チャネルID, requestDateRange) のイテラブル
+        :return: 新しく登録したタスク数
+        """
+        now = time.time()
+        with self._lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                added = self.connection.executemany(
+                    "INSERT OR IGNORE INTO tasks (export_date, channel_id, request_date_range, updated_at) VALUES (?, ?, ?, ?)",
+                    ((self.export_date, channel_id, int(request_date_range), now) for channel_id, request_date_range in rows)
+                ).rowcount
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+        return added
+
+    def claim(self):
+        """
+        未処理のタスク、またはリースの期限が切れたタスクを1つ取得し、このワーカーのリースを設定する。
+
+        :return: channel_id, request_date_range, attemptsをキーに持つ辞書（取得できるタスクが無い場合はNone）
+        """
+        now = time.time()
+        with self._lock:
+            # 書き込みロックを先に取得し、同じタスクを複数のワーカーが取得しないようにする
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                # 最大試行回数に達したタスクのリースが切れた場合は失敗とする
+                self.connection.execute(
+                    "UPDATE tasks SET status = 'failed', owner = NULL, lease_expires_at = NULL, "
+                    "error = 'lease expired', updated_at = ? "
+                    "WHERE export_date = ? AND status = 'leased' AND lease_expires_at < ? AND attempts >= ?",
+                    (now, self.export_date, now, self.max_attempts)
+                )
+                row = self.connection.execute(
+                    "SELECT channel_id, request_date_range, attempts, status, owner FROM tasks "
+                    "WHERE export_date = ? AND attempts < ? "
+                    "AND (status = 'pending' OR (status = 'leased' AND lease_expires_at < ?)) "
+                    "ORDER BY status = 'leased', rowid LIMIT 1",
+                    (self.export_date, self.max_attempts, now)
+                ).fetchone()
+                if row is not None:
+                    self.connection.execute(
+                        "UPDATE tasks SET status = 'leased', owner = ?, lease_expires_at = ?, attempts = attempts + 1, "
+                        "updated_at = ? WHERE export_date = ? AND channel_id = ?",
+                        (self.worker_id, now + self.lease_seconds, now, self.export_date, row[0])
+                    )
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        channel_id, request_date_range, attempts, status, owner = row
+        return {
+            'channel_id': channel_id,
+            'request_date_range': request_date_range,
+            'attempts': attempts + 1,
+            'reclaimed_from': owner if status == 'leased' else None,  # 期限切れのリースを引き継いだ場合の元のワーカー
+        }
+
+    def renew(self):
+        """
+        このワーカーが保持している全てのリースを延長する。
+
+        :return: 延長したリースの数
+        """
+        now = time.time()
+        with self._lock:
+            return self.connection.execute(
+                "UPDATE tasks SET lease_expires_at = ?, updated_at = ? "
+                "WHERE export_date = ? AND status = 'leased' AND owner = ?",
+                (now + self.lease_seconds, now, self.export_date, self.worker_id)
+            ).rowcount
+
+    def complete(self, task):
+        """
+        タスクを完了にする。
+
+        :param task: claimが返した辞書
+        :return: 完了にできた場合はTrue（リースが他のワーカーに移っていた場合はFalse）
+        """
+        return self._finish(task, 'done', None)
+
+    def fail(self, task, error):
+        """
+        タスクの失敗を記録し、最大試行回数に達していなければ他のワーカーが取得できるよう未処理に戻す。
+
+        :param task: claimが返した辞書
+        :param error: 失敗の理由
+        :return: 記録できた場合はTrue（リースが他のワーカーに移っていた場合はFalse）
+        """
+        status = 'failed' if task['attempts'] >= self.max_attempts else 'pending'
+        return self._finish(task, status, str(error))
+
+    def _finish(self, task, status, error):
+        now = time.time()
+        with self._lock:
+            return self.connection.execute(
+                "UPDATE tasks SET status = ?, owner = NULL, lease_expires_at = NULL, error = ?, updated_at = ? "
+                "WHERE export_date = ? AND channel_id = ? AND status = 'leased' AND owner = ?",
+                (status, error, now, self.export_date, task['channel_id'], self.worker_id)
+            ).rowcount == 1
+
+    def counts(self):
+        """
+        エクスポート日のタスク数を状態ごとに返す。
+
+        :return: 状態 -> タスク数 の辞書
+        """
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT status, COUNT(*) FROM tasks WHERE export_date = ? GROUP BY status", (self.export_date,)
+            ).fetchall()
+        return dict(rows)
+
+    def start_heartbeat(self):
+        """
+        リースの有効期間の1/3ごとにリースを延長する常駐スレッドを開始する。
+        """
+        if self._heartbeat is not None:
+            return
+
+        def run():
+            while not self._heartbeat_stop.wait(self.lease_seconds / 3):
+                self.renew()
+
+        self._heartbeat = threading.Thread(target=run, name='WorkQueueHeartbeat', daemon=True)
+        self._heartbeat.start()
+
+    def close(self):
+        """
+        リースの延長を停止し、データベースの接続を閉じる。
+        """
+        self._heartbeat_stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        with self._lock:
+            self.connection.close()
@@ -0,0 +1,332 @@
+import csv
+import glob
+import os
+import pickle
+import shutil
+import pandas as pd
+from openpyxl import Workbook
+
+
+class StreamWriter:
+    # 出力ファイルの拡張子（サブクラスで定義）
+    extension = None
+
+    def __init__(self, path: str, columns, resumable=False, resume_state=None):
+        """
+        StreamWriterクラスの初期化メソッド。
+        DataFrameを受け取るたびに行を一時ファイルへ追記し、close時に本来のパスへリネームする。
+        途中で中断した場合は出力ファイルを残さない。
+        resumableがTrueの場合は、commitで確定した位置までの一時ファイルを中断後の実行で引き継いで書き込みを続けられる。
+
+        :param path: 出力先のパス
+        :param columns: 出力するカラムのリスト
+        :param resumable: 中断後に書き込みを再開できるようにする場合True
+        :param resume_state: 前回の実行でcommitが返した状態（オプション）。指定した場合はその位置から書き込みを再開する
+        """
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.parts_dir = f"{self.tmp_path}.parts"
+        self.columns = list(columns)
+        self.resumable = resumable or resume_state is not None
+        self.rows_written = resume_state['rows'] if resume_state is not None else 0
+
+    def _part_path(self, index):
+        return os.path.join(self.parts_dir, f"part-{index:06d}")
+
+    def _prepare_parts(self, resume_state):
+        # 確定した分割ファイルの数を返す。確定していない（前回のcommitより後に書き込んだ）ファイルは削除する
+        if resume_state is None:
+            shutil.rmtree(self.parts_dir, ignore_errors=True)
+            os.makedirs(self.parts_dir)
+            return 0
+        parts = resume_state['parts']
+        if not os.path.isdir(self.parts_dir) or any(not os.path.exists(self._part_path(index)) for index in range(parts)):
+            raise FileNotFoundError(f"Cannot resume writing {self.path}: committed parts are missing.")
+        for path in glob.glob(os.path.join(self.parts_dir, "part-*")):
+            if int(os.path.basename(path)[len("part-"):]) >= parts:
+                os.remove(path)
+        return parts
+
+    def write(self, df: pd.DataFrame):
+        """
+        DataFrameの行を追記する。
+
+        :param df: 追記するデータフレーム
+        """
+        if df.empty:
+            return
+        self._write_frame(self._to_output_values(df))
+        self.rows_written += len(df)
+
+    def _to_output_values(self, df):
+        # カラムを揃え、欠損値はNoneとして書き込む
+        values = df[self.columns].astype(object)
+        values = values.where(values.notna(), None)
+        # リアクションなどのリスト・辞書の値は文字列表現として書き込む
+        for column in self.columns:
+            if values[column].map(lambda value: isinstance(value, (list, dict))).any():
+                values[column] = values[column].map(lambda value: str(value) if isinstance(value, (list, dict)) else value)
+        return values
+
+    def _write_frame(self, values):
+        raise NotImplementedError
+
+    def _finalize(self):
+        raise NotImplementedError
+
+    def _commit(self):
+        raise NotImplementedError
+
+    def _suspend(self):
+        pass
+
+    def _discard(self):
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+
+    def commit(self):
+        """
+        これまでに書き込んだ行を確定し、中断後に書き込みを再開するための状態を返す。
+
+        :return: resume_stateに渡す状態の辞書（JSONに変換できる値のみ）
+        """
+        return {'rows': self.rows_written, **self._commit()}
+
+    def suspend(self):
+        """
+        書き込みを中断する。一時ファイルは残し、次の実行で最後にcommitした位置から再開できるようにする。
+        """
+        self._suspend()
+
+    def close(self):
+        """
+        書き込みを完了し、出力ファイルを確定する。
+        """
+        self._finalize()
+        os.replace(self.tmp_path, self.path)
+
+    def discard(self):
+        """
+        書き込みを中断し、一時ファイルを削除する。
+        """
+        self._discard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # 例外で中断した場合は不完全なファイルを残さない
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+        return False
+
+
+class XlsxStreamWriter(StreamWriter):
+    extension = 'xlsx'
+    # Excelの1シートあたりの最大行数（ヘッダー行を含む）
+    MAX_SHEET_ROWS = 1048576
+
+    def __init__(self, path: str, columns, resumable=False, resume_state=None):
+        """
+        openpyxlの書き込み専用モードでワークブックを作成する。
+        1シートの行数がExcelの上限に達した場合は、新しいシートを追加して書き込みを続ける。
+        xlsxは書き込み途中のファイルに追記できないため、resumableがTrueの場合はcommitまでの行を分割ファイルに保存し、
+        再開時はそれらの行からワークブックを作り直す。
+
+        :param path: 出力先のパス
+        :param columns: 出力するカラムのリスト
+        :param resumable: 中断後に書き込みを再開できるようにする場合True
+        :param resume_state: 前回の実行でcommitが返した状態（オプション）
+        """
+        super().__init__(path, columns, resumable, resume_state)
+        self.workbook = Workbook(write_only=True)
+        self.sheet = None
+        self.sheet_rows = 0
+        self._add_sheet()
+        self.pending = []  # 最後のcommitより後に書き込んだ行
+        self.parts = 0
+        if self.resumable:
+            self.parts = self._prepare_parts(resume_state)
+            for index in range(self.parts):
+                with open(self._part_path(index), 'rb') as file:
+                    self._append_rows(pickle.load(file))
+
+    def _add_sheet(self):
+        self.sheet = self.workbook.create_sheet(f"Sheet{len(self.workbook.worksheets) + 1}")
+        self.sheet.append(self.columns)
+        self.sheet_rows = 1
+
+    def _append_rows(self, rows):
+        for row in rows:
+            if self.sheet_rows >= self.MAX_SHEET_ROWS:
+                self._add_sheet()
+            self.sheet.append(row)
+            self.sheet_rows += 1
+
+    def _write_frame(self, values):
+        rows = list(values.itertuples(index=False, name=None))
+        self._append_rows(rows)
+        if self.resumable:
+            self.pending.extend(rows)
+
+    def _commit(self):
+        if self.pending:
+            with open(self._part_path(self.parts), 'wb') as file:
+                pickle.dump(self.pending, file, protocol=pickle.HIGHEST_PROTOCOL)
+            self.parts += 1
+            self.pending = []
+        return {'parts': self.parts}
+
+    def _finalize(self):
+        self.workbook.save(self.tmp_path)
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+
+
+class CsvStreamWriter(StreamWriter):
+    extension = 'csv'
+
+    def __init__(self, path: str, columns, resumable=False, resume_state=None):
+        """
+        CSVファイルを開き、ヘッダー行を書き込む。
+        resume_stateを指定した場合は、一時ファイルを最後にcommitした位置まで切り詰めて追記を続ける。
+
+        :param path: 出力先のパス
+        :param columns: 出力するカラムのリスト
+        :param resumable: 中断後に書き込みを再開できるようにする場合True
+        :param resume_state: 前回の実行でcommitが返した状態（オプション）
+        """
+        super().__init__(path, columns, resumable, resume_state)
+        if resume_state is None:
+            self.file = open(self.tmp_path, mode='w', newline='', encoding='utf-8')
+            csv.writer(self.file).writerow(self.columns)
+            return
+        if not os.path.exists(self.tmp_path):
+            raise FileNotFoundError(f"Cannot resume writing {self.path}: {self.tmp_path} is missing.")
+        self.file = open(self.tmp_path, mode='r+', newline='', encoding='utf-8')
+        self.file.truncate(resume_state['offset'])
+        self.file.seek(resume_state['offset'])
+
+    def _write_frame(self, values):
+        values.to_csv(self.file, header=False, index=False)
+
+    def _commit(self):
+        self.file.flush()
+        return {'offset': self.file.tell()}
+
+    def _finalize(self):
+        self.file.close()
+
+    def _suspend(self):
+        self.file.close()
+
+    def _discard(self):
+        self.file.close()
+        super()._discard()
+
+
+class ParquetStreamWriter(StreamWriter):
+    extension = 'parquet'
+
+    def __init__(self, path: str, columns, resumable=False, resume_state=None):
+        """
+        pyarrowのParquetWriterを開く。全てのカラムを文字列型として書き込む。
+        pyarrowがインストールされていない場合はImportErrorを送出する。
+        Parquetは閉じたファイルに追記できないため、resumableがTrueの場合はcommitごとに分割ファイルへ書き込み、
+        close時に1つのファイルにまとめる。
+
+        :param path: 出力先のパス
+        :param columns: 出力するカラムのリスト
+        :param resumable: 中断後に書き込みを再開できるようにする場合True
+        :param resume_state: 前回の実行でcommitが返した状態（オプション）
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet output requires pyarrow. Install it with 'pip install pyarrow'.") from e
+
+        super().__init__(path, columns, resumable, resume_state)
+        self.pa = pa
+        self.pq = pq
+        self.schema = pa.schema([(column, pa.string()) for column in self.columns])
+        self.parts = 0
+        if self.resumable:
+            # 分割ファイルは最初の書き込み時に開く
+            self.parts = self._prepare_parts(resume_state)
+            self.writer = None
+        else:
+            self.writer = self._open(self.tmp_path)
+
+    def _open(self, path):
+        return self.pq.ParquetWriter(path, self.schema, compression='snappy')
+
+    def _write_frame(self, values):
+        arrays = [
+            # 欠損値（None, NaN）は文字列の'nan'ではなくnullとして書き込む
+            self.pa.array([None if pd.api.types.is_scalar(value) and pd.isna(value) else str(value)
+                           for value in values[column]], type=self.pa.string())
+            for column in self.columns
+        ]
+        if self.writer is None:
+            self.writer = self._open(self._part_path(self.parts))
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def _close_part(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def _commit(self):
+        if self.writer is not None:
+            self._close_part()
+            self.parts += 1
+        return {'parts': self.parts}
+
+    def _finalize(self):
+        if not self.resumable:
+            self.writer.close()
+            return
+        # 最後のcommitより後に書き込んだ分割ファイルも含めてまとめる
+        self._commit()
+        writer = self._open(self.tmp_path)
+        try:
+            for index in range(self.parts):
+                writer.write_table(self.pq.read_table(self._part_path(index), schema=self.schema))
+        finally:
+            writer.close()
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+
+    def _suspend(self):
+        self._close_part()
+
+    def _discard(self):
+        self._close_part()
+        super()._discard()
+
+
+# 出力形式名 -> ライタークラス
+WRITERS = {
+    XlsxStreamWriter.extension: XlsxStreamWriter,
+    CsvStreamWriter.extension: CsvStreamWriter,
+    ParquetStreamWriter.extension: ParquetStreamWriter,
+}
+
+
+def open_writer(base_path: str, columns, output_format: str = 'xlsx', resumable=False, resume_state=None):
+    """
+    出力形式に応じたライターを作成する。出力ファイルのパスはbase_pathに形式の拡張子を付けたものとなる。
+
+    :param base_path: 拡張子を除いた出力先のパス
+    :param columns: 出力するカラムのリスト
+    :param output_format: 出力形式（'xlsx', 'csv', 'parquet'）
+    :param resumable: 中断後に書き込みを再開できるようにする場合True
+    :param resume_state: 前回の実行でcommitが返した状態（オプション）
+    :return: StreamWriterインスタンス
+    """
+    if output_format not in WRITERS:
+        raise ValueError(f"Unsupported output format: {output_format}")
+    writer_class = WRITERS[output_format]
+    return writer_class(f"{base_path}.{writer_class.extension}", columns, resumable, resume_state)